@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "backend.core"
+
+    def ready(self):
+        # Connect the cache invalidation receivers
+        from backend.core import signals  # noqa: F401
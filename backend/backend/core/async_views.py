@@ -0,0 +1,176 @@
+from django.contrib.auth.models import AnonymousUser
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from backend.core.authentication import get_token_user
+from backend.core.listing_cache import cache_anonymous_browse
+from backend.core.models import Listing, Review
+from backend.core.pagination import InvalidCursor, KeysetPaginator
+from backend.core.renderers import FastJsonResponse
+from backend.core.serializers import (
+    ListingSerializer,
+    OfferQuerySerializer,
+    OfferSerializer,
+    ReviewSerializer,
+)
+from backend.core.views import ListingController, OfferController
+
+# DRF views are sync only, so these are plain Django views that go through
+# the async ORM. Under ASGI a request waiting on the database doesn't hold a
+# worker, so one process serves many concurrent requests. Everything they
+# serialize has to be loaded up front, a lazy query raises
+# SynchronousOnlyOperation in async code.
+
+
+async def authenticate(request):
+    """
+    The user of the request's JWT, AnonymousUser without one, raises
+    AuthenticationFailed for an invalid token like JWTAuthentication
+
+    Built from the token like ClaimsJWTAuthentication, so it makes no query,
+    anything beyond its claims has to be loaded explicitly in async code
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return AnonymousUser()
+    return get_token_user(authentication.get_validated_token(raw_token))
+
+
+class AsyncController(View):
+    """
+    Signs in the user of the request's JWT before dispatching
+    """
+
+    # Turns away anonymous requests with a 401
+    login_required = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await authenticate(request)
+        except AuthenticationFailed as e:
+            return FastJsonResponse({"detail": str(e.detail)}, status=401)
+
+        if self.login_required and not request.user.is_authenticated:
+            return FastJsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=401,
+            )
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncListingController(AsyncController):
+    """
+    Async listing endpoint, [GET]
+
+    For the GET request, it is the same as the GET of the listing endpoint,
+    with the same parameters and responses
+    """
+
+    @cache_anonymous_browse
+    async def get(self, request):
+        # The DRF request gives the shared filtering its query_params
+        request = Request(request)
+        context = {"request": request}
+        queryset = ListingController.queryset
+        listing_id = request.query_params.get("id", None)
+
+        if listing_id:
+            listing = await queryset.filter(id=listing_id).afirst()
+            if listing is None:
+                return FastJsonResponse({"error": "Listing not found"}, status=404)
+            return FastJsonResponse(ListingSerializer(listing, context=context).data)
+
+        try:
+            queryset, ordering = ListingController().filter_listings(request)
+        except ValueError as e:
+            return FastJsonResponse({"error": str(e)}, status=400)
+
+        if KeysetPaginator.is_requested(request):
+            try:
+                listings, next_url, previous_url = await KeysetPaginator(
+                    ordering
+                ).apaginate(queryset, request)
+            except InvalidCursor as e:
+                return FastJsonResponse({"error": str(e)}, status=400)
+
+            serializer = ListingSerializer(listings, many=True, context=context)
+            return FastJsonResponse(
+                {
+                    "next": next_url,
+                    "previous": previous_url,
+                    "results": serializer.data,
+                }
+            )
+
+        listings = [listing async for listing in queryset]
+        serializer = ListingSerializer(listings, many=True, context=context)
+        return FastJsonResponse(serializer.data, safe=False)
+
+
+class AsyncOfferController(AsyncController):
+    """
+    Async offers endpoint, [GET]
+
+    For the GET request, it is the same as the GET of the offers endpoint
+    """
+
+    login_required = True
+
+    async def get(self, request):
+        query = OfferQuerySerializer(data=request.GET)
+        if not query.is_valid():
+            return FastJsonResponse(query.errors, status=400)
+
+        listing_id = query.validated_data.get("listing_id")
+        if listing_id is not None:
+            if not await Listing.objects.filter(id=listing_id).aexists():
+                return FastJsonResponse({"detail": "Not found."}, status=404)
+        queryset = OfferController().filter_offers(request.user, query.validated_data)
+
+        # The DRF request gives the paginator its query_params
+        request = Request(request)
+        if KeysetPaginator.is_requested(request):
+            try:
+                offers, next_url, previous_url = await KeysetPaginator(
+                    OfferController.ordering
+                ).apaginate(queryset, request)
+            except InvalidCursor as e:
+                return FastJsonResponse({"error": str(e)}, status=400)
+
+            return FastJsonResponse(
+                {
+                    "next": next_url,
+                    "previous": previous_url,
+                    "results": OfferSerializer(offers, many=True).data,
+                }
+            )
+
+        offers = [offer async for offer in queryset]
+        return FastJsonResponse(OfferSerializer(offers, many=True).data, safe=False)
+
+
+class AsyncReviewsController(AsyncController):
+    """
+    Async reviews endpoint, [GET]
+
+    For the GET request, it is the same as the GET of the reviews endpoint,
+    signing in is only needed for your own reviews
+    """
+
+    async def get(self, request):
+        user_id = request.GET.get("user_id") or request.user.id
+        if user_id is None:
+            return FastJsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=401,
+            )
+
+        queryset = Review.objects.select_related("reviewer", "user").filter(
+            user=user_id
+        )
+        reviews = [review async for review in queryset]
+        return FastJsonResponse(ReviewSerializer(reviews, many=True).data, safe=False)
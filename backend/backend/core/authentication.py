@@ -0,0 +1,95 @@
+import hmac
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from backend.core import user_cache
+from backend.core.models import TokenUser
+
+# Claims added to every access token, so that most requests never need the
+# rest of the user's row. They are as of login, views showing the user back
+# should refresh it first
+USER_CLAIMS = ("email", "username")
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+def get_token_user(validated_token):
+    """
+    The TokenUser of a validated token, the whole row of a recently seen user
+    and only the claims otherwise, never a query
+    """
+    try:
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    row = user_cache.get_row(user_id)
+    if row is not None:
+        return TokenUser.from_values(row)
+
+    values = {api_settings.USER_ID_FIELD: user_id}
+    for claim in USER_CLAIMS:
+        if claim in validated_token:
+            values[claim] = validated_token[claim]
+    return TokenUser.from_values(values)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that trusts the token rather than looking its user up
+    on reads. Writes load the user's row first, so a deleted user's token is
+    turned away with a 401 before anything is written on its behalf
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and request.method not in SAFE_METHODS:
+            user, _token = result
+            user.refresh_from_db()
+        return result
+
+    def get_user(self, validated_token):
+        return get_token_user(validated_token)
+
+
+# request.auth of a scraper let in by MetricsTokenAuthentication
+METRICS_SCRAPER = "metrics-scraper"
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Lets a metrics scraper in with METRICS_TOKEN as its bearer token, as an
+    anonymous user. Any other request is left to the next authentication class
+    """
+
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        header = request.headers.get("Authorization", "")
+        if token and hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            return (AnonymousUser(), METRICS_SCRAPER)
+        return None
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+
+class CanReadMetrics(BasePermission):
+    """
+    Superusers, and scrapers let in by MetricsTokenAuthentication
+    """
+
+    def has_permission(self, request, view):
+        if request.auth == METRICS_SCRAPER:
+            return True
+        return bool(request.user and request.user.is_superuser)
@@ -0,0 +1,63 @@
+from bisect import bisect_right
+
+from django.core.cache import cache
+
+from backend.core.models import Offer
+
+# Merged busy intervals per listing, cleared whenever one of its offers changes
+CACHE_KEY = "listing-availability:{}"
+CACHE_TIMEOUT = 60 * 60
+
+
+def merge_intervals(intervals):
+    """
+    Merges (start, end) intervals that are already sorted by start into the
+    smallest set of non-overlapping intervals, in a single pass
+    """
+    merged = []
+    for start, end in intervals:
+        # Touching or overlapping the previous interval, extend it
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def get_busy_intervals(listing_id):
+    busy = cache.get(CACHE_KEY.format(listing_id))
+    if busy is None:
+        offers = (
+            Offer.objects.filter(
+                listing_id=listing_id, status__in=Offer.BLOCKING_STATUSES
+            )
+            .order_by("scheduled_start")
+            .values_list("scheduled_start", "scheduled_end")
+        )
+        busy = merge_intervals(offers)
+        cache.set(CACHE_KEY.format(listing_id), busy, CACHE_TIMEOUT)
+    return busy
+
+
+def get_busy_intervals_between(listing_id, start=None, end=None):
+    """
+    Returns the merged busy intervals of a listing overlapping [start, end)
+    """
+    busy = get_busy_intervals(listing_id)
+
+    # Merged intervals don't overlap, so their ends are sorted as well
+    first = 0
+    if start is not None:
+        first = bisect_right(busy, start, key=lambda interval: interval[1])
+
+    intervals = []
+    for interval_start, interval_end in busy[first:]:
+        if end is not None and interval_start >= end:
+            break
+        intervals.append((interval_start, interval_end))
+    return intervals
+
+
+def invalidate_busy_intervals(listing_id):
+    cache.delete(CACHE_KEY.format(listing_id))
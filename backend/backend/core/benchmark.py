@@ -0,0 +1,742 @@
+import asyncio
+import json
+import math
+import re
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from backend.core.models import Listing, Offer, Review, User
+from backend.core.renderers import dumps, orjson
+from backend.core.serializers import ListingSerializer
+from backend.core.synthetic import PASSWORD, placeholder_image
+from backend.core.views import ListingController
+
+# Dataset sizes, in listings, offers and reviews each
+SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+
+# Sub-millisecond routes jitter by more than any sane threshold, so a
+# regression also has to be at least this much slower or bigger
+LATENCY_SLACK_MS = 2.0
+MEMORY_SLACK_KB = 64
+
+# Lets the metrics scenario in as the scraper
+BENCHMARK_METRICS_TOKEN = "benchmark"
+
+# How each database reports reading a whole table. A SQLite scan of an index
+# only counts when the rows are sorted afterwards, otherwise it walks the
+# index in the requested order and stops at the page's LIMIT
+FULL_SCAN_RE = {
+    "sqlite": re.compile(r"^SCAN (\w+)( USING (COVERING )?INDEX \w+)?$"),
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+}
+SORTED_RE = re.compile(r"USE TEMP B-TREE FOR (ORDER|GROUP) BY")
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def percentile(values, percent):
+    # Nearest rank percentile
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+def build_scenarios():
+    """
+    Returns the benchmarked requests for the routes in backend/urls.py, run
+    against whatever dataset is in the database
+
+    The busiest user of the synthetic dataset is the one signed in, so the
+    per user routes return as much as they ever will
+    """
+    owner = (
+        User.objects.filter(listing__isnull=False).order_by("id").first()
+        or User.objects.order_by("id").first()
+    )
+    listing = Listing.objects.filter(uploaded_by=owner).order_by("id").first()
+    other = User.objects.exclude(id=owner.id).order_by("id").first()
+    offer = Offer.objects.select_related("offered_by").order_by("id").first()
+    pending = (
+        Offer.objects.filter(status=Offer.PENDING)
+        .select_related("listing__uploaded_by")
+        .order_by("id")
+        .first()
+    )
+    reviewed = Review.objects.order_by("id").values_list("user_id", flat=True)[0]
+    location = listing.locations.first()
+    # An incremental sync of the last tenth of the listings
+    updated_since = (
+        Listing.objects.order_by("-updated_at")
+        .values_list("updated_at", flat=True)[Listing.objects.count() // 10]
+    )
+
+    # Far enough ahead that no generated offer is in the way
+    start = timezone.now() + timedelta(days=3650)
+
+    photo = placeholder_image("gray", "benchmark", (800, 600)).read()
+    listing_form = {
+        "title": "Benchmark Drill",
+        "description": "Cordless drill with two batteries",
+        "category": "EL",
+        "listing_type": "RE",
+        "rates": json.dumps(
+            [{"time_unit": "H", "rate": "5.00"}, {"time_unit": "D", "rate": "30.00"}]
+        ),
+        "locations": json.dumps(
+            [
+                {"latitude": 1.3, "longitude": 103.8, "query": "Nex", "notes": ""},
+                {
+                    "latitude": 1.35,
+                    "longitude": 103.9,
+                    "query": "Tampines",
+                    "notes": "",
+                },
+            ]
+        ),
+    }
+
+    return [
+        {"name": "listing-browse", "path": "/listing/"},
+        {
+            "name": "listing-browse-cached",
+            "path": "/listing/",
+            "cached": True,
+        },
+        {"name": "listing-page", "path": "/listing/", "params": {"page_size": 20}},
+        {"name": "listing-detail", "path": "/listing/", "params": {"id": listing.id}},
+        {"name": "listing-search", "path": "/listing/", "params": {"search": "drill"}},
+        {
+            "name": "listing-price-sort",
+            "path": "/listing/",
+            "params": {"category": "EL", "time_unit": "H", "sort_by": "price_asc"},
+        },
+        {
+            "name": "listing-price-page",
+            "path": "/listing/",
+            "params": {"time_unit": "H", "sort_by": "price_desc", "page_size": 20},
+        },
+        {
+            "name": "listing-nearby",
+            "path": "/listing/",
+            "params": {
+                "lat": location.latitude,
+                "lng": location.longitude,
+                "radius": 2,
+            },
+        },
+        {
+            "name": "listing-create",
+            "method": "post",
+            "path": "/listing/",
+            "format": "multipart",
+            "data": listing_form,
+            "files": {"photos": [("1.jpg", photo), ("2.jpg", photo)]},
+            "user": owner,
+            "status": 201,
+        },
+        {
+            "name": "listing-update",
+            "method": "put",
+            "path": "/listing/",
+            "format": "multipart",
+            "data": {**listing_form, "id": listing.id},
+            "user": owner,
+        },
+        {
+            "name": "listing-delete",
+            "method": "delete",
+            "path": f"/listing/?id={listing.id}",
+            "user": owner,
+        },
+        {"name": "listing-export", "path": "/listing/export/"},
+        {
+            "name": "listing-export-since",
+            "path": "/listing/export/",
+            "params": {"updated_since": updated_since.isoformat()},
+        },
+        {"name": "user", "path": "/user/", "user": owner},
+        {
+            "name": "user-create",
+            "method": "post",
+            "path": "/user/",
+            "format": "multipart",
+            "data": {
+                "username": "benchmark",
+                "email": "benchmark@example.com",
+                "password": PASSWORD,
+                "phone_number": "00000000",
+                "biography": "Benchmarking",
+            },
+            "files": {"avatar": [("avatar.jpg", photo)]},
+            "status": 201,
+        },
+        {
+            "name": "user-update",
+            "method": "put",
+            "path": "/user/",
+            "data": {"username": "renamed", "biography": "Renamed"},
+            "user": owner,
+        },
+        {"name": "user-delete", "method": "delete", "path": "/user/", "user": other},
+        {
+            "name": "offers-received",
+            "path": "/offers/",
+            "params": {"type": "received"},
+            "user": owner,
+        },
+        {
+            "name": "offers-page",
+            "path": "/offers/",
+            "params": {"type": "received", "status": "P", "page_size": 20},
+            "user": owner,
+        },
+        {
+            "name": "offers-made",
+            "path": "/offers/",
+            "params": {"type": "made"},
+            "user": owner,
+        },
+        {
+            "name": "offer-create",
+            "method": "post",
+            "path": "/offers/",
+            "data": {
+                "listing_id": listing.id,
+                "price": "10.00",
+                "scheduled_start": start.isoformat(),
+                "scheduled_end": (start + timedelta(hours=2)).isoformat(),
+                "time_unit": "H",
+                "time_delta": 2,
+            },
+            "user": other,
+            "status": 201,
+        },
+        {
+            "name": "offer-accept",
+            "method": "put",
+            "path": "/offers/",
+            "data": {"offer_id": pending.id, "action": "accept"},
+            "user": pending.listing.uploaded_by,
+        },
+        {
+            "name": "availability",
+            "path": "/availability/",
+            "params": {"listing_id": listing.id},
+        },
+        {
+            "name": "reviews",
+            "path": "/reviews/",
+            "params": {"user_id": reviewed},
+            "user": owner,
+        },
+        {
+            "name": "review-create",
+            "method": "post",
+            "path": "/reviews/",
+            "data": {"user_id": other.id, "rating": 4, "description": "Great"},
+            "user": owner,
+            "status": 201,
+        },
+        {"name": "transactions", "path": "/transactions/", "user": owner},
+        {
+            "name": "transactions-compact",
+            "path": "/transactions/",
+            "params": {"compact": "true"},
+            "user": owner,
+        },
+        {
+            "name": "transactions-page",
+            "path": "/transactions/",
+            "params": {"compact": "true", "page_size": 20},
+            "user": owner,
+        },
+        {"name": "summary", "path": "/summary/", "user": owner},
+        {
+            "name": "transaction-create",
+            "method": "post",
+            "path": "/transactions/",
+            "data": {"offer_id": offer.id, "amount": "10.00", "payment_id": "PAY"},
+            "user": offer.offered_by,
+            "status": 201,
+        },
+        {"name": "async-listing-browse", "path": "/async/listing/", "async": True},
+        {
+            "name": "async-listing-page",
+            "path": "/async/listing/",
+            "params": {"page_size": 20},
+            "async": True,
+        },
+        {
+            "name": "async-offers-received",
+            "path": "/async/offers/",
+            "params": {"type": "received"},
+            "user": owner,
+            "async": True,
+        },
+        {
+            "name": "async-reviews",
+            "path": "/async/reviews/",
+            "params": {"user_id": reviewed},
+            "async": True,
+        },
+        {
+            "name": "metrics",
+            "path": "/metrics/",
+            "headers": {"Authorization": f"Bearer {BENCHMARK_METRICS_TOKEN}"},
+            "settings": {"METRICS_TOKEN": BENCHMARK_METRICS_TOKEN},
+        },
+        {
+            "name": "login",
+            "method": "post",
+            "path": "/api/login/",
+            "data": {"email": owner.email, "password": PASSWORD},
+        },
+        {
+            "name": "reset-password",
+            "method": "put",
+            "path": "/reset-password/",
+            "data": {
+                "email": owner.email,
+                "phone_number": owner.phone_number,
+                "new_password": PASSWORD,
+            },
+        },
+    ]
+
+
+def send(client, scenario, headers):
+    if scenario.get("async"):
+        return async_to_sync(asend)(AsyncClient(), scenario, headers)
+    method = scenario.get("method", "get")
+    if method == "get":
+        return client.get(scenario["path"], scenario.get("params", {}), headers=headers)
+    if method == "delete":
+        return client.delete(scenario["path"], headers=headers)
+    if scenario.get("format") == "multipart":
+        # Uploads are read as they are sent, so each request gets fresh ones
+        data = {**scenario["data"]}
+        for field, files in scenario.get("files", {}).items():
+            data[field] = [
+                SimpleUploadedFile(name, content, content_type="image/jpeg")
+                for name, content in files
+            ]
+        return getattr(client, method)(
+            scenario["path"], data, format="multipart", headers=headers
+        )
+    return getattr(client, method)(
+        scenario["path"],
+        json.dumps(scenario["data"]),
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+async def asend(client, scenario, headers):
+    # send for an AsyncClient, only GETs are sent this way
+    return await client.get(
+        scenario["path"], scenario.get("params", {}), headers=headers
+    )
+
+
+def scenario_headers(scenario):
+    headers = {**scenario.get("headers", {})}
+    if scenario.get("user"):
+        token = RefreshToken.for_user(scenario["user"]).access_token
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+def run_request(client, scenario, headers):
+    if not scenario.get("cached"):
+        cache.clear()
+    if scenario.get("method", "get") == "get":
+        response = send(client, scenario, headers)
+        # Streamed responses are only generated as they are read, a chunk at
+        # a time, so they are read here and dropped to time and trace that
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    # Writes are rolled back so every iteration sees the same dataset
+    with transaction.atomic():
+        response = send(client, scenario, headers)
+        transaction.set_rollback(True)
+    return response
+
+
+def measure(scenario, iterations):
+    """
+    Runs a scenario iterations times, returning its p50 and p95 latency, the
+    most queries any one request made and the peak memory allocated
+    """
+    client = APIClient()
+    headers = scenario_headers(scenario)
+
+    # Warms up any caches, and checks the scenario still does what it should
+    response = run_request(client, scenario, headers)
+    if response.status_code != scenario.get("status", 200):
+        raise BenchmarkError(
+            f"{scenario['name']} returned {response.status_code}: "
+            f"{response.content[:200]!r}"
+        )
+
+    timings, queries = [], 0
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            run_request(client, scenario, headers)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = max(queries, len(context.captured_queries))
+
+    # Tracing allocations slows everything down, so it gets its own request
+    tracemalloc.start()
+    try:
+        run_request(client, scenario, headers)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "queries": queries,
+        "peak_kb": round(peak / 1024),
+    }
+
+
+def run_benchmarks(iterations, names=None):
+    results = {}
+    for scenario in build_scenarios():
+        if names and scenario["name"] not in names:
+            continue
+        with override_settings(**scenario.get("settings", {})):
+            results[scenario["name"]] = measure(scenario, iterations)
+    return results
+
+
+def measure_encoding(iterations):
+    """
+    Times encoding the unpaginated browse payload of every listing in the
+    dataset with the standard library and with orjson, returning
+    {encoder: {"p50_ms", "p95_ms", "kb"}}
+
+    The listings are serialized once up front, so only the encoding is timed
+    """
+    data = ListingSerializer(
+        ListingController.queryset.order_by("id"), many=True
+    ).data
+
+    results = {}
+    for name, fast in (("json", False), ("orjson", True)):
+        if fast and orjson is None:
+            continue
+        timings = []
+        with override_settings(FAST_JSON=fast):
+            for _ in range(iterations):
+                start = time.perf_counter()
+                content = dumps(data)
+                timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            "p50_ms": round(percentile(timings, 50), 2),
+            "p95_ms": round(percentile(timings, 95), 2),
+            "kb": round(len(content) / 1024),
+        }
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Compares results against a stored baseline, returning a message for every
+    route that has no baseline, makes more queries or allocates more than the
+    threshold fraction allows
+
+    Latency depends on the machine as much as the code, it is only reported,
+    by find_slowdowns
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            # A route nothing is compared against would pass every regression
+            regressions.append(f"{name}: no baseline, record one with --save-baseline")
+            continue
+        expected = baseline[name]
+        if result["queries"] > expected["queries"]:
+            regressions.append(
+                f"{name}: {result['queries']} queries, "
+                f"baseline {expected['queries']}"
+            )
+        if result["peak_kb"] > expected["peak_kb"] * (1 + threshold) + MEMORY_SLACK_KB:
+            regressions.append(
+                f"{name}: peak {result['peak_kb']}KB, baseline {expected['peak_kb']}KB"
+            )
+    return regressions
+
+
+def find_slowdowns(results, baseline, threshold):
+    # Routes slower than the threshold fraction allows, p95 of a few dozen
+    # requests is mostly noise so it is on p50
+    slowdowns = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["p50_ms"] > expected["p50_ms"] * (1 + threshold) + LATENCY_SLACK_MS:
+            slowdowns.append(
+                f"{name}: p50 {result['p50_ms']}ms, baseline {expected['p50_ms']}ms"
+            )
+    return slowdowns
+
+
+def explain(sql):
+    # Returns the lines of the query plan
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[3] for row in cursor.fetchall()]
+        cursor.execute(f"EXPLAIN {sql}")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def full_scans(sql):
+    """
+    Returns the tables a SELECT reads from start to end, according to its plan
+    """
+    full_scan_re = FULL_SCAN_RE.get(connection.vendor)
+    if full_scan_re is None:
+        raise BenchmarkError(f"Query plans of {connection.vendor} aren't supported")
+
+    plan = [line.strip() for line in explain(sql)]
+    sorted_after = any(SORTED_RE.match(line) for line in plan)
+    tables = []
+    for line in plan:
+        match = full_scan_re.search(line)
+        if match and (match.lastindex == 1 or sorted_after):
+            tables.append(match[1])
+    return tables
+
+
+def find_full_scans(scenario):
+    """
+    Runs a scenario once and explains every SELECT it made, returning a
+    message for each table one of them reads from start to end
+    """
+    with override_settings(**scenario.get("settings", {})):
+        with CaptureQueriesContext(connection) as context:
+            run_request(APIClient(), scenario, scenario_headers(scenario))
+
+    scans = []
+    for query in context.captured_queries:
+        if query["sql"].startswith("SELECT"):
+            scans.extend(
+                f"{scenario['name']}: scans {table} in {query['sql']}"
+                for table in full_scans(query["sql"])
+            )
+    return scans
+
+
+def build_write_load(threads, requests_per_thread):
+    """
+    Returns {name: [[(scenario, headers)] per thread]} of concurrent offer and
+    transaction POSTs, each thread posting as a different user
+
+    The offers all go to a few hot listings so they queue on the listing
+    lock, in slots that never collide so every one of them is created
+    """
+    hot_listings = list(Listing.objects.order_by("id")[:5])
+    users = list(
+        User.objects.exclude(listing__in=hot_listings)
+        .distinct()
+        .order_by("-id")[:threads]
+    )
+    if len(users) < threads:
+        raise BenchmarkError(f"The dataset has fewer than {threads} users")
+    offers = list(Offer.objects.order_by("id")[: threads * requests_per_thread])
+    if len(offers) < threads * requests_per_thread:
+        raise BenchmarkError("The dataset doesn't have enough offers")
+
+    start = timezone.now() + timedelta(days=3650)
+    load = {"offer-create": [], "transaction-create": []}
+    for thread, user in enumerate(users):
+        token = RefreshToken.for_user(user).access_token
+        headers = {"Authorization": f"Bearer {token}"}
+        offer_requests, transaction_requests = [], []
+        for i in range(requests_per_thread):
+            slot = start + timedelta(hours=3 * (thread * requests_per_thread + i))
+            offer_scenario = {
+                "method": "post",
+                "path": "/offers/",
+                "data": {
+                    "listing_id": hot_listings[i % len(hot_listings)].id,
+                    "price": "10.00",
+                    "scheduled_start": slot.isoformat(),
+                    "scheduled_end": (slot + timedelta(hours=2)).isoformat(),
+                    "time_unit": "H",
+                    "time_delta": 2,
+                },
+            }
+            offer = offers[thread * requests_per_thread + i]
+            transaction_scenario = {
+                "method": "post",
+                "path": "/transactions/",
+                "data": {
+                    "offer_id": offer.id,
+                    "amount": str(offer.price),
+                    "payment_id": f"LOAD{offer.id}",
+                },
+            }
+            offer_requests.append((offer_scenario, headers))
+            transaction_requests.append((transaction_scenario, headers))
+        load["offer-create"].append(offer_requests)
+        load["transaction-create"].append(transaction_requests)
+    return load
+
+
+def build_read_load(threads, requests_per_thread, prefix=""):
+    """
+    Returns {name: [[(scenario, headers)] per thread]} of concurrent browse,
+    offer and review GETs, all signed in so none are served from the cache
+
+    prefix is put in front of every path, "/async" reads from the async views
+    """
+    owner = User.objects.filter(listing__isnull=False).order_by("id").first()
+    pending = (
+        Offer.objects.filter(status=Offer.PENDING)
+        .select_related("listing__uploaded_by")
+        .order_by("id")
+        .first()
+    )
+    reviewed = Review.objects.order_by("id").values_list("user_id", flat=True)[0]
+    headers = {"Authorization": f"Bearer {RefreshToken.for_user(owner).access_token}"}
+
+    scenarios = {
+        "listing-page": {"path": "/listing/", "params": {"page_size": 20}},
+        "offers-made": {"path": "/offers/", "params": {"type": "made"}},
+        "reviews": {"path": "/reviews/", "params": {"user_id": reviewed}},
+    }
+    load = {}
+    for name, scenario in scenarios.items():
+        scenario = {**scenario, "path": prefix + scenario["path"]}
+        load[name] = [
+            [(scenario, headers)] * requests_per_thread for _ in range(threads)
+        ]
+    return load
+
+
+def build_login_load(threads, requests_per_thread):
+    """
+    Returns {"login": [[(scenario, headers)] per thread]} of concurrent
+    logins, each thread logging in as a different user, to measure logins/s
+    at the configured password hasher and cost
+    """
+    users = list(User.objects.order_by("id")[:threads])
+    if len(users) < threads:
+        raise BenchmarkError(f"The dataset has fewer than {threads} users")
+
+    load = {"login": []}
+    for user in users:
+        scenario = {
+            "method": "post",
+            "path": "/api/login/",
+            "data": {"email": user.email, "password": PASSWORD},
+        }
+        load["login"].append([(scenario, {})] * requests_per_thread)
+    return load
+
+
+def summarize_load(results, elapsed, expected_status):
+    # Throughput, latency and the failed requests by status or exception
+    # of [(ms, status)]
+    timings = [ms for ms, _ in results]
+    failures = Counter(status for _, status in results if status != expected_status)
+    return {
+        "requests": len(timings),
+        "failed": dict(failures),
+        "seconds": round(elapsed, 2),
+        "per_second": round((len(timings) - sum(failures.values())) / elapsed, 1),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+    }
+
+
+def run_concurrently(requests_by_thread, expected_status=201):
+    """
+    Sends the requests of every thread from a thread of its own, all starting
+    at once, like a threaded WSGI server would serve them
+    """
+    barrier = threading.Barrier(len(requests_by_thread) + 1)
+    lock = threading.Lock()
+    all_results = []
+
+    def worker(requests):
+        # Server errors come back as 500s rather than being raised here
+        client = Client(raise_request_exception=False)
+        results = []
+        barrier.wait()
+        try:
+            for scenario, headers in requests:
+                start = time.perf_counter()
+                status = send(client, scenario, headers).status_code
+                results.append(((time.perf_counter() - start) * 1000, status))
+        finally:
+            # Every thread opened its own database connections
+            connections.close_all()
+            with lock:
+                all_results.extend(results)
+
+    workers = [
+        threading.Thread(target=worker, args=(requests,))
+        for requests in requests_by_thread
+    ]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return summarize_load(all_results, elapsed, expected_status)
+
+
+def run_async_concurrently(requests_by_task, expected_status=200):
+    """
+    Sends the requests of every task from an asyncio task of its own through
+    Django's ASGI handler, all in one event loop like an ASGI server would
+    serve them
+    """
+
+    async def worker(client, requests):
+        results = []
+        for scenario, headers in requests:
+            start = time.perf_counter()
+            status = (await asend(client, scenario, headers)).status_code
+            results.append(((time.perf_counter() - start) * 1000, status))
+        return results
+
+    async def run():
+        client = AsyncClient(raise_request_exception=False)
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(worker(client, requests) for requests in requests_by_task)
+        )
+        elapsed = time.perf_counter() - start
+        return [result for task in results for result in task], elapsed
+
+    results, elapsed = asyncio.run(run())
+    return summarize_load(results, elapsed, expected_status)
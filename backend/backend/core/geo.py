@@ -0,0 +1,117 @@
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+# Coarsest covering that is still selective, each cell is one index range scan
+MAX_COVERING_CELLS = 16
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Encodes a point as a geohash, nearby points share a common prefix so a
+    plain B-tree index on the hash can serve area lookups as range scans
+    """
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(geohash)
+
+
+def cell_size(precision):
+    # Returns the (latitude, longitude) size in degrees of a cell
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / 2**lat_bits, 360.0 / 2**lng_bits
+
+
+def covering_cells(min_lat, min_lng, max_lat, max_lng):
+    """
+    Returns the geohash prefixes of the cells covering a bounding box, at the
+    finest precision that needs no more than MAX_COVERING_CELLS cells, or an
+    empty list if the box is too large to narrow down
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0)
+
+    # A box too big for even the coarsest cells is not narrowed at all
+    cells = set()
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        lat_size, lng_size = cell_size(precision)
+        lat_steps = math.floor(max_lat / lat_size) - math.floor(min_lat / lat_size)
+        lng_steps = math.floor(max_lng / lng_size) - math.floor(min_lng / lng_size)
+        if (lat_steps + 1) * (lng_steps + 1) > MAX_COVERING_CELLS:
+            break
+
+        # Walk the grid through the box, taking one point in every cell
+        cells = set()
+        for i in range(lat_steps + 1):
+            latitude = min(min_lat + i * lat_size, max_lat)
+            for j in range(lng_steps + 1):
+                longitude = min(min_lng + j * lng_size, max_lng)
+                cells.add(encode_geohash(latitude, longitude, precision))
+            cells.add(encode_geohash(latitude, max_lng, precision))
+        for j in range(lng_steps + 1):
+            longitude = min(min_lng + j * lng_size, max_lng)
+            cells.add(encode_geohash(max_lat, longitude, precision))
+        cells.add(encode_geohash(max_lat, max_lng, precision))
+    return sorted(cells)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    # Returns (min_lat, min_lng, max_lat, max_lng) enclosing the circle
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-9:
+        lng_delta = 180.0
+    else:
+        lng_delta = min(180.0, lat_delta / cos_lat)
+    return (
+        latitude - lat_delta,
+        longitude - lng_delta,
+        latitude + lat_delta,
+        longitude + lng_delta,
+    )
+
+
+def geohash_filter(min_lat, min_lng, max_lat, max_lng, field="geohash"):
+    """
+    Q object matching geohashes in any cell covering the bounding box,
+    written as ranges so the index is used for the prefix match
+    """
+    query = Q()
+    for cell in covering_cells(min_lat, min_lng, max_lat, max_lng):
+        # "~" sorts after every geohash character
+        query |= Q(**{f"{field}__gte": cell, f"{field}__lt": cell + "~"})
+    return query
+
+
+def haversine_km(latitude, longitude, lat_field="latitude", lng_field="longitude"):
+    """
+    Database expression for the great circle distance in km between the
+    given point and the point stored in lat_field, lng_field
+    """
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    lat2, lng2 = Radians(F(lat_field)), Radians(F(lng_field))
+    a = Power(Sin((lat2 - lat1) / 2), 2) + math.cos(lat1) * Cos(lat2) * Power(
+        Sin((lng2 - lng1) / 2), 2
+    )
+    return 2 * EARTH_RADIUS_KM * ASin(Sqrt(a), output_field=FloatField())
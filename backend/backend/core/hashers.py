@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+# Django's hashers with their cost read from the settings. The algorithm
+# names are unchanged, so stored hashes verify either way, and a hash made
+# at another cost is rehashed at the configured one on the next login
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PBKDF2_ITERATIONS
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return settings.BCRYPT_ROUNDS
+
+
+# The installed django-stubs predate Django's scrypt hasher
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):  # type: ignore[name-defined]
+    @property
+    def work_factor(self):
+        return settings.SCRYPT_WORK_FACTOR
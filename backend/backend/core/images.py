@@ -0,0 +1,130 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from backend.core.listing_cache import bump_version
+from backend.core.models import Listing, ListingPhoto
+
+logger = logging.getLogger(__name__)
+
+# Widths of the resized copies made of every listing photo, the original is
+# never upscaled so smaller photos get fewer variants
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+VARIANT_DIR = "listings/variants"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    # Uploads on several threads at once must not start a pool each
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix="photo-variants",
+            )
+        return _executor
+
+
+def render_variants(image_file, name):
+    """
+    Resizes an image to every variant width and format
+
+    Returns {format: {width: storage name}} of the saved variants
+    """
+    with Image.open(image_file) as original:
+        # Phone photos are often stored sideways with a rotation tag
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        widths = [width for width in VARIANT_WIDTHS if width < image.width]
+        stem = os.path.splitext(os.path.basename(name))[0]
+
+        variants = {extension: {} for extension in VARIANT_FORMATS}
+        for width in widths:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            for extension, (image_format, options) in VARIANT_FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, image_format, **options)
+                variants[extension][str(width)] = default_storage.save(
+                    f"{VARIANT_DIR}/{stem}_{width}.{extension}",
+                    ContentFile(buffer.getvalue()),
+                )
+    return variants
+
+
+def generate_variants(photo_id):
+    try:
+        photo = ListingPhoto.objects.get(id=photo_id)
+    except ListingPhoto.DoesNotExist:
+        # Deleted before the worker got to it
+        return
+
+    with photo.image_url.open("rb") as image_file:
+        variants = render_variants(image_file, photo.image_url.name)
+
+    # update() so saving the variants doesn't look like a new photo upload.
+    # The listing's srcset changes with them, so it counts as updated for
+    # partners syncing through the export's updated_since
+    with transaction.atomic():
+        saved = ListingPhoto.objects.filter(id=photo_id).update(variants=variants)
+        if saved:
+            Listing.objects.filter(pk=photo.listing_id).update(
+                updated_at=timezone.now()
+            )
+    if not saved:
+        # Deleted while they were being made
+        delete_variants(variants)
+        return
+    bump_version()
+
+
+def delete_variants(variants):
+    # Removes the files of {format: {width: storage name}} variants
+    for widths in variants.values():
+        for name in widths.values():
+            default_storage.delete(name)
+
+
+def _run_in_worker(photo_id):
+    try:
+        generate_variants(photo_id)
+    except Exception:
+        logger.exception("Failed to generate variants for listing photo %s", photo_id)
+    finally:
+        # Worker threads get their own database connection, don't leak it
+        connection.close()
+
+
+def generate_variants_later(photos):
+    """
+    Queues variant generation for the given photos once the current
+    transaction commits, so the upload request doesn't wait on resizing
+    """
+    photo_ids = [photo.id for photo in photos]
+
+    def submit():
+        for photo_id in photo_ids:
+            if settings.IMAGE_VARIANT_WORKERS == 0:
+                generate_variants(photo_id)
+            else:
+                get_executor().submit(_run_in_worker, photo_id)
+
+    transaction.on_commit(submit)
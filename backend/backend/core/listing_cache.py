@@ -0,0 +1,112 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+
+# Every cached browse response is keyed on this version, bumping it on any
+# listing change invalidates all of them at once without tracking keys
+VERSION_KEY = "listing-browse-version"
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Not set yet, or evicted, nothing cached under it is reachable anyway
+        cache.add(VERSION_KEY, 1, None)
+
+
+async def aget_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, 1, None)
+        version = await cache.aget(VERSION_KEY, 1)
+    return version
+
+
+def get_cache_key(request, version):
+    # Parameter order and repeated values don't change the response
+    params = sorted((key, sorted(request.GET.getlist(key))) for key in request.GET)
+    # The host and path are part of the key since pagination links are
+    # absolute, and the sync and async browse views share the cache
+    digest = hashlib.md5(
+        repr((request.get_host(), request.path, params)).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return f"listing-browse:{version}:{digest}"
+
+
+def to_cached(response):
+    # (content, content type, etag) of a response worth caching, or None
+    # Errors and anything DRF still has to render are not cached
+    if not isinstance(response, JsonResponse) or response.status_code != 200:
+        return None
+    etag = '"{}"'.format(
+        hashlib.md5(response.content, usedforsecurity=False).hexdigest()
+    )
+    return (response.content, response["Content-Type"], etag)
+
+
+def from_cached(request, cached):
+    content, content_type, etag = cached
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=content_type)
+    response["ETag"] = etag
+    return response
+
+
+def cache_anonymous_browse(view_method):
+    """
+    Caches the successful JSON responses of a browse view for anonymous users,
+    and answers If-None-Match requests for an unchanged response with a 304
+
+    Works on the async views too, through the async cache API
+    """
+    if iscoroutinefunction(view_method):
+
+        @wraps(view_method)
+        async def async_wrapper(self, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return await view_method(self, request, *args, **kwargs)
+
+            key = get_cache_key(request, await aget_version())
+            cached = await cache.aget(key)
+            if cached is None:
+                response = await view_method(self, request, *args, **kwargs)
+                cached = to_cached(response)
+                if cached is None:
+                    return response
+                await cache.aset(key, cached, settings.LISTING_CACHE_TIMEOUT)
+            return from_cached(request, cached)
+
+        return async_wrapper
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+
+        key = get_cache_key(request, get_version())
+        cached = cache.get(key)
+        if cached is None:
+            response = view_method(self, request, *args, **kwargs)
+            cached = to_cached(response)
+            if cached is None:
+                return response
+            cache.set(key, cached, settings.LISTING_CACHE_TIMEOUT)
+        return from_cached(request, cached)
+
+    return wrapper
@@ -0,0 +1,183 @@
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from backend.core.benchmark import (
+    SIZES,
+    BenchmarkError,
+    find_regressions,
+    find_slowdowns,
+    measure_encoding,
+    run_benchmarks,
+)
+from backend.core.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a synthetic dataset into a throwaway test database and measures "
+        "the latency, query count and memory of every API route against the "
+        "stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            action="append",
+            choices=list(SIZES),
+            help="Dataset size to benchmark, can be repeated (default 1k)",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=20,
+            help="Timed requests per route",
+        )
+        parser.add_argument(
+            "--route",
+            action="append",
+            help="Only benchmark the named scenario, can be repeated",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=settings.BASE_DIR / "benchmarks" / "baseline.json",
+            help="Baseline file to compare against",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.25,
+            help=(
+                "Fraction a route may allocate more before failing, or get "
+                "slower before it is reported"
+            ),
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Store the results as the new baseline instead of comparing",
+        )
+        parser.add_argument(
+            "--encoding",
+            action="store_true",
+            help=(
+                "Time encoding every listing's browse payload with the standard "
+                "library against orjson instead of the routes"
+            ),
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["encoding"]:
+            for size in options["size"] or ["1k"]:
+                results = self.run_size(
+                    size, options, lambda: measure_encoding(options["iterations"])
+                )
+                self.print_encoding(size, results)
+            return
+
+        try:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            baseline = {}
+
+        sizes = options["size"] or ["1k"]
+        missing = [size for size in sizes if size not in baseline]
+        if missing and not options["save_baseline"]:
+            # Nothing to compare against would pass every regression
+            raise CommandError(
+                f"No baseline for {', '.join(missing)} in {options['baseline']}, "
+                "record one with --save-baseline"
+            )
+
+        regressions, slowdowns = [], []
+        for size in sizes:
+            results = self.run_size(
+                size,
+                options,
+                lambda: run_benchmarks(options["iterations"], options["route"]),
+            )
+            expected = baseline.get(size, {})
+            regressions += [
+                f"{size} {message}"
+                for message in find_regressions(results, expected, options["threshold"])
+            ]
+            slowdowns += [
+                f"{size} {message}"
+                for message in find_slowdowns(results, expected, options["threshold"])
+            ]
+            self.print_results(size, results, expected)
+            # Saving a few routes keeps the baseline of the others
+            baseline[size] = {**expected, **results}
+
+        if slowdowns:
+            print(
+                "Slower than the baseline, not a failure as timings vary between "
+                "machines and runs:\n" + "\n".join(slowdowns)
+            )
+
+        if options["save_baseline"]:
+            with open(options["baseline"], "w") as baseline_file:
+                json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+                baseline_file.write("\n")
+            print(f"Saved baseline to {options['baseline']}")
+            return
+
+        if regressions:
+            raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+        print("No performance regressions")
+
+    def run_size(self, size, options, run):
+        # A fresh database per size, so the development database is untouched,
+        # and a media directory the uploads of the write routes are dropped with
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        media_root = tempfile.TemporaryDirectory()
+        try:
+            with override_settings(MEDIA_ROOT=media_root.name):
+                # An in-memory SQLite test database outlives destroy_test_db,
+                # it still has the rows of the previous size
+                call_command("flush", interactive=False, verbosity=0)
+                counts = generate_dataset(SIZES[size], seed=options["seed"])
+                print(
+                    f"Seeded {size}: "
+                    + ", ".join(f"{count} {model}" for model, count in counts.items())
+                )
+                return run()
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            media_root.cleanup()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def print_results(self, size, results, baseline):
+        print(
+            f"{size:<6}{'route':<24}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'queries':>9}{'peak KB':>10}{'base p50':>10}{'base q':>8}"
+        )
+        for name, result in results.items():
+            expected = baseline.get(name, {})
+            print(
+                f"{'':<6}{name:<24}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                f"{result['queries']:>9}{result['peak_kb']:>10}"
+                f"{expected.get('p50_ms', '-'):>10}{expected.get('queries', '-'):>8}"
+            )
+
+    def print_encoding(self, size, results):
+        print(f"{size:<6}{'encoder':<24}{'p50 ms':>10}{'p95 ms':>10}{'KB':>10}")
+        for name, result in results.items():
+            print(
+                f"{'':<6}{name:<24}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                f"{result['kb']:>10}"
+            )
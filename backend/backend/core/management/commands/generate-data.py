@@ -0,0 +1,94 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.core.synthetic import PASSWORD, generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic marketplace of users, listings, rates, locations, "
+        "photos, offers, reviews and transactions for load testing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--listings",
+            type=int,
+            default=10000,
+            help="Number of listings, with as many offers and reviews",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="The same seed always generates the same data",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Listings created per transaction",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes creating batches in parallel, SQLite still writes "
+            "one batch at a time so it gains most with PostgreSQL",
+        )
+        parser.add_argument(
+            "--photos",
+            action="store_true",
+            help="Attach locally generated placeholder photos to the listings",
+        )
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete all existing data first",
+        )
+
+    def handle(self, *args, **options):
+        if options["listings"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--listings and --batch-size must be positive")
+        # Without immediate transactions, concurrent SQLite write transactions
+        # fail with "database is locked" instead of waiting on each other
+        if (
+            options["workers"] > 1
+            and connection.vendor == "sqlite"
+            and connection.settings_dict["OPTIONS"].get("transaction_mode")
+            != "IMMEDIATE"
+        ):
+            raise CommandError("--workers needs SQLite's transaction_mode=IMMEDIATE")
+
+        if options["flush"]:
+            call_command("flush", interactive=False, verbosity=0)
+
+        created = 0
+        started = time.perf_counter()
+
+        def progress(counts):
+            nonlocal created
+            created += counts["listings"]
+            print(f"Created {created}/{options['listings']} listings")
+
+        counts = generate_dataset(
+            options["listings"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            photos=options["photos"],
+            workers=options["workers"],
+            progress=progress,
+        )
+
+        elapsed = time.perf_counter() - started
+        print(
+            f"Generated in {elapsed:.1f}s: "
+            + ", ".join(f"{count} {model}" for model, count in counts.items())
+        )
+        print(
+            f"Users are user{options['seed']}-<n>@example.com "
+            f"with password '{PASSWORD}'"
+        )
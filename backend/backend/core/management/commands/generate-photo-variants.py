@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from backend.core.images import generate_variants
+from backend.core.models import ListingPhoto
+
+
+class Command(BaseCommand):
+    help = "Generates the resized variants of listing photos that don't have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Regenerate the variants of every photo",
+        )
+
+    def handle(self, *args, **options):
+        photos = ListingPhoto.objects.all()
+        if not options["all"]:
+            photos = photos.filter(variants={})
+
+        count = 0
+        for photo_id in photos.values_list("id", flat=True).iterator():
+            generate_variants(photo_id)
+            count += 1
+
+        print(f"Generated variants for {count} listing photos")
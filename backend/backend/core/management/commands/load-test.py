@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from backend.core.benchmark import (
+    BenchmarkError,
+    build_login_load,
+    build_read_load,
+    build_write_load,
+    run_async_concurrently,
+    run_concurrently,
+)
+from backend.core.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a synthetic dataset into a throwaway test database and measures the "
+        "throughput of concurrent offer and transaction POSTs on the configured "
+        "database, or with --reads of concurrent GETs through the sync views on "
+        "threads against the async views on one event loop, or with --logins of "
+        "concurrent logins at the configured password hasher"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Concurrent clients, each posting as a different user",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=25,
+            help="POSTs per client and endpoint",
+        )
+        parser.add_argument(
+            "--listings",
+            type=int,
+            default=1000,
+            help="Size of the seeded dataset",
+        )
+        parser.add_argument(
+            "--reads",
+            action="store_true",
+            help="Compare the sync and async read views instead of POSTing",
+        )
+        parser.add_argument(
+            "--logins",
+            action="store_true",
+            help="Log in concurrently instead of POSTing",
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        if connection.vendor == "sqlite":
+            # The threads need a database file to share, the test database
+            # is otherwise in memory
+            connection.settings_dict["TEST"]["NAME"] = str(
+                settings.BASE_DIR / "load-test.sqlite3"
+            )
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            generate_dataset(options["listings"])
+            print(
+                f"{connection.vendor}, {options['threads']} threads, "
+                f"{options['requests']} requests each"
+            )
+
+            if options["logins"]:
+                print(f"passwords hashed with {settings.PASSWORD_HASHER}")
+                load = build_login_load(options["threads"], options["requests"])
+                self.print_result("login", run_concurrently(load["login"], 200))
+                return
+
+            if not options["reads"]:
+                load = build_write_load(options["threads"], options["requests"])
+                for name, requests_by_thread in load.items():
+                    self.print_result(name, run_concurrently(requests_by_thread))
+                return
+
+            sync_load = build_read_load(options["threads"], options["requests"])
+            async_load = build_read_load(
+                options["threads"], options["requests"], prefix="/async"
+            )
+            for name, requests_by_thread in sync_load.items():
+                self.print_result(
+                    f"{name} wsgi", run_concurrently(requests_by_thread, 200)
+                )
+                self.print_result(
+                    f"{name} asgi sync", run_async_concurrently(requests_by_thread)
+                )
+                self.print_result(
+                    f"{name} asgi async", run_async_concurrently(async_load[name])
+                )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def print_result(self, name, result):
+        print(
+            f"{name:<24} {result['per_second']:>8} req/s  "
+            f"p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  "
+            f"{result['requests']} requests in {result['seconds']}s  "
+            f"failed {result['failed'] or 0}"
+        )
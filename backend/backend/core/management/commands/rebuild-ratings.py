@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.core.models import User
+
+
+class Command(BaseCommand):
+    help = "Recomputes every user's stored rating count and total from their reviews"
+
+    def handle(self, *args, **options):
+        count = User.objects.rebuild_ratings()
+        print(f"Rebuilt ratings for {count} reviewed users")
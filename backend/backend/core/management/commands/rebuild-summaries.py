@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from backend.core.models import UserSummary
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every user's dashboard summary from their listings, offers and "
+        "transactions"
+    )
+
+    def handle(self, *args, **options):
+        count = UserSummary.objects.rebuild()
+        print(f"Rebuilt summaries for {count} users")
@@ -0,0 +1,126 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds of the histogram buckets, Prometheus style
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("Wall time of requests", SECONDS_BUCKETS),
+    "http_request_db_queries": ("Database queries made by requests", QUERY_BUCKETS),
+    "http_request_db_seconds": ("Time requests spent running SQL", SECONDS_BUCKETS),
+    "http_request_serializer_seconds": (
+        "Time requests spent in serializers",
+        SECONDS_BUCKETS,
+    ),
+    "http_response_bytes": ("Size of response bodies", BYTES_BUCKETS),
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Metrics are kept per process, Prometheus adds up the workers when each is
+# scraped on its own
+_lock = threading.Lock()
+# {(name, labels): [count per bucket..., +Inf count, sum]}
+_histograms = {}
+# {labels: count}
+_requests: defaultdict[tuple[tuple[str, str], ...], int] = defaultdict(int)
+
+
+class SerializerTimer:
+    def __init__(self):
+        self.seconds = 0.0
+        # Serializers being timed inside one another, only the outermost counts
+        self.depth = 0
+
+
+# The serializer time of the request being handled, set by
+# RequestMetricsMiddleware
+serializer_timer = ContextVar("serializer_timer", default=None)
+
+
+@contextmanager
+def timing_serializer():
+    """
+    Adds the time spent in the block to the request's serializer time, a block
+    inside another one is already counted by it
+    """
+    timer = serializer_timer.get()
+    if timer is None or timer.depth:
+        yield
+        return
+    timer.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.depth -= 1
+        timer.seconds += time.perf_counter() - start
+
+
+def record_request(method, route, status, values):
+    """
+    Records one request, values maps histogram names to what was observed,
+    histograms missing from values are left alone
+    """
+    labels = (("method", method), ("route", route))
+    with _lock:
+        _requests[labels + (("status", str(status)),)] += 1
+        for name, value in values.items():
+            buckets = HISTOGRAMS[name][1]
+            key = (name, labels)
+            if key not in _histograms:
+                _histograms[key] = [0] * (len(buckets) + 1) + [0]
+            histogram = _histograms[key]
+            # Counted in the first bucket it fits in, made cumulative on render
+            histogram[bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+
+
+def format_labels(labels):
+    def escape(value):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+def render():
+    """
+    Returns every recorded metric in the Prometheus text format
+    """
+    with _lock:
+        requests = sorted(_requests.items())
+        histograms = {key: list(value) for key, value in _histograms.items()}
+
+    lines = [
+        "# HELP http_requests_total Requests handled",
+        "# TYPE http_requests_total counter",
+    ]
+    for labels, count in requests:
+        lines.append(f"http_requests_total{{{format_labels(labels)}}} {count}")
+
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} histogram")
+        for (histogram_name, labels), histogram in sorted(histograms.items()):
+            if histogram_name != name:
+                continue
+            total = 0
+            for bound, count in zip(buckets + ("+Inf",), histogram):
+                total += count
+                bucket_labels = format_labels(labels + (("le", str(bound)),))
+                lines.append(f"{name}_bucket{{{bucket_labels}}} {total}")
+            lines.append(f"{name}_sum{{{format_labels(labels)}}} {histogram[-1]}")
+            lines.append(f"{name}_count{{{format_labels(labels)}}} {total}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _requests.clear()
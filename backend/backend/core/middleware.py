@@ -0,0 +1,221 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.core import metrics
+from backend.core.routers import (
+    PRIMARY,
+    ais_pinned_to_primary,
+    apin_to_primary,
+    is_pinned_to_primary,
+    pin_to_primary,
+    replica_reads,
+)
+
+logger = logging.getLogger(__name__)
+
+# Slow requests log at most this many of their SQL statements
+MAX_LOGGED_QUERIES = 50
+
+
+class QueryTracker:
+    """
+    Database execute wrapper counting and timing the queries of a request
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if len(self.statements) < MAX_LOGGED_QUERIES:
+                self.statements.append((elapsed, sql))
+
+
+def track_queries(tracker):
+    """
+    Wraps the connections of the calling thread with the tracker until the
+    returned ExitStack is closed, through execute_wrapper() so it nests with
+    any other wrappers. Connections are per thread, so it has to be entered
+    and closed in the thread that makes the request's queries
+    """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(tracker))
+    return stack
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the wall time, query count, SQL time, serializer time and response
+    size of every request
+
+    They are sent back in a Server-Timing header, added to the histograms
+    served by /metrics/ and logged along with the SQL when a request takes
+    longer than SLOW_REQUEST_MS
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        tracker = QueryTracker()
+        with self.timing_serializers() as timer, track_queries(tracker):
+            start = time.perf_counter()
+            response = self.get_response(request)
+            elapsed = time.perf_counter() - start
+        return self.record(request, response, elapsed, tracker, timer)
+
+    async def __acall__(self, request):
+        # The async views run their queries in the request's sync thread,
+        # which is the one sync_to_async runs these in
+        tracker = QueryTracker()
+        with self.timing_serializers() as timer:
+            stack = await sync_to_async(track_queries)(tracker)
+            try:
+                start = time.perf_counter()
+                response = await self.get_response(request)
+                elapsed = time.perf_counter() - start
+            finally:
+                await sync_to_async(stack.close)()
+        return self.record(request, response, elapsed, tracker, timer)
+
+    @contextmanager
+    def timing_serializers(self):
+        # The serializers add their time through metrics.timing_serializer.
+        # Streamed bodies are serialized after the request is recorded
+        timer = metrics.SerializerTimer()
+        token = metrics.serializer_timer.set(timer)
+        try:
+            yield timer
+        finally:
+            metrics.serializer_timer.reset(token)
+
+    def record(self, request, response, elapsed, tracker, timer):
+        # Routes rather than paths as labels, so ids don't make new series
+        match = request.resolver_match
+        route = match.route if match else "<unmatched>"
+        values = {
+            "http_request_duration_seconds": elapsed,
+            "http_request_db_queries": tracker.count,
+            "http_request_db_seconds": tracker.seconds,
+            "http_request_serializer_seconds": timer.seconds,
+        }
+        if not response.streaming:
+            values["http_response_bytes"] = len(response.content)
+        metrics.record_request(request.method, route, response.status_code, values)
+
+        timing = (
+            f"app;dur={elapsed * 1000:.1f}, "
+            f'db;dur={tracker.seconds * 1000:.1f};desc="{tracker.count} queries", '
+            f"serialize;dur={timer.seconds * 1000:.1f}"
+        )
+        if response.has_header("Server-Timing"):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response["Server-Timing"] = timing
+
+        if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+            logger.warning(
+                "Slow request %s %s took %.0fms, %d queries in %.0fms%s",
+                request.method,
+                request.get_full_path(),
+                elapsed * 1000,
+                tracker.count,
+                tracker.seconds * 1000,
+                "".join(
+                    f"\n  {seconds * 1000:.1f}ms {sql}"
+                    for seconds, sql in tracker.statements
+                ),
+            )
+
+        return response
+
+
+def token_user_id(request):
+    # The user id in the request's JWT, or None if it has no valid one. DRF
+    # only authenticates in the view, after the middleware has run
+    header = request.headers.get("Authorization", "").split()
+    if len(header) != 2 or header[0] != "Bearer":
+        return None
+    try:
+        return AccessToken(header[1]).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets GET requests read from the read replicas, unless the user wrote
+    something in the last REPLICA_PIN_SECONDS, then they read from the primary
+    so they don't miss their own change while the replicas catch up
+
+    Every other request reads and writes on the primary, and pins its user to
+    the primary when it succeeds
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.enabled = any(alias != PRIMARY for alias in settings.DATABASES)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        user_id = token_user_id(request)
+        if request.method in SAFE_METHODS:
+            if user_id is not None and is_pinned_to_primary(user_id):
+                return self.get_response(request)
+            with replica_reads():
+                return self.get_response(request)
+
+        response = self.get_response(request)
+        if user_id is not None and response.status_code < 400:
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        user_id = token_user_id(request)
+        if request.method in SAFE_METHODS:
+            if user_id is not None and await ais_pinned_to_primary(user_id):
+                return await self.get_response(request)
+            with replica_reads():
+                return await self.get_response(request)
+
+        response = await self.get_response(request)
+        if user_id is not None and response.status_code < 400:
+            await apin_to_primary(user_id)
+        return response
@@ -0,0 +1,87 @@
+from django.db import migrations
+
+
+# SQLite keeps an external content FTS5 table over core_listing, the
+# triggers keep it in sync on every insert, update and delete
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE core_listing_fts USING fts5(
+        title,
+        description,
+        content='core_listing',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER core_listing_fts_insert AFTER INSERT ON core_listing BEGIN
+        INSERT INTO core_listing_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_listing_fts_delete AFTER DELETE ON core_listing BEGIN
+        INSERT INTO core_listing_fts(core_listing_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_listing_fts_update AFTER UPDATE OF title, description
+    ON core_listing BEGIN
+        INSERT INTO core_listing_fts(core_listing_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO core_listing_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    # Index any listings that already exist
+    "INSERT INTO core_listing_fts(core_listing_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS core_listing_fts_update",
+    "DROP TRIGGER IF EXISTS core_listing_fts_delete",
+    "DROP TRIGGER IF EXISTS core_listing_fts_insert",
+    "DROP TABLE IF EXISTS core_listing_fts",
+]
+
+# PostgreSQL computes the tsvector from the row, so a GIN expression index
+# is enough and there is nothing to keep in sync
+POSTGRESQL_FORWARD = [
+    """
+    CREATE INDEX core_listing_search_idx ON core_listing USING GIN (
+        to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, ''))
+    )
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS core_listing_search_idx",
+]
+
+
+def run_for_vendor(sqlite, postgresql):
+    def run(apps, schema_editor):
+        statements = {
+            "sqlite": sqlite,
+            "postgresql": postgresql,
+        }.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0030_alter_review_rating"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(SQLITE_FORWARD, POSTGRESQL_FORWARD),
+            run_for_vendor(SQLITE_BACKWARD, POSTGRESQL_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:52
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    User = apps.get_model("core", "User")
+    Review = apps.get_model("core", "Review")
+    for row in Review.objects.values("user").annotate(
+        count=Count("id"), total=Sum("rating")
+    ):
+        User.objects.filter(pk=row["user"]).update(
+            rating_count=row["count"], rating_total=row["total"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0031_listing_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="rating_total",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
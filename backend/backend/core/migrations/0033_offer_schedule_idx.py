@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0032_user_rating_aggregate"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="offer",
+            index=models.Index(
+                fields=["listing", "status", "scheduled_start", "scheduled_end"],
+                name="offer_schedule_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+from backend.core.geo import encode_geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    ListingLocation = apps.get_model("core", "ListingLocation")
+    locations = ListingLocation.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    )
+    for location in locations:
+        location.geohash = encode_geohash(location.latitude, location.longitude)
+    ListingLocation.objects.bulk_update(locations, ["geohash"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0033_offer_schedule_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="listinglocation",
+            name="geohash",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=9, null=True
+            ),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0034_listinglocation_geohash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="listingphoto",
+            name="variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0035_listingphoto_variants"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="offer",
+            name="offered_by",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="offers_made",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="review",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reviews_received",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="transactions",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="listing",
+            index=models.Index(fields=["created_at", "id"], name="listing_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="listing",
+            index=models.Index(
+                fields=["category", "listing_type", "created_at", "id"],
+                name="listing_browse_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="listingrate",
+            index=models.Index(
+                fields=["time_unit", "rate"], name="listingrate_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="offer",
+            index=models.Index(
+                fields=["offered_by", "created_at"], name="offer_made_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(fields=["user", "created_at"], name="review_user_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "created_at"], name="transaction_user_idx"
+            ),
+        ),
+    ]
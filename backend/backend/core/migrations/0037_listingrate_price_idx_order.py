@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0036_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="listingrate",
+            name="listingrate_price_idx",
+        ),
+        migrations.AddIndex(
+            model_name="listingrate",
+            index=models.Index(
+                fields=["time_unit", "rate", "id", "listing"],
+                name="listingrate_price_idx",
+            ),
+        ),
+    ]
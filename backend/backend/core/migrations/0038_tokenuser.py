@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 21:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0037_listingrate_price_idx_order"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TokenUser",
+            fields=[],
+            options={
+                "proxy": True,
+                "indexes": [],
+                "constraints": [],
+            },
+            bases=("core.user",),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.1.1 on 2026-10-18 21:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+OFFER_STATUS_NAMES = {
+    "P": "pending",
+    "A": "accepted",
+    "R": "rejected",
+    "D": "paid",
+    "C": "declined",
+}
+
+
+def backfill_summaries(apps, schema_editor):
+    Listing = apps.get_model("core", "Listing")
+    Offer = apps.get_model("core", "Offer")
+    Transaction = apps.get_model("core", "Transaction")
+    UserSummary = apps.get_model("core", "UserSummary")
+    summaries = {}
+
+    def summary(user_id):
+        if user_id not in summaries:
+            summaries[user_id] = UserSummary(user_id=user_id)
+        return summaries[user_id]
+
+    for row in Listing.objects.values("uploaded_by").annotate(count=Count("id")):
+        summary(row["uploaded_by"]).active_listings = row["count"]
+
+    for side, user_field in (
+        ("made", "offered_by"),
+        ("received", "listing__uploaded_by"),
+    ):
+        offers = Offer.objects.values(user_field, "status").annotate(count=Count("id"))
+        for row in offers:
+            name = OFFER_STATUS_NAMES[row["status"]]
+            setattr(summary(row[user_field]), f"{side}_{name}", row["count"])
+
+    completed = Transaction.objects.filter(status="C")
+    for field, user_field in (
+        ("spent", "user"),
+        ("earned", "offer__listing__uploaded_by"),
+    ):
+        for row in completed.values(user_field).annotate(total=Sum("amount")):
+            setattr(summary(row[user_field]), field, row["total"])
+
+    UserSummary.objects.bulk_create(summaries.values(), 1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0038_tokenuser"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserSummary",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("active_listings", models.IntegerField(default=0)),
+                ("received_pending", models.IntegerField(default=0)),
+                ("received_accepted", models.IntegerField(default=0)),
+                ("received_rejected", models.IntegerField(default=0)),
+                ("received_paid", models.IntegerField(default=0)),
+                ("received_declined", models.IntegerField(default=0)),
+                ("made_pending", models.IntegerField(default=0)),
+                ("made_accepted", models.IntegerField(default=0)),
+                ("made_rejected", models.IntegerField(default=0)),
+                ("made_paid", models.IntegerField(default=0)),
+                ("made_declined", models.IntegerField(default=0)),
+                (
+                    "earned",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "spent",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
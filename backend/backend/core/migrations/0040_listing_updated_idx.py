@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 21:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0039_usersummary"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="listing",
+            index=models.Index(fields=["updated_at", "id"], name="listing_updated_idx"),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from decimal import Decimal
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import (
@@ -9,6 +12,10 @@ from django.contrib.auth.models import (
 )
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.hashers import make_password
+from rest_framework.exceptions import AuthenticationFailed
+
+from backend.core import user_cache
+from backend.core.geo import GEOHASH_PRECISION, encode_geohash
 
 
 # The different category types
@@ -62,6 +69,35 @@ class UserManager(BaseUserManager):
 
         return user
 
+    # Shift the stored rating aggregate of a user by the given amounts,
+    # done in the database so concurrent reviews don't overwrite each other
+    def adjust_rating(self, user_id, count, total):
+        self.filter(pk=user_id).update(
+            rating_count=F("rating_count") + count,
+            rating_total=F("rating_total") + total,
+        )
+        user_cache.invalidate(user_id)
+
+    # Recompute every user's rating aggregate from their reviews, for after
+    # bulk writes that skip Review.save, returns the number of reviewed users
+    def rebuild_ratings(self, batch_size=1000):
+        with transaction.atomic():
+            # Users without any reviews go back to zero
+            self.update(rating_count=0, rating_total=0)
+
+            aggregates = Review.objects.values("user").annotate(
+                count=Count("id"), total=Sum("rating")
+            )
+            users = [
+                self.model(
+                    id=row["user"], rating_count=row["count"], rating_total=row["total"]
+                )
+                for row in aggregates.iterator()
+            ]
+            self.bulk_update(users, ["rating_count", "rating_total"], batch_size)
+        user_cache.clear()
+        return len(users)
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(max_length=255, unique=True)
@@ -70,6 +106,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     # 8 for singapore only
     phone_number = models.CharField(max_length=8, unique=True)
     biography = models.TextField(blank=True)
+    # Running aggregate of the reviews received, kept up to date by Review
+    # so the average rating doesn't need a query per serialized user
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
 
     objects = UserManager()
 
@@ -81,6 +121,12 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.email
 
+    @property
+    def average_rating(self):
+        if self.rating_count == 0:
+            return 0
+        return self.rating_total / self.rating_count
+
     def update_username(self, username: str):
         self.username = username
         self.save()
@@ -100,6 +146,51 @@ class User(AbstractBaseUser, PermissionsMixin):
         self.save()
 
 
+class TokenUser(User):
+    """
+    The user of an access token, built from its claims without a query. The
+    rest of the row is loaded in one go the first time anything beyond the
+    claims is read, from the recently authenticated users of this process
+    when it is there
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_values(cls, values):
+        # Fields missing from values are deferred, from_db wants the loaded
+        # ones in the order of the model's fields
+        names = [f.attname for f in cls._meta.concrete_fields if f.attname in values]
+        return cls.from_db(None, names, [values[name] for name in names])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if from_queryset is not None or (
+            fields is not None and not deferred.issuperset(fields)
+        ):
+            return super().refresh_from_db(using, fields, from_queryset)
+
+        # An explicit refresh always reads the database
+        row = user_cache.get_row(self.pk) if fields is not None else None
+        if row is None:
+            row = (
+                User._base_manager.db_manager(using, hints={"instance": self})
+                .filter(pk=self.pk)
+                .values(*[f.attname for f in self._meta.concrete_fields])
+                .first()
+            )
+            # The token outlived its user
+            if row is None:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            user_cache.set_row(self.pk, row)
+
+        # Fields set since the claims were read are kept, unless refreshing
+        for attname, value in row.items():
+            if fields is None or attname in deferred:
+                setattr(self, attname, value)
+
+
 class Listing(models.Model):
     # If user is deleted, then delete all their listings as well
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -116,6 +207,27 @@ class Listing(models.Model):
         max_length=2, choices=ListingType.choices, default=ListingType.RENTAL
     )
 
+    class Meta:
+        indexes = [
+            # Browsing is newest first, either unfiltered or filtered by
+            # category and listing type, the id breaks ties for the keyset
+            models.Index(fields=["created_at", "id"], name="listing_created_idx"),
+            models.Index(
+                fields=["category", "listing_type", "created_at", "id"],
+                name="listing_browse_idx",
+            ),
+            # Exports are oldest change first, from updated_since onwards
+            models.Index(fields=["updated_at", "id"], name="listing_updated_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The owner's summary counts their listings
+        with transaction.atomic():
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding:
+                UserSummary.objects.adjust(self.uploaded_by_id, active_listings=1)
+
     def update_title(self, title: str):
         self.title = title
         self.save()
@@ -136,6 +248,9 @@ class Listing(models.Model):
 class ListingPhoto(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
     image_url = models.ImageField(upload_to="listings/")
+    # Resized copies of the photo, {format: {width: file name}}, filled in
+    # by a background worker after upload
+    variants = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Photo for {self.listing.title}"
@@ -153,6 +268,15 @@ class ListingRate(models.Model):
 
     class Meta:
         unique_together = ["listing", "time_unit"]
+        indexes = [
+            # Price sorting reads the rates of one time unit in price order,
+            # the id breaks ties and the listing is read straight off the
+            # index, so a page is a range scan with no sort
+            models.Index(
+                fields=["time_unit", "rate", "id", "listing"],
+                name="listingrate_price_idx",
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -168,10 +292,29 @@ class ListingLocation(models.Model):
     longitude = models.FloatField(null=True, blank=True)
     query = models.CharField(max_length=255, null=True, blank=True)
     notes = models.TextField(null=True, blank=True)
+    # Spatial index for nearby searches, derived from the latitude and longitude
+    geohash = models.CharField(
+        max_length=GEOHASH_PRECISION,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+    )
 
     def __str__(self):
         return f"Location (Lat: {self.latitude}, Long: {self.longitude})"
 
+    def update_geohash(self):
+        if self.latitude is None or self.longitude is None:
+            self.geohash = None
+        else:
+            # Coordinates may still be strings straight from the request
+            self.geohash = encode_geohash(float(self.latitude), float(self.longitude))
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        super().save(*args, **kwargs)
+
 
 class Offer(models.Model):
     # The only available statuses for an offer
@@ -189,9 +332,12 @@ class Offer(models.Model):
         (DECLINED, "Declined"),
     ]
 
-    # The user making the offer
+    # Offers in these statuses hold their scheduled slot on the listing
+    BLOCKING_STATUSES = [PENDING, ACCEPTED, PAID]
+
+    # The user making the offer, indexed by offer_made_idx
     offered_by = models.ForeignKey(
-        User, related_name="offers_made", on_delete=models.CASCADE
+        User, related_name="offers_made", on_delete=models.CASCADE, db_index=False
     )
 
     # Link back to the listing
@@ -217,43 +363,108 @@ class Offer(models.Model):
     )
     time_delta = models.IntegerField(default=1)
 
+    class Meta:
+        indexes = [
+            # Backs the schedule collision check, the listing and status are
+            # matched exactly and the scheduled range is scanned in order
+            models.Index(
+                fields=["listing", "status", "scheduled_start", "scheduled_end"],
+                name="offer_schedule_idx",
+            ),
+            # The offers a user made, newest first, it also serves the
+            # offered_by foreign key
+            models.Index(fields=["offered_by", "created_at"], name="offer_made_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # A new offer is counted in the summaries of both sides
+        with transaction.atomic():
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding:
+                self.count_status(self.status, 1)
+
+    # Shift the count of offers in this status, for whoever made the offer
+    # and the owner of the listing
+    def count_status(self, status, delta):
+        name = UserSummary.OFFER_STATUS_NAMES[status]
+        UserSummary.objects.adjust(self.offered_by_id, **{f"made_{name}": delta})
+        UserSummary.objects.adjust(
+            self.listing_owner_id(), **{f"received_{name}": delta}
+        )
+
+    def listing_owner_id(self):
+        # Only the owner's id, cascading deletes of a listing's offers come
+        # here once per offer and would otherwise load the listing each time
+        if Offer.listing.is_cached(self):
+            return self.listing.uploaded_by_id
+        return (
+            Listing.objects.filter(pk=self.listing_id)
+            .values_list("uploaded_by_id", flat=True)
+            .first()
+        )
+
+    def move_to(self, status):
+        # Changes the status, moving the offer to the matching counters. The
+        # row is only written while it still has the status read here, so of
+        # two concurrent changes to the same offer only one is counted
+        with transaction.atomic():
+            previous = self.status
+            moved = Offer.objects.filter(pk=self.pk, status=previous).update(
+                status=status
+            )
+            if not moved:
+                # Changed by someone else in the meantime
+                self.refresh_from_db(fields=["status"])
+                return
+            self.status = status
+            # update() sends no signals, the cached availability still has to
+            # hear about the change
+            post_save.send(
+                sender=Offer,
+                instance=self,
+                created=False,
+                update_fields=frozenset(["status"]),
+                raw=False,
+                using=self._state.db,
+            )
+            self.count_status(previous, -1)
+            self.count_status(status, 1)
+
     # for the original listing owner to accept
     def accept(self):
         if self.status == self.PENDING:
-            self.status = self.ACCEPTED
-            self.save()
+            self.move_to(self.ACCEPTED)
 
     # for the original listing owner to reject
     def reject(self):
         if self.status == self.PENDING:
-            self.status = self.REJECTED
-            self.save()
+            self.move_to(self.REJECTED)
 
     def paid(self):
         if self.status == self.ACCEPTED:
-            self.status = self.PAID
-            self.save()
+            self.move_to(self.PAID)
 
     def decline(self):
         if self.status == self.ACCEPTED:
-            self.status = self.DECLINED
-            self.save()
+            self.move_to(self.DECLINED)
 
 
 class Review(models.Model):
     reviewer = models.ForeignKey(
         User, related_name="reviews_given", on_delete=models.CASCADE
     )
-    # Reference to the user being reviewed
+    # Reference to the user being reviewed, indexed by review_user_idx
     user = models.ForeignKey(
         User,
         related_name="reviews_received",
         on_delete=models.CASCADE,
+        db_index=False,
     )
     rating = models.PositiveSmallIntegerField(
         validators=[
             MinValueValidator(0.5, message="Rating must be at least 0.5"),
-            MaxValueValidator(5, message="Rating cannot exceed 5")
+            MaxValueValidator(5, message="Rating cannot exceed 5"),
         ]
     )
     # Optional description for the review
@@ -261,6 +472,41 @@ class Review(models.Model):
     # Automatically set the time when the review was created
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A user's reviews, newest first
+            models.Index(fields=["user", "created_at"], name="review_user_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The review and the reviewed user's rating aggregate change together
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = (
+                    Review.objects.filter(pk=self.pk)
+                    .values_list("user_id", "rating")
+                    .first()
+                )
+
+            super().save(*args, **kwargs)
+
+            if previous is not None:
+                User.objects.adjust_rating(previous[0], -1, -previous[1])
+            User.objects.adjust_rating(self.user_id, 1, self.rating)
+
+        # Keep an already loaded reviewed user in step with the database
+        if previous is None and Review.user.is_cached(self):
+            self.user.rating_count += 1
+            self.user.rating_total += self.rating
+
+
+# Deletes go through a signal rather than Review.delete so that queryset
+# and cascade deletes are counted too, this runs inside the delete transaction
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    User.objects.adjust_rating(instance.user_id, -1, -instance.rating)
+
 
 class Transaction(models.Model):
     PENDING = "P"
@@ -275,8 +521,9 @@ class Transaction(models.Model):
         (REFUNDED, "Refunded"),
     ]
 
+    # Indexed by transaction_user_idx
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="transactions"
+        User, on_delete=models.CASCADE, related_name="transactions", db_index=False
     )
     offer = models.ForeignKey(
         Offer, on_delete=models.CASCADE, related_name="transactions"
@@ -287,10 +534,38 @@ class Transaction(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     payment_id = models.TextField()
 
+    class Meta:
+        indexes = [
+            # A user's transaction history, newest first
+            models.Index(fields=["user", "created_at"], name="transaction_user_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Only completed transactions count towards what was earned and spent
+        with transaction.atomic():
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding and self.status == self.COMPLETED:
+                self.count_amount(1)
+
+    # Shift what the payer spent and the listing owner earned by the amount,
+    # in the direction of sign
+    def count_amount(self, sign):
+        amount = sign * Decimal(str(self.amount))
+        owner_id = (
+            Offer.objects.filter(pk=self.offer_id)
+            .values_list("listing__uploaded_by", flat=True)
+            .get()
+        )
+        UserSummary.objects.adjust(self.user_id, spent=amount)
+        UserSummary.objects.adjust(owner_id, earned=amount)
+
     def complete(self):
         if self.status == self.PENDING:
-            self.status = self.COMPLETED
-            self.save()
+            with transaction.atomic():
+                self.status = self.COMPLETED
+                self.save()
+                self.count_amount(1)
 
     def fail(self):
         if self.status == self.PENDING:
@@ -299,13 +574,131 @@ class Transaction(models.Model):
 
     def refund(self):
         if self.status == self.COMPLETED:
-            self.status = self.REFUNDED
-            self.save()
+            with transaction.atomic():
+                self.status = self.REFUNDED
+                self.save()
+                self.count_amount(-1)
 
     def __str__(self):
         return f"Transaction {self.id} - {self.get_status_display()} - {self.amount}"
 
 
+class UserSummaryManager(models.Manager):
+    # Shift the counters of a user's summary by the given amounts, done in
+    # the database so concurrent changes don't overwrite each other
+    def adjust(self, user_id, **deltas):
+        changes = {field: F(field) + delta for field, delta in deltas.items()}
+        if self.filter(user_id=user_id).update(**changes):
+            return
+        # Summaries are made on the first count going up, so deleting a
+        # user's offers along with them doesn't make them a new one
+        if all(delta > 0 for delta in deltas.values()):
+            try:
+                with transaction.atomic():
+                    self.create(user_id=user_id)
+            except IntegrityError:
+                # Another first count made it in the meantime
+                pass
+            self.filter(user_id=user_id).update(**changes)
+
+    # Recompute every summary from the listings, offers and transactions,
+    # for after bulk writes that skip save, returns the number of summaries
+    def rebuild(self, batch_size=1000):
+        summaries = {}
+
+        def summary(user_id):
+            if user_id not in summaries:
+                summaries[user_id] = self.model(user_id=user_id)
+            return summaries[user_id]
+
+        listings = Listing.objects.values("uploaded_by").annotate(count=Count("id"))
+        for row in listings.iterator():
+            summary(row["uploaded_by"]).active_listings = row["count"]
+
+        for side, user_field in (
+            ("made", "offered_by"),
+            ("received", "listing__uploaded_by"),
+        ):
+            offers = Offer.objects.values(user_field, "status").annotate(
+                count=Count("id")
+            )
+            for row in offers.iterator():
+                name = self.model.OFFER_STATUS_NAMES[row["status"]]
+                setattr(summary(row[user_field]), f"{side}_{name}", row["count"])
+
+        completed = Transaction.objects.filter(status=Transaction.COMPLETED)
+        for field, user_field in (
+            ("spent", "user"),
+            ("earned", "offer__listing__uploaded_by"),
+        ):
+            totals = completed.values(user_field).annotate(total=Sum("amount"))
+            for row in totals.iterator():
+                setattr(summary(row[user_field]), field, row["total"])
+
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(summaries.values(), batch_size)
+        return len(summaries)
+
+
+class UserSummary(models.Model):
+    """
+    The counts and totals of a user's dashboard, kept up to date as their
+    listings, offers and transactions change so reading it is a single row
+    """
+
+    # The column suffix of each offer status
+    OFFER_STATUS_NAMES = {
+        Offer.PENDING: "pending",
+        Offer.ACCEPTED: "accepted",
+        Offer.REJECTED: "rejected",
+        Offer.PAID: "paid",
+        Offer.DECLINED: "declined",
+    }
+
+    user = models.OneToOneField(
+        User, primary_key=True, related_name="summary", on_delete=models.CASCADE
+    )
+    active_listings = models.IntegerField(default=0)
+
+    # Offers on the user's listings, by status
+    received_pending = models.IntegerField(default=0)
+    received_accepted = models.IntegerField(default=0)
+    received_rejected = models.IntegerField(default=0)
+    received_paid = models.IntegerField(default=0)
+    received_declined = models.IntegerField(default=0)
+
+    # Offers the user made, by status
+    made_pending = models.IntegerField(default=0)
+    made_accepted = models.IntegerField(default=0)
+    made_rejected = models.IntegerField(default=0)
+    made_paid = models.IntegerField(default=0)
+    made_declined = models.IntegerField(default=0)
+
+    # Completed transactions, on the user's listings and by the user
+    earned = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    objects = UserSummaryManager()
+
+
+# Deletes go through signals like the reviews', so cascades are counted too
+@receiver(post_delete, sender=Listing)
+def remove_listing_count(sender, instance, **kwargs):
+    UserSummary.objects.adjust(instance.uploaded_by_id, active_listings=-1)
+
+
+@receiver(post_delete, sender=Offer)
+def remove_offer_count(sender, instance, **kwargs):
+    instance.count_status(instance.status, -1)
+
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_amount(sender, instance, **kwargs):
+    if instance.status == Transaction.COMPLETED:
+        instance.count_amount(-1)
+
+
 class Report(models.Model):
     reporter = models.ForeignKey(
         "User", on_delete=models.SET_NULL, null=True, related_name="reports_filed"
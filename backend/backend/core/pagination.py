@@ -0,0 +1,163 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPaginator:
+    """
+    Keyset (cursor) pagination over a fixed ordering
+
+    The ordering is a list of (field, descending) pairs and must end in a
+    unique field (usually id) so every row has a distinct position.
+    Instead of OFFSET, each page filters for rows strictly after the last
+    row of the previous page, so deep pages cost the same as page one.
+
+    Cursors are opaque to the client, they are the base64 encoded sort key
+    of the boundary row plus the direction to read in.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    default_page_size = 20
+    max_page_size = 100
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    # Only paginate when the client asks for it, the frontend still expects
+    # the full list when neither parameter is given
+    @classmethod
+    def is_requested(cls, request):
+        return (
+            cls.cursor_query_param in request.query_params
+            or cls.page_size_query_param in request.query_params
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(
+                request.query_params.get(
+                    self.page_size_query_param, self.default_page_size
+                )
+            )
+        except ValueError:
+            raise InvalidCursor("Invalid page size")
+        if page_size < 1:
+            raise InvalidCursor("Invalid page size")
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, row, reverse):
+        position = []
+        for field, _ in self.ordering:
+            value = getattr(row, field)
+            # isoformat keeps the microseconds, so the boundary is exact
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            position.append(value)
+
+        payload = json.dumps({"p": position, "r": reverse}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position, reverse = payload["p"], bool(payload["r"])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise InvalidCursor("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise InvalidCursor("Invalid cursor")
+        return position, reverse
+
+    # Builds (a > x) OR (a = x AND b > y) ... for the given ordering
+    def _after(self, ordering, position):
+        clauses = []
+        for i, (field, descending) in enumerate(ordering):
+            lookup = "lt" if descending else "gt"
+            equal = {f: v for (f, _), v in zip(ordering[:i], position[:i])}
+            clauses.append(Q(**equal, **{f"{field}__{lookup}": position[i]}))
+        return reduce(or_, clauses)
+
+    def paginate(self, queryset, request):
+        """
+        Returns (rows, next_url, previous_url) for the requested page
+        """
+        queryset, page = self.get_page_queryset(queryset, request)
+        return self.get_links(list(queryset), request, *page)
+
+    async def apaginate(self, queryset, request):
+        queryset, page = self.get_page_queryset(queryset, request)
+        return self.get_links([row async for row in queryset], request, *page)
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Returns the unevaluated queryset of the requested page, plus its
+        (page_size, position, reverse) for get_links
+        """
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+
+        position, reverse = None, False
+        if cursor:
+            position, reverse = self.decode_cursor(cursor)
+
+        # Reading backwards is the same query with the ordering flipped
+        ordering = [
+            (field, descending != reverse) for field, descending in self.ordering
+        ]
+        queryset = queryset.order_by(
+            *[f"-{field}" if descending else field for field, descending in ordering]
+        )
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(ordering, position))
+            except (ValidationError, ValueError, TypeError):
+                raise InvalidCursor("Invalid cursor")
+
+        # Fetch one extra row to know if there is anything beyond this page
+        return queryset[: page_size + 1], (page_size, position, reverse)
+
+    def get_links(self, rows, request, page_size, position, reverse):
+        # Returns (rows, next_url, previous_url) from the rows of the page
+        # queryset
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if reverse:
+                next_cursor = self.encode_cursor(rows[-1], False)
+                if has_more:
+                    previous_cursor = self.encode_cursor(rows[0], True)
+            else:
+                if has_more:
+                    next_cursor = self.encode_cursor(rows[-1], False)
+                if position is not None:
+                    previous_cursor = self.encode_cursor(rows[0], True)
+
+        return (
+            rows,
+            self._url(request, next_cursor),
+            self._url(request, previous_cursor),
+        )
+
+    def _url(self, request, cursor):
+        if cursor is None:
+            return None
+        url = request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
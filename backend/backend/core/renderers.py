@@ -0,0 +1,65 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    # Optional, everything is encoded by the standard library without it
+    orjson = None  # type: ignore[assignment]
+
+# orjson hands datetimes to the encoder's default like everything else it
+# can't encode, so they come out the same as with the standard library
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+)
+
+
+def use_orjson():
+    return orjson is not None and settings.FAST_JSON
+
+
+def dumps(data, encoder=DjangoJSONEncoder):
+    """
+    data as JSON bytes, through orjson when it is installed and FAST_JSON is
+    on. Decimals, datetimes, UUIDs and lazy strings are encoded by encoder
+    either way
+    """
+    if not use_orjson():
+        return json.dumps(data, cls=encoder).encode()
+    return orjson.dumps(data, default=encoder().default, option=ORJSON_OPTIONS)
+
+
+class FastJsonResponse(JsonResponse):
+    """
+    JsonResponse encoded with dumps, large lists spend most of their time
+    being encoded
+    """
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        # Skips JsonResponse.__init__, which encodes with the standard library
+        HttpResponse.__init__(self, content=dumps(data, encoder), **kwargs)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    DRF's JSONRenderer encoding with dumps. Indented responses, asked for
+    through the Accept header, still go through the standard library
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent or not use_orjson():
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data, self.encoder_class)
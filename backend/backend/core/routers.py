@@ -0,0 +1,125 @@
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "default"
+
+# Users who wrote recently, they read from the primary until this expires,
+# the cache has to be shared by the workers for this to cover all of them
+PIN_KEY = "replica-pin:{}"
+
+# How long a replica's measured lag is trusted before measuring it again
+LAG_CHECK_SECONDS = 5
+
+# Zero when the replica has replayed everything it received, even if the
+# primary has been idle for a while
+LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+# Off by default, so only code inside replica_reads ever reads from a replica
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY.format(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(user_id):
+    return cache.get(PIN_KEY.format(user_id), False)
+
+
+async def apin_to_primary(user_id):
+    await cache.aset(PIN_KEY.format(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+async def ais_pinned_to_primary(user_id):
+    return await cache.aget(PIN_KEY.format(user_id), False)
+
+
+def replica_lag(alias):
+    # Returns how many seconds the replica is behind the primary
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaRouter:
+    """
+    Sends reads made inside replica_reads to the replica databases in turn,
+    skipping replicas that lag more than REPLICA_MAX_LAG_SECONDS or can't be
+    reached, and falls back to the primary when none is usable
+
+    Writes, migrations and every other read go to the primary
+    """
+
+    def __init__(self, replicas=None):
+        if replicas is None:
+            replicas = [alias for alias in settings.DATABASES if alias != PRIMARY]
+        self.replicas = replicas
+        self.turn = itertools.count()
+        # {alias: (monotonic time checked, usable)}
+        self.health = {}
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or not _replica_reads.get():
+            return PRIMARY
+
+        first = next(self.turn)
+        for i in range(len(self.replicas)):
+            alias = self.replicas[(first + i) % len(self.replicas)]
+            if self.is_usable(alias):
+                return alias
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every database holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db == PRIMARY
+
+    def is_usable(self, alias):
+        checked = self.health.get(alias)
+        if checked and time.monotonic() - checked[0] < LAG_CHECK_SECONDS:
+            return checked[1]
+
+        try:
+            lag = replica_lag(alias)
+            usable = lag <= settings.REPLICA_MAX_LAG_SECONDS
+            if not usable:
+                logger.warning("Replica %s is %.1fs behind, skipping it", alias, lag)
+        except DatabaseError:
+            logger.exception("Replica %s can't be reached, skipping it", alias)
+            usable = False
+        self.health[alias] = (time.monotonic(), usable)
+        return usable
@@ -0,0 +1,72 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Only word characters make it into the index query, this also keeps the
+# user's input from being read as FTS / tsquery syntax
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+POSTGRESQL_DOCUMENT = (
+    "to_tsvector('english', coalesce(core_listing.title, '') || ' ' "
+    "|| coalesce(core_listing.description, ''))"
+)
+
+
+def search_terms(query: str) -> list[str]:
+    return TERM_RE.findall(query.lower())
+
+
+def search_listings(queryset, query: str):
+    """
+    Filters a Listing queryset down to the listings matching the search query
+
+    Every term must match and each term is matched as a prefix, so partial
+    words typed into the search bar still match.
+    Matching listings are annotated with search_rank, lower is more relevant.
+
+    SQLite is served from the core_listing_fts FTS5 table and PostgreSQL from
+    the GIN tsvector index, other databases fall back to a substring scan.
+    """
+    terms = search_terms(query)
+
+    if terms and connection.vendor == "sqlite":
+        # Every term is quoted and searched as a prefix, terms are ANDed
+        match = " ".join(f'"{term}"*' for term in terms)
+        # bm25 is already lower is better
+        return queryset.filter(
+            id__in=RawSQL(
+                "SELECT rowid FROM core_listing_fts WHERE core_listing_fts MATCH %s",
+                (match,),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                "SELECT bm25(core_listing_fts) FROM core_listing_fts "
+                "WHERE core_listing_fts MATCH %s "
+                "AND core_listing_fts.rowid = core_listing.id",
+                (match,),
+                output_field=FloatField(),
+            )
+        )
+
+    if terms and connection.vendor == "postgresql":
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        # ts_rank is higher is better, negate it so both backends sort the same
+        return queryset.filter(
+            RawSQL(
+                f"{POSTGRESQL_DOCUMENT} @@ to_tsquery('english', %s)",
+                (tsquery,),
+                output_field=BooleanField(),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"-ts_rank({POSTGRESQL_DOCUMENT}, to_tsquery('english', %s))",
+                (tsquery,),
+                output_field=FloatField(),
+            )
+        )
+
+    return queryset.filter(
+        Q(title__icontains=query) | Q(description__icontains=query)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -1,8 +1,12 @@
 import json
-from rest_framework import serializers
+from decimal import Decimal
+from django.core.files.storage import default_storage
+from django.db import transaction
+from rest_framework import exceptions, serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from django.db.models import Avg
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import update_last_login
 from backend.core.models import (
     User,
     Category,
@@ -15,11 +19,38 @@ from backend.core.models import (
     Review,
     Offer,
     Transaction,
+    UserSummary,
 )
+from backend.core import metrics
+from backend.core.authentication import add_user_claims
+from backend.core.images import generate_variants_later
+from backend.core.listing_cache import bump_version
 
 
-class UserSerializer(serializers.ModelSerializer):
-    average_rating = serializers.SerializerMethodField()
+class TimedSerializerMixin(serializers.BaseSerializer):
+    """
+    Adds the time serializers take to the request's serializer time, shown by
+    /metrics/ and Server-Timing. Nested serializers are timed as part of the
+    outermost one
+    """
+
+    def to_representation(self, instance):
+        with metrics.timing_serializer():
+            return super().to_representation(instance)
+
+
+# The bases of every serializer here, so none of them goes untimed
+class TimedSerializer(TimedSerializerMixin, serializers.Serializer):
+    pass
+
+
+class TimedModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
+
+
+class UserSerializer(TimedModelSerializer):
+    # Read from the stored rating aggregate on the user, no query needed
+    average_rating = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -35,13 +66,6 @@ class UserSerializer(serializers.ModelSerializer):
         )
         extra_kwargs = {"password": {"write_only": True}}
 
-    def get_average_rating(self, obj):
-        # Get all reviews for received by this user and aggregate the average
-        avg_rating = Review.objects.filter(user=obj).aggregate(Avg("rating"))[
-            "rating__avg"
-        ]
-        return avg_rating if avg_rating is not None else 0
-
     def get_avatar(self, obj):
         if obj.avatar:
             return self.context["request"].build_absolute_uri(obj.avatar.url)
@@ -102,26 +126,41 @@ class UserUpdateSerializer(UserCreateSerializer):
         return instance
 
 
-class ListingPhotoSerializer(serializers.ModelSerializer):
+class ListingPhotoSerializer(TimedModelSerializer):
     image_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ListingPhoto
-        fields = ["image_url"]
+        fields = ["image_url", "srcset"]
+
+    def build_url(self, url):
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
 
     # This will return the a path to the image
     def get_image_url(self, obj):
-        request = self.context.get("request")
         if obj.image_url and hasattr(obj.image_url, "url"):
-            return (
-                request.build_absolute_uri(obj.image_url.url)
-                if request
-                else obj.image_url.url
-            )
+            return self.build_url(obj.image_url.url)
         return None
 
+    # The resized variants per format as a srcset, e.g.
+    # {"webp": "https://.../a_320.webp 320w, https://.../a_640.webp 640w"}
+    # empty until the variants have been generated
+    def get_srcset(self, obj):
+        return {
+            extension: ", ".join(
+                f"{self.build_url(default_storage.url(name))} {width}w"
+                for width, name in sorted(
+                    widths.items(), key=lambda variant: int(variant[0])
+                )
+            )
+            for extension, widths in obj.variants.items()
+            if widths
+        }
 
-class ListingRateSerializer(serializers.ModelSerializer):
+
+class ListingRateSerializer(TimedModelSerializer):
     time_unit = serializers.ChoiceField(choices=TimeUnit.choices)
 
     class Meta:
@@ -129,13 +168,13 @@ class ListingRateSerializer(serializers.ModelSerializer):
         fields = ["time_unit", "rate"]
 
 
-class ListingLocationSerializer(serializers.ModelSerializer):
+class ListingLocationSerializer(TimedModelSerializer):
     class Meta:
         model = ListingLocation
         fields = ["latitude", "longitude", "query", "notes"]
 
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(TimedModelSerializer):
     # the source = listingphoto_set tells django to look for the reverse
     # relationship from Listing -> ListingPhoto
     # i.e. for each Listing, get all ListingPhotos, then serialize it through
@@ -148,6 +187,8 @@ class ListingSerializer(serializers.ModelSerializer):
     rates = ListingRateSerializer(many=True, read_only=True)
     # Optionally required only
     locations = ListingLocationSerializer(many=True, required=False)
+    # Only present for nearby searches, km to the closest location
+    distance = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Listing
@@ -163,6 +204,7 @@ class ListingSerializer(serializers.ModelSerializer):
             "photos",
             "locations",
             "rates",
+            "distance",
         ]
         read_only_fields = ["created_at", "updated_at"]
 
@@ -173,7 +215,7 @@ class ListingSerializer(serializers.ModelSerializer):
 
 # Specific serializer for POSTing a Listing
 # then this will split into the listing and listing_photos table
-class ListingCreateSerializer(serializers.ModelSerializer):
+class ListingCreateSerializer(TimedModelSerializer):
     photos = serializers.ListField(
         child=serializers.ImageField(
             max_length=1000000, allow_empty_file=False, use_url=False
@@ -214,33 +256,67 @@ class ListingCreateSerializer(serializers.ModelSerializer):
         rates_data = json.loads(rates_data)
         location_data = json.loads(location_data)
 
-        # Create the base Listing object
-        listing = Listing.objects.create(**validated_data)
-
-        # Create a listing photo for each object, then link the listing FK back to it
-        for photo in photos_data:
-            ListingPhoto.objects.create(listing=listing, image_url=photo)
+        # All or nothing, a bad rate shouldn't leave a listing without rates
+        with transaction.atomic():
+            # Create the base Listing object
+            listing = Listing.objects.create(**validated_data)
+
+            # Create a listing photo for each object, then link the listing FK back to it
+            photos = ListingPhoto.objects.bulk_create(
+                [
+                    ListingPhoto(listing=listing, image_url=photo)
+                    for photo in photos_data
+                ]
+            )
 
-        # Create listing rating for included rating
-        for rate_data in rates_data:
-            ListingRate.objects.create(
-                listing=listing,
-                time_unit=rate_data["time_unit"],
-                rate=rate_data["rate"],
+            # Create listing rating for included rating
+            ListingRate.objects.bulk_create(
+                [build_rate(listing, rate_data) for rate_data in rates_data]
             )
 
-        for location_data in location_data:
-            ListingLocation.objects.create(
-                listing=listing,
-                latitude=location_data["latitude"],
-                longitude=location_data["longitude"],
-                query=location_data["query"],
-                notes=location_data["notes"],
+            ListingLocation.objects.bulk_create(
+                [build_location(listing, location) for location in location_data]
             )
 
+        # bulk_create skips the model signals
+        transaction.on_commit(bump_version)
+        generate_variants_later(photos)
+
         return listing
 
 
+# A listing's rates are unique by time unit, so rates are matched on it
+def build_rate(listing, rate_data):
+    return ListingRate(
+        listing=listing,
+        time_unit=rate_data["time_unit"],
+        rate=Decimal(str(rate_data["rate"])),
+    )
+
+
+def build_location(listing, location_data):
+    location = ListingLocation(
+        listing=listing,
+        latitude=location_data["latitude"],
+        longitude=location_data["longitude"],
+        query=location_data["query"],
+        notes=location_data["notes"],
+    )
+    # Normally done in save, which bulk_create skips
+    location.update_geohash()
+    return location
+
+
+# Locations have no natural key, two are the same if every field matches
+def location_key(location):
+    return (
+        None if location.latitude is None else float(location.latitude),
+        None if location.longitude is None else float(location.longitude),
+        location.query,
+        location.notes,
+    )
+
+
 class ListingUpdateSerializer(ListingCreateSerializer):
     id = serializers.IntegerField(required=True)
 
@@ -263,52 +339,88 @@ class ListingUpdateSerializer(ListingCreateSerializer):
         instance.listing_type = validated_data.get(
             "listing_type", instance.listing_type
         )
-        instance.save()
 
-        # Update the photos but not required
-        photos_data = validated_data.get("photos", [])
-        if photos_data:
-            # Delete old photos
-            instance.listingphoto_set.all().delete()
-            # Add new photos
-            for photo in photos_data:
-                ListingPhoto.objects.create(listing=instance, image_url=photo)
-
-        # Update the rates
-        rates_data = validated_data.get("rates", [])
-        rates_data = json.loads(rates_data)
-        if rates_data:
-            # Delete old rates
-            instance.rates.all().delete()
-            # Add new rates
-            for rate_data in rates_data:
-                ListingRate.objects.create(
-                    listing=instance,
-                    time_unit=rate_data["time_unit"],
-                    rate=rate_data["rate"],
+        rates_data = json.loads(validated_data.get("rates", "[]"))
+        location_data = json.loads(validated_data.get("locations", "[]"))
+
+        photos = []
+        with transaction.atomic():
+            instance.save()
+
+            # Update the photos but not required
+            photos_data = validated_data.get("photos", [])
+            if photos_data:
+                # New uploads can't be matched to the old photos, replace them all
+                instance.listingphoto_set.all().delete()
+                photos = ListingPhoto.objects.bulk_create(
+                    [
+                        ListingPhoto(listing=instance, image_url=photo)
+                        for photo in photos_data
+                    ]
                 )
 
-        # Update the locations
-        location_data = validated_data.get("locations", [])
-        location_data = json.loads(location_data)
-        if location_data:
-            # Delete old rates
-            instance.locations.all().delete()
-            # Add new rates
-            for location in location_data:
-                ListingLocation.objects.create(
-                    listing=instance,
-                    latitude=location["latitude"],
-                    longitude=location["longitude"],
-                    query=location["query"],
-                    notes=location["notes"],
-                )
+            # Only the rates that changed are written
+            if rates_data:
+                self.update_rates(instance, rates_data)
+
+            # Only the locations that changed are written
+            if location_data:
+                self.update_locations(instance, location_data)
+
+        # bulk writes skip the model signals
+        transaction.on_commit(bump_version)
+        generate_variants_later(photos)
 
         return instance
 
+    def update_rates(self, instance, rates_data):
+        existing = {rate.time_unit: rate for rate in instance.rates.all()}
+
+        created, updated = [], []
+        for rate_data in rates_data:
+            rate = build_rate(instance, rate_data)
+            current = existing.pop(rate.time_unit, None)
+            if current is None:
+                created.append(rate)
+            elif current.rate != rate.rate:
+                current.rate = rate.rate
+                updated.append(current)
+
+        # Whatever is left over was not in the request
+        if existing:
+            ListingRate.objects.filter(
+                id__in=[rate.id for rate in existing.values()]
+            ).delete()
+        if updated:
+            ListingRate.objects.bulk_update(updated, ["rate"])
+        if created:
+            ListingRate.objects.bulk_create(created)
+
+    def update_locations(self, instance, location_data):
+        # Keyed on every field, a list per key in case of duplicates
+        existing = {}
+        for location in instance.locations.all():
+            existing.setdefault(location_key(location), []).append(location)
+
+        created = []
+        for data in location_data:
+            location = build_location(instance, data)
+            matches = existing.get(location_key(location))
+            if matches:
+                # Unchanged, keep the stored row
+                matches.pop()
+            else:
+                created.append(location)
+
+        stale = [location.id for matches in existing.values() for location in matches]
+        if stale:
+            ListingLocation.objects.filter(id__in=stale).delete()
+        if created:
+            ListingLocation.objects.bulk_create(created)
+
 
 # Serializer for get request
-class OfferSerializer(serializers.ModelSerializer):
+class OfferSerializer(TimedModelSerializer):
     offered_by = serializers.SerializerMethodField()
     listing = serializers.SerializerMethodField()
     status = serializers.ChoiceField(choices=Offer.STATUS_CHOICES, read_only=True)
@@ -347,8 +459,24 @@ class OfferSerializer(serializers.ModelSerializer):
         }
 
 
+# Query parameters for listing offers
+class OfferQuerySerializer(TimedSerializer):
+    listing_id = serializers.IntegerField(required=False)
+    type = serializers.ChoiceField(choices=["received", "made"], default="received")
+    status = serializers.MultipleChoiceField(
+        choices=Offer.STATUS_CHOICES, required=False
+    )
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if "start" in data and "end" in data and data["end"] <= data["start"]:
+            raise serializers.ValidationError("End time must be after start time")
+        return data
+
+
 # Serializer for post request
-class OfferCreateSerializer(serializers.Serializer):
+class OfferCreateSerializer(TimedSerializer):
     offered_by = serializers.StringRelatedField()
     listing_id = serializers.IntegerField()
     price = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -384,7 +512,24 @@ class OfferCreateSerializer(serializers.Serializer):
         )
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+# Query parameters for the availability endpoint
+class AvailabilityQuerySerializer(TimedSerializer):
+    listing_id = serializers.IntegerField()
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if "start" in data and "end" in data and data["end"] <= data["start"]:
+            raise serializers.ValidationError("End time must be after start time")
+        return data
+
+
+class BusyIntervalSerializer(TimedSerializer):
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+
+
+class ReviewSerializer(TimedModelSerializer):
     reviewer = UserSerializer(read_only=True)
     user = UserSerializer(read_only=True)
 
@@ -416,7 +561,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         return Review.objects.create(reviewer=reviewer, user=user, **validated_data)
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(TimedModelSerializer):
     user = UserSerializer(read_only=True)
     offer = OfferSerializer(read_only=True)
     status_display = serializers.CharField(source="get_status_display", read_only=True)
@@ -459,7 +604,104 @@ class TransactionSerializer(serializers.ModelSerializer):
         return transaction
 
 
-class ResetPasswordSerializer(serializers.Serializer):
+# One flat row of a user's transaction history, with the offer, listing and
+# the listing's owner inlined instead of nested serializers
+class TransactionHistorySerializer(TimedModelSerializer):
+    status_display = serializers.CharField(source="get_status_display")
+    offer_id = serializers.IntegerField()
+    scheduled_start = serializers.DateTimeField(source="offer.scheduled_start")
+    scheduled_end = serializers.DateTimeField(source="offer.scheduled_end")
+    time_unit = serializers.CharField(source="offer.time_unit")
+    time_delta = serializers.IntegerField(source="offer.time_delta")
+    listing_id = serializers.IntegerField(source="offer.listing_id")
+    listing_title = serializers.CharField(source="offer.listing.title")
+    # The other side of the transaction, who rented the listing out
+    counterparty_id = serializers.IntegerField(source="offer.listing.uploaded_by_id")
+    counterparty_username = serializers.CharField(
+        source="offer.listing.uploaded_by.username"
+    )
+
+    class Meta:
+        model = Transaction
+        fields = [
+            "id",
+            "amount",
+            "status",
+            "status_display",
+            "created_at",
+            "payment_id",
+            "offer_id",
+            "scheduled_start",
+            "scheduled_end",
+            "time_unit",
+            "time_delta",
+            "listing_id",
+            "listing_title",
+            "counterparty_id",
+            "counterparty_username",
+        ]
+        read_only_fields = fields
+
+
+# Query parameters for the transaction history
+class TransactionQuerySerializer(TimedSerializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    compact = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if "start" in data and "end" in data and data["end"] <= data["start"]:
+            raise serializers.ValidationError("End time must be after start time")
+        return data
+
+
+class ListingExportQuerySerializer(TimedSerializer):
+    updated_since = serializers.DateTimeField(required=False)
+
+
+# A user's dashboard, read from their UserSummary and rating aggregate
+class UserSummarySerializer(TimedModelSerializer):
+    offers_received = serializers.SerializerMethodField()
+    offers_made = serializers.SerializerMethodField()
+    pending_actions = serializers.SerializerMethodField()
+    rating = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserSummary
+        fields = [
+            "offers_received",
+            "offers_made",
+            "pending_actions",
+            "earned",
+            "spent",
+            "rating",
+            "active_listings",
+        ]
+
+    def get_offers_received(self, obj):
+        return {
+            name: getattr(obj, f"received_{name}")
+            for name in UserSummary.OFFER_STATUS_NAMES.values()
+        }
+
+    def get_offers_made(self, obj):
+        return {
+            name: getattr(obj, f"made_{name}")
+            for name in UserSummary.OFFER_STATUS_NAMES.values()
+        }
+
+    # Offers waiting on the user, to accept or reject, and to pay for
+    def get_pending_actions(self, obj):
+        return {
+            "offers_to_answer": obj.received_pending,
+            "offers_to_pay": obj.made_accepted,
+        }
+
+    def get_rating(self, obj):
+        return {"average": obj.user.average_rating, "count": obj.user.rating_count}
+
+
+class ResetPasswordSerializer(TimedSerializer):
     email = serializers.EmailField()
     phone_number = serializers.CharField(max_length=15)
     new_password = serializers.CharField(write_only=True)
@@ -492,6 +734,11 @@ class ResetPasswordSerializer(serializers.Serializer):
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # The access token copies these claims from the refresh token
+        return add_user_claims(super().get_token(user), user)
+
     def validate(self, attrs):
         # First check if the email exists
         email = attrs.get("email")
@@ -504,12 +751,24 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
                 {"email": "No account found with this email address"}, code="no_account"
             )
 
-        # If email exists but password is wrong
+        # If email exists but password is wrong. The password is only hashed
+        # this once, check_password also rehashes it when the configured
+        # hasher or its cost changed since it was stored
         if not user.check_password(password):
             raise serializers.ValidationError(
                 {"password": "Incorrect password"}, code="wrong_password"
             )
 
+        # Otherwise what super().validate does after authenticating again
+        if not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise exceptions.AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+        self.user = user
+
         # If both are correct, return the token
-        data = super().validate(attrs)
+        refresh = self.get_token(user)
+        data = {"refresh": str(refresh), "access": str(refresh.access_token)}
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
         return data
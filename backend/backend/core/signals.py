@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from backend.core.availability import invalidate_busy_intervals
+from backend.core.images import delete_variants
+from backend.core import user_cache
+from backend.core.listing_cache import bump_version
+from backend.core.models import (
+    Listing,
+    ListingLocation,
+    ListingPhoto,
+    ListingRate,
+    Offer,
+    TokenUser,
+    User,
+)
+
+
+# Any new offer or status change (accept, reject, paid, decline) can change
+# which slots of the listing are taken. Cleared once the change commits, a
+# read in between would otherwise cache the intervals from before it
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def offer_changed(sender, instance, **kwargs):
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: invalidate_busy_intervals(listing_id))
+
+
+# Everything the listing browse responses are built from
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=ListingRate)
+@receiver(post_delete, sender=ListingRate)
+@receiver(post_save, sender=ListingPhoto)
+@receiver(post_delete, sender=ListingPhoto)
+@receiver(post_save, sender=ListingLocation)
+@receiver(post_delete, sender=ListingLocation)
+def listing_changed(sender, instance, **kwargs):
+    # Once the change commits, a browse in between would otherwise cache the
+    # listings from before it under the new version
+    transaction.on_commit(bump_version)
+
+
+# Replaced and deleted photos take their resized variants with them, once the
+# delete commits so a rolled back one keeps its files
+@receiver(post_delete, sender=ListingPhoto)
+def photo_deleted(sender, instance, **kwargs):
+    variants = instance.variants
+    transaction.on_commit(lambda: delete_variants(variants))
+
+
+# Signals of the authenticated user's own changes are sent for TokenUser
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=TokenUser)
+@receiver(post_delete, sender=TokenUser)
+def user_changed(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
@@ -0,0 +1,343 @@
+import io
+import multiprocessing
+import random
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from backend.core.images import (
+    VARIANT_DIR,
+    VARIANT_FORMATS,
+    VARIANT_WIDTHS,
+    render_variants,
+)
+from backend.core.listing_cache import bump_version
+from backend.core.models import (
+    Category,
+    Listing,
+    ListingLocation,
+    ListingPhoto,
+    ListingRate,
+    ListingType,
+    Offer,
+    Review,
+    TimeUnit,
+    Transaction,
+    User,
+    UserSummary,
+)
+
+# Every generated user logs in with this password
+PASSWORD = "password"
+
+ITEMS = {
+    Category.ELECTRONICS: ["Drill", "Projector", "Camera", "Speaker", "Laptop"],
+    Category.SUPPLIES: ["Camping Tent", "Ladder", "Wheelbarrow", "Cooler", "Tarp"],
+    Category.SERVICES: ["Plumbing", "Tutoring", "Moving Help", "Aircon Servicing"],
+}
+ADJECTIVES = ["Compact", "Heavy Duty", "Portable", "Reliable", "Affordable", "Pro"]
+AREAS = ["Yishun", "Jurong", "Tampines", "Bishan", "Clementi", "Bedok", "Woodlands"]
+
+# (low, high) rate range per time unit
+RATE_RANGES = {
+    TimeUnit.ONETIME: (30, 300),
+    TimeUnit.HOURLY: (5, 40),
+    TimeUnit.DAILY: (20, 150),
+    TimeUnit.WEEKLY: (80, 600),
+}
+
+# Rough bounding box of Singapore
+LATITUDES = (1.25, 1.45)
+LONGITUDES = (103.65, 103.99)
+
+OFFER_STATUSES = [
+    Offer.PENDING,
+    Offer.ACCEPTED,
+    Offer.REJECTED,
+    Offer.PAID,
+    Offer.DECLINED,
+]
+OFFER_STATUS_WEIGHTS = [4, 2, 2, 3, 1]
+
+# Listings share a handful of generated photos rather than one file each
+PLACEHOLDER_DIR = "listings/placeholders"
+PLACEHOLDER_COLORS = ["#e76f51", "#2a9d8f", "#e9c46a", "#264653"]
+PLACEHOLDER_SIZE = (1600, 1200)
+
+# Arguments of create_chunk in worker processes, set by init_worker
+_worker_state = None
+
+
+def skewed_index(rng, count):
+    # Low indices come up far more often, like the few power users who own
+    # most of the listings and get most of the offers on a marketplace
+    return int(count * rng.random() ** 3)
+
+
+def placeholder_image(color, label, size=PLACEHOLDER_SIZE):
+    # A flat colored JPEG with a label, generated so seeding needs no network
+    image = Image.new("RGB", size, color)
+    ImageDraw.Draw(image).text((size[0] // 20, size[1] // 20), label, fill="white")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return ContentFile(buffer.getvalue())
+
+
+def create_placeholder_photos():
+    """
+    Saves the placeholder photos of every category along with their resized
+    variants, replacing the ones from an earlier run
+
+    Returns {category: [(name, variants)]}
+    """
+    photos = defaultdict(list)
+    for category in ITEMS:
+        for i, color in enumerate(PLACEHOLDER_COLORS):
+            stem = f"placeholder-{category}-{i}"
+            names = [f"{PLACEHOLDER_DIR}/{stem}.jpg"] + [
+                f"{VARIANT_DIR}/{stem}_{width}.{extension}"
+                for width in VARIANT_WIDTHS
+                for extension in VARIANT_FORMATS
+            ]
+            # Storage would otherwise add a random suffix to the reused names
+            for name in names:
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+
+            name = default_storage.save(
+                names[0], placeholder_image(color, str(category.label))
+            )
+            with default_storage.open(name, "rb") as image_file:
+                variants = render_variants(image_file, name)
+            photos[category].append((name, variants))
+    return photos
+
+
+def create_users(user_count, seed=0, batch_size=1000):
+    """
+    Creates user_count users in batches, returning their ids in order
+    """
+    # Hashing is deliberately slow, so every user shares the one hash
+    password = make_password(PASSWORD)
+    # Phone numbers are unique, carry on after the users already there
+    phone_offset = User.objects.count()
+    user_ids = []
+    for start in range(0, user_count, batch_size):
+        users = User.objects.bulk_create(
+            [
+                User(
+                    email=f"user{seed}-{i}@example.com",
+                    username=f"user{i}",
+                    phone_number=str(10000000 + phone_offset + i),
+                    password=password,
+                )
+                for i in range(start, min(start + batch_size, user_count))
+            ]
+        )
+        user_ids += [user.id for user in users]
+    return user_ids
+
+
+def create_chunk(chunk, listing_count, user_ids, photos, seed, batch_size):
+    """
+    Creates the listings of one chunk along with their rates, locations and
+    photos, and as many offers and reviews, in one transaction
+
+    Every chunk has its own random generator seeded from the seed and the
+    chunk number, so the data doesn't depend on how the chunks are spread
+    over worker processes
+
+    Returns the number of rows created per model
+    """
+    rng = random.Random(f"{seed}-{chunk}")
+    now = timezone.now()
+    user_count = len(user_ids)
+    size = min(batch_size, listing_count - chunk * batch_size)
+
+    with transaction.atomic():
+        listings = []
+        for _ in range(size):
+            category = rng.choice(list(ITEMS))
+            item = rng.choice(ITEMS[category])
+            listing_type = (
+                ListingType.SERVICE
+                if category == Category.SERVICES
+                else ListingType.RENTAL
+            )
+            listings.append(
+                Listing(
+                    uploaded_by_id=user_ids[skewed_index(rng, user_count)],
+                    title=f"{rng.choice(ADJECTIVES)} {item}",
+                    description=f"{item} available around {rng.choice(AREAS)}",
+                    category=category,
+                    listing_type=listing_type,
+                )
+            )
+        listings = Listing.objects.bulk_create(listings)
+
+        rates, locations, listing_photos = [], [], []
+        for listing in listings:
+            for time_unit in rng.sample(list(RATE_RANGES), rng.randint(1, 3)):
+                low, high = RATE_RANGES[time_unit]
+                rates.append(
+                    ListingRate(
+                        listing=listing,
+                        time_unit=time_unit,
+                        rate=Decimal(rng.randint(low * 100, high * 100)) / 100,
+                    )
+                )
+            location = ListingLocation(
+                listing=listing,
+                latitude=round(rng.uniform(*LATITUDES), 5),
+                longitude=round(rng.uniform(*LONGITUDES), 5),
+                query=rng.choice(AREAS),
+                notes="",
+            )
+            # bulk_create skips save, which fills in the geohash
+            location.update_geohash()
+            locations.append(location)
+            if photos:
+                choices = photos[listing.category]
+                for name, variants in rng.sample(choices, rng.randint(1, 3)):
+                    listing_photos.append(
+                        ListingPhoto(listing=listing, image_url=name, variants=variants)
+                    )
+        ListingRate.objects.bulk_create(rates)
+        ListingLocation.objects.bulk_create(locations)
+        ListingPhoto.objects.bulk_create(listing_photos)
+
+        # Offers on the same listing are given back to back slots
+        next_slot = defaultdict(lambda: now)
+        offers = []
+        for _ in range(size):
+            listing = listings[skewed_index(rng, size)]
+            index = rng.randrange(user_count)
+            if user_ids[index] == listing.uploaded_by_id:
+                index = (index + 1) % user_count
+            hours = rng.randint(1, 8)
+            start = next_slot[listing.id] + timedelta(hours=rng.randint(0, 48))
+            next_slot[listing.id] = start + timedelta(hours=hours)
+            offers.append(
+                Offer(
+                    offered_by_id=user_ids[index],
+                    listing=listing,
+                    price=Decimal(rng.randint(500, 30000)) / 100,
+                    status=rng.choices(OFFER_STATUSES, OFFER_STATUS_WEIGHTS)[0],
+                    scheduled_start=start,
+                    scheduled_end=start + timedelta(hours=hours),
+                    time_unit=TimeUnit.HOURLY,
+                    time_delta=hours,
+                )
+            )
+        offers = Offer.objects.bulk_create(offers)
+
+        transactions = [
+            Transaction(
+                user_id=offer.offered_by_id,
+                offer=offer,
+                amount=offer.price,
+                status=Transaction.COMPLETED,
+                payment_id=f"PAY{seed}-{offer.id}",
+            )
+            for offer in offers
+            if offer.status == Offer.PAID
+        ]
+        Transaction.objects.bulk_create(transactions)
+
+        reviews = []
+        for i in range(size):
+            user_index = skewed_index(rng, user_count)
+            reviewer_index = rng.randrange(user_count)
+            if reviewer_index == user_index:
+                reviewer_index = (reviewer_index + 1) % user_count
+            reviews.append(
+                Review(
+                    reviewer_id=user_ids[reviewer_index],
+                    user_id=user_ids[user_index],
+                    rating=rng.randint(1, 5),
+                    description=f"Review {chunk * batch_size + i}",
+                )
+            )
+        Review.objects.bulk_create(reviews)
+
+    return {
+        "listings": len(listings),
+        "rates": len(rates),
+        "locations": len(locations),
+        "photos": len(listing_photos),
+        "offers": len(offers),
+        "reviews": len(reviews),
+        "transactions": len(transactions),
+    }
+
+
+def init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+
+def create_chunk_in_worker(chunk):
+    return create_chunk(chunk, **_worker_state)
+
+
+def generate_dataset(
+    listing_count, seed=0, batch_size=1000, photos=False, workers=1, progress=None
+):
+    """
+    Bulk creates a synthetic marketplace with listing_count listings and as
+    many offers and reviews, plus the users, rates, locations, photos and
+    transactions that go with them. The same seed generates the same data
+
+    Listings are created batch_size at a time, spread over worker processes
+    when there is more than one, and progress is called with the row counts
+    of every finished batch
+
+    Returns the number of rows created per model
+    """
+    user_ids = create_users(max(listing_count // 10, 10), seed, batch_size)
+
+    state = {
+        "listing_count": listing_count,
+        "user_ids": user_ids,
+        "photos": create_placeholder_photos() if photos else None,
+        "seed": seed,
+        "batch_size": batch_size,
+    }
+    chunks = range((listing_count + batch_size - 1) // batch_size)
+
+    totals = defaultdict(int, users=len(user_ids))
+    if workers > 1:
+        # Workers must not share the parent's connections, closed here so
+        # every forked worker opens its own
+        connections.close_all()
+        # Forked so the workers inherit the configured Django setup
+        context = multiprocessing.get_context("fork")
+        with context.Pool(workers, init_worker, (state,)) as pool:
+            for counts in pool.imap_unordered(create_chunk_in_worker, chunks):
+                add_counts(totals, counts, progress)
+    else:
+        for chunk in chunks:
+            add_counts(totals, create_chunk(chunk, **state), progress)
+
+    # bulk_create skips Review.save, which keeps the rating aggregates, the
+    # saves that keep the dashboard summaries, and the signals that
+    # invalidate cached listings
+    User.objects.rebuild_ratings(batch_size)
+    UserSummary.objects.rebuild(batch_size)
+    bump_version()
+
+    return dict(totals)
+
+
+def add_counts(totals, counts, progress):
+    for model, count in counts.items():
+        totals[model] += count
+    if progress:
+        progress(counts)
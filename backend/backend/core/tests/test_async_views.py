@@ -0,0 +1,136 @@
+import json
+import warnings
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.core.models import Listing, Review, User
+from backend.core.synthetic import generate_dataset
+
+
+class AsyncViewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_dataset(30, seed=3)
+        cls.owner = User.objects.filter(listing__isnull=False).order_by("id").first()
+        cls.reviewed = Review.objects.order_by("id").first().user
+
+    def setUp(self):
+        cache.clear()
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.owner)}"}
+
+    def assertSameResponse(self, path, params=None, headers=None):
+        sync = self.client.get(path, params, headers=headers)
+        async_ = self.client.get(f"/async{path}", params, headers=headers)
+        self.assertEqual(async_.status_code, sync.status_code)
+        self.assertEqual(async_.json(), sync.json())
+        return async_
+
+    def test_listing_browse(self):
+        """Test that the async browse answers like the sync one"""
+        response = self.assertSameResponse("/listing/")
+        self.assertEqual(len(response.json()), 30)
+
+        listing = Listing.objects.order_by("id").first()
+        self.assertSameResponse("/listing/", {"id": listing.id})
+        self.assertSameResponse("/listing/", {"id": 0})
+        self.assertSameResponse(
+            "/listing/", {"category": "EL", "time_unit": "H", "sort_by": "price_asc"}
+        )
+        self.assertSameResponse("/listing/", {"search": "drill"})
+        self.assertSameResponse("/listing/", {"sort_by": "price_asc"})
+        self.assertSameResponse("/listing/", {"lat": "north"})
+
+    def test_listing_pages(self):
+        """Test paging through the async browse"""
+        response = self.client.get("/async/listing/", {"page_size": 20})
+        page1 = response.json()
+        self.assertEqual(len(page1["results"]), 20)
+        self.assertIn("/async/listing/", page1["next"])
+
+        page2 = self.client.get(page1["next"]).json()
+        self.assertEqual(len(page2["results"]), 10)
+        self.assertIsNone(page2["next"])
+
+        sync = self.client.get("/listing/", {"page_size": 20}).json()
+        self.assertEqual(page1["results"], sync["results"])
+
+        response = self.client.get("/async/listing/", {"cursor": "junk"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_listing_browse_cached(self):
+        """Test that anonymous async browsing is served from the cache"""
+        first = self.client.get("/async/listing/")
+        with self.assertNumQueries(0):
+            second = self.client.get("/async/listing/")
+        self.assertEqual(first.content, second.content)
+
+        response = self.client.get(
+            "/async/listing/", headers={"If-None-Match": second["ETag"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_offers(self):
+        """Test that the async offers answer like the sync ones"""
+        response = self.assertSameResponse("/offers/", headers=self.headers)
+        self.assertTrue(response.json())
+        self.assertSameResponse("/offers/", {"type": "made"}, headers=self.headers)
+
+        listing = Listing.objects.filter(uploaded_by=self.owner).first()
+        self.assertSameResponse(
+            "/offers/", {"listing_id": listing.id}, headers=self.headers
+        )
+
+        response = self.client.get(
+            "/async/offers/", {"listing_id": 0}, headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_offers_need_login(self):
+        """Test that the async offers turn away anonymous and bad tokens"""
+        response = self.client.get("/async/offers/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.get(
+            "/async/offers/", headers={"Authorization": "Bearer junk"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_reviews(self):
+        """Test that the async reviews answer like the sync ones"""
+        response = self.assertSameResponse(
+            "/reviews/", {"user_id": self.reviewed.id}, headers=self.headers
+        )
+        self.assertTrue(response.json())
+        self.assertSameResponse("/reviews/", headers=self.headers)
+
+        # Anyone can read a user's reviews, only your own need a login
+        response = self.client.get("/async/reviews/", {"user_id": self.reviewed.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get("/async/reviews/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_asgi_request_metrics(self):
+        """Test that the metrics of requests through ASGI count their queries"""
+        response = await self.async_client.get(
+            "/async/offers/", {"type": "made"}, headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Only the offers, the user comes from the token
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+
+    async def test_asgi_export_streams(self):
+        """Test that the listing export is streamed through ASGI too"""
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            response = await self.async_client.get("/listing/export/")
+            content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Django warns when it has to read a sync iterator whole
+        self.assertTrue(response.is_async)
+        self.assertEqual(caught, [])
+        exported = [json.loads(line)["id"] for line in content.splitlines()]
+        listings = Listing.objects.order_by("updated_at", "id")
+        self.assertEqual(exported, [listing.id async for listing in listings])
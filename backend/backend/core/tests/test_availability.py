@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+from django.core.cache import cache
+from django.utils import timezone
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from backend.core.models import (
+    User,
+    Listing,
+    Category,
+    ListingType,
+    TimeUnit,
+    Offer,
+)
+from backend.core.availability import merge_intervals
+
+
+class AvailabilityTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.owner = User.objects.create_user(
+            username="owner",
+            email="owner@example.com",
+            password="testpass123",
+            phone_number="88888888",
+        )
+        self.renter = User.objects.create_user(
+            username="renter",
+            email="renter@example.com",
+            password="testpass123",
+            phone_number="99999999",
+        )
+
+        self.listing = Listing.objects.create(
+            title="Test Item",
+            description="Test description",
+            category=Category.ELECTRONICS,
+            listing_type=ListingType.RENTAL,
+            uploaded_by=self.owner,
+        )
+
+        self.day = timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ) + timedelta(days=1)
+
+        # 9-11 and 10-12 overlap, 12-13 touches them, 15-16 is separate
+        self.offers = [
+            self.make_offer(9, 11),
+            self.make_offer(10, 12),
+            self.make_offer(12, 13),
+            self.make_offer(15, 16),
+        ]
+
+    def make_offer(self, start_hour, end_hour):
+        return Offer.objects.create(
+            offered_by=self.renter,
+            listing=self.listing,
+            price=10.00,
+            scheduled_start=self.day + timedelta(hours=start_hour),
+            scheduled_end=self.day + timedelta(hours=end_hour),
+            time_unit=TimeUnit.HOURLY,
+            time_delta=end_hour - start_hour,
+        )
+
+    def busy_hours(self, response):
+        return [
+            (
+                (datetime.fromisoformat(interval["start"]) - self.day)
+                // timedelta(hours=1),
+                (datetime.fromisoformat(interval["end"]) - self.day)
+                // timedelta(hours=1),
+            )
+            for interval in response.json()["busy"]
+        ]
+
+    def test_merge_intervals(self):
+        """Test merging sorted intervals in one sweep"""
+        self.assertEqual(merge_intervals([]), [])
+        self.assertEqual(
+            merge_intervals([(1, 3), (2, 4), (4, 5), (6, 7), (6, 6)]),
+            [(1, 5), (6, 7)],
+        )
+        # An interval fully inside the previous one
+        self.assertEqual(merge_intervals([(1, 10), (2, 3), (4, 11)]), [(1, 11)])
+
+    def test_get_busy_intervals(self):
+        """Test retrieving merged busy intervals for a listing"""
+        response = self.client.get(f"/availability/?listing_id={self.listing.id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["listing_id"], self.listing.id)
+        self.assertEqual(self.busy_hours(response), [(9, 13), (15, 16)])
+
+        # Only intervals overlapping the range are returned
+        start = (self.day + timedelta(hours=13)).isoformat()
+        end = (self.day + timedelta(hours=20)).isoformat()
+        response = self.client.get(
+            "/availability/",
+            {"listing_id": self.listing.id, "start": start, "end": end},
+        )
+        self.assertEqual(self.busy_hours(response), [(15, 16)])
+
+        # Bad case - non-existent listing
+        response = self.client.get("/availability/?listing_id=99999")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Bad case - end before start
+        response = self.client.get(
+            "/availability/",
+            {"listing_id": self.listing.id, "start": end, "end": start},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_busy_intervals_cached_and_invalidated(self):
+        """Test that busy intervals are cached until an offer changes"""
+        url = f"/availability/?listing_id={self.listing.id}"
+        self.client.get(url)
+
+        # Served from the cache, only the listing lookup hits the database
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(self.busy_hours(response), [(9, 13), (15, 16)])
+
+        # Rejecting frees the slot, once it commits
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.offers[3].reject()
+        self.assertEqual(len(callbacks), 1)
+        response = self.client.get(url)
+        self.assertEqual(self.busy_hours(response), [(9, 13)])
+
+        # Declining an accepted offer frees the slot
+        with self.captureOnCommitCallbacks(execute=True):
+            self.offers[2].accept()
+            self.offers[2].decline()
+        response = self.client.get(url)
+        self.assertEqual(self.busy_hours(response), [(9, 12)])
+
+        # New offers take their slot
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_offer(18, 19)
+        response = self.client.get(url)
+        self.assertEqual(self.busy_hours(response), [(9, 12), (18, 19)])
@@ -0,0 +1,108 @@
+from django.db.models import F
+from django.test import TestCase
+
+from backend.core.benchmark import (
+    find_regressions,
+    find_slowdowns,
+    measure_encoding,
+    run_benchmarks,
+)
+from backend.core.models import Listing, ListingPhoto, Offer, Review, User
+from backend.core.synthetic import generate_dataset
+from backend.core.tests.utils import use_temporary_media_root
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        use_temporary_media_root(self)
+
+    def test_generate_dataset(self):
+        """Test that the synthetic dataset has the requested number of rows"""
+        counts = generate_dataset(50, seed=1, batch_size=20)
+        self.assertEqual(counts["listings"], 50)
+        self.assertEqual(Listing.objects.count(), 50)
+        self.assertEqual(User.objects.count(), counts["users"])
+        self.assertEqual(Offer.objects.count(), 50)
+        self.assertEqual(Review.objects.count(), 50)
+
+        # Nobody makes offers on or reviews themselves
+        self.assertFalse(
+            Offer.objects.filter(offered_by=F("listing__uploaded_by")).exists()
+        )
+        self.assertFalse(Review.objects.filter(reviewer=F("user")).exists())
+
+        # The rating aggregates skipped by bulk_create are filled in
+        user = Review.objects.order_by("id").first().user
+        self.assertEqual(user.rating_count, user.reviews_received.count())
+
+    def test_generate_dataset_is_deterministic(self):
+        """Test that the same seed generates the same listings and photos"""
+        generate_dataset(30, seed=2, batch_size=8, photos=True)
+        first = list(Listing.objects.order_by("id").values_list("title", "rates__rate"))
+        self.assertTrue(ListingPhoto.objects.exclude(variants={}).exists())
+
+        User.objects.all().delete()
+        generate_dataset(30, seed=2, batch_size=8, photos=True)
+        second = list(
+            Listing.objects.order_by("id").values_list("title", "rates__rate")
+        )
+        self.assertEqual(first, second)
+
+    def test_run_benchmarks(self):
+        """Test that every scenario runs against a small dataset"""
+        generate_dataset(30)
+        results = run_benchmarks(iterations=2)
+
+        self.assertIn("listing-browse", results)
+        self.assertIn("offer-create", results)
+        for name in ("listing-create", "user-delete", "offer-accept", "metrics"):
+            self.assertIn(name, results)
+        self.assertGreater(results["async-listing-browse"]["queries"], 0)
+        for result in results.values():
+            self.assertGreaterEqual(result["p95_ms"], result["p50_ms"])
+        self.assertEqual(results["listing-browse-cached"]["queries"], 0)
+
+        # The written rows were rolled back
+        self.assertEqual(Offer.objects.count(), 30)
+        self.assertEqual(Review.objects.count(), 30)
+        self.assertEqual(Listing.objects.count(), 30)
+
+    def test_measure_encoding(self):
+        """Test that both encoders time the same listing payload"""
+        generate_dataset(30)
+        results = measure_encoding(iterations=2)
+
+        self.assertEqual(set(results), {"json", "orjson"})
+        for result in results.values():
+            self.assertGreaterEqual(result["p95_ms"], result["p50_ms"])
+            self.assertGreater(result["kb"], 0)
+
+    def test_find_regressions(self):
+        """Test that extra queries and routes without a baseline fail"""
+        baseline = {"user": {"p50_ms": 10, "p95_ms": 10, "queries": 1, "peak_kb": 30}}
+
+        same = {"user": {"p50_ms": 11, "p95_ms": 12, "queries": 1, "peak_kb": 31}}
+        self.assertEqual(find_regressions(same, baseline, 0.25), [])
+
+        chattier = {"user": {"p50_ms": 10, "p95_ms": 10, "queries": 2, "peak_kb": 30}}
+        self.assertEqual(len(find_regressions(chattier, baseline, 0.25)), 1)
+
+        hungrier = {"user": {"p50_ms": 10, "p95_ms": 10, "queries": 1, "peak_kb": 200}}
+        self.assertEqual(len(find_regressions(hungrier, baseline, 0.25)), 1)
+
+        self.assertEqual(
+            find_regressions(same, {}, 0.25),
+            ["user: no baseline, record one with --save-baseline"],
+        )
+
+    def test_find_slowdowns(self):
+        """Test that slower routes are only reported by find_slowdowns"""
+        baseline = {"user": {"p50_ms": 10, "p95_ms": 10, "queries": 1, "peak_kb": 30}}
+
+        slower = {"user": {"p50_ms": 20, "p95_ms": 20, "queries": 1, "peak_kb": 30}}
+        self.assertEqual(find_regressions(slower, baseline, 0.25), [])
+        self.assertEqual(len(find_slowdowns(slower, baseline, 0.25)), 1)
+
+        # Within the threshold and slack
+        same = {"user": {"p50_ms": 13, "p95_ms": 20, "queries": 1, "peak_kb": 30}}
+        self.assertEqual(find_slowdowns(same, baseline, 0.25), [])
@@ -1,9 +1,15 @@
 from decimal import Decimal
 import json
+from unittest import mock
+from PIL import Image
 from pprint import pprint
 from rest_framework.test import APIClient
 from rest_framework import status
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -14,15 +20,27 @@ from backend.core.models import (
     ListingType,
     ListingRate,
     ListingLocation,
+    ListingPhoto,
     TimeUnit,
 )
 
-from backend.core.tests.utils import get_test_photo, get_blank_photo
+from backend.core.images import generate_variants
+from backend.core.geo import covering_cells, encode_geohash
+from backend.core.views import ListingExportController
+from backend.core.tests.utils import (
+    get_blank_photo,
+    get_test_photo,
+    use_temporary_media_root,
+)
 
 
 class ListingTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
+        use_temporary_media_root(self)
+        # Cached browse responses are only invalidated on commit, which the
+        # test transactions never do
+        cache.clear()
 
         # Create test users
         self.user1 = User.objects.create_user(
@@ -422,3 +440,436 @@ class ListingTestCase(TestCase):
             json.loads(response.content)["error"],
             "Time unit must be specified when sorting by price",
         )
+
+    def test_get_all_listings_query_count(self):
+        """Test that listing browse does not issue queries per listing"""
+        # Add more listings, each with its own rate and location
+        for i in range(10):
+            listing = Listing.objects.create(
+                title=f"Extra Listing {i}",
+                description="Extra listing for the query budget",
+                category=Category.SUPPLIES,
+                listing_type=ListingType.RENTAL,
+                uploaded_by=self.user1,
+            )
+            ListingRate.objects.create(
+                listing=listing, time_unit=TimeUnit.DAILY, rate=5.00
+            )
+            ListingLocation.objects.create(
+                listing=listing, latitude=1.35160, longitude=103.87119, query="Nex"
+            )
+
+        # 1 for the listings, 1 each for photos, rates and locations
+        with self.assertNumQueries(4), CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/listing/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(response.content)), 12)
+        # The owner is shown by id, their row isn't joined in
+        self.assertNotIn("core_user", queries[0]["sql"])
+
+        # Same budget when filtering through the rates join
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/listing/?time_unit={TimeUnit.DAILY}")
+        self.assertEqual(len(json.loads(response.content)), 10)
+
+    def test_cursor_pagination(self):
+        """Test paging through listings with cursors"""
+        for i in range(3):
+            Listing.objects.create(
+                title=f"Paged Listing {i}",
+                description="Extra listing for pagination",
+                category=Category.SUPPLIES,
+                listing_type=ListingType.RENTAL,
+                uploaded_by=self.user1,
+            )
+
+        # Without pagination params the full list is returned as before
+        response = self.client.get("/listing/")
+        expected = [item["title"] for item in json.loads(response.content)]
+        self.assertEqual(len(expected), 5)
+
+        # Walk forward two at a time
+        response = self.client.get("/listing/?page_size=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page1 = json.loads(response.content)
+        self.assertIsNone(page1["previous"])
+        self.assertEqual([item["title"] for item in page1["results"]], expected[:2])
+
+        page2 = json.loads(self.client.get(page1["next"]).content)
+        self.assertEqual([item["title"] for item in page2["results"]], expected[2:4])
+
+        page3 = json.loads(self.client.get(page2["next"]).content)
+        self.assertEqual([item["title"] for item in page3["results"]], expected[4:])
+        self.assertIsNone(page3["next"])
+
+        # Walking back returns the same page
+        back = json.loads(self.client.get(page3["previous"]).content)
+        self.assertEqual([item["title"] for item in back["results"]], expected[2:4])
+        self.assertIsNotNone(back["previous"])
+        self.assertIsNotNone(back["next"])
+
+        # Bad case - junk cursor
+        response = self.client.get("/listing/?cursor=junk")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)["error"], "Invalid cursor")
+
+    def test_cursor_pagination_price_sort(self):
+        """Test paging through listings sorted by price"""
+        for rate in [30.00, 10.00, 20.00]:
+            listing = Listing.objects.create(
+                title=f"Hourly {rate}",
+                description="Extra listing for price pagination",
+                category=Category.SUPPLIES,
+                listing_type=ListingType.RENTAL,
+                uploaded_by=self.user2,
+            )
+            ListingRate.objects.create(
+                listing=listing, time_unit=TimeUnit.HOURLY, rate=rate
+            )
+
+        response = self.client.get(
+            f"/listing/?time_unit={TimeUnit.HOURLY}&sort_by=price_asc&page_size=3"
+        )
+        page1 = json.loads(response.content)
+        self.assertEqual(
+            [float(item["rates"][0]["rate"]) for item in page1["results"]],
+            [10.00, 10.00, 20.00],
+        )
+
+        page2 = json.loads(self.client.get(page1["next"]).content)
+        self.assertEqual(
+            [float(item["rates"][0]["rate"]) for item in page2["results"]], [30.00]
+        )
+        self.assertIsNone(page2["next"])
+
+        # The two 10.00 listings are split by their rate's id, none are
+        # skipped or repeated
+        ids = [item["id"] for item in page1["results"] + page2["results"]]
+        self.assertEqual(len(set(ids)), 4)
+
+    def test_search_listings_full_text(self):
+        """Test prefix, multi-term and ranked search through the search index"""
+        drill_bits = Listing.objects.create(
+            title="Drill Bits",
+            description="Drill bits set, fits any electronic drill",
+            category=Category.SUPPLIES,
+            listing_type=ListingType.RENTAL,
+            uploaded_by=self.user2,
+        )
+
+        # Prefix search while the user is still typing
+        response = self.client.get("/listing/?search=plumb")
+        data = json.loads(response.content)
+        self.assertEqual([item["title"] for item in data], ["Plumbing Service"])
+
+        # Every term has to match, in any order
+        response = self.client.get("/listing/?search=professional drill")
+        data = json.loads(response.content)
+        self.assertEqual([item["title"] for item in data], ["Electronic Drill"])
+
+        # The listing mentioning drill the most is ranked first
+        response = self.client.get("/listing/?search=drill")
+        data = json.loads(response.content)
+        self.assertEqual(
+            [item["title"] for item in data], ["Drill Bits", "Electronic Drill"]
+        )
+
+        # Paging keeps the relevance order
+        response = self.client.get("/listing/?search=drill&page_size=1")
+        page1 = json.loads(response.content)
+        page2 = json.loads(self.client.get(page1["next"]).content)
+        self.assertEqual(page1["results"][0]["title"], "Drill Bits")
+        self.assertEqual(page2["results"][0]["title"], "Electronic Drill")
+        self.assertIsNone(page2["next"])
+
+        # Updates and deletes are reflected in the index
+        with self.captureOnCommitCallbacks(execute=True):
+            drill_bits.update_title("Screwdriver Bits")
+            drill_bits.update_description("Screwdriver bits set")
+        response = self.client.get("/listing/?search=screwdriver")
+        self.assertEqual(len(json.loads(response.content)), 1)
+        response = self.client.get("/listing/?search=drill")
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            drill_bits.delete()
+        response = self.client.get("/listing/?search=screwdriver")
+        self.assertEqual(len(json.loads(response.content)), 0)
+
+        # Search syntax in the query is not interpreted
+        response = self.client.get('/listing/?search="drill* OR')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(response.content)), 0)
+
+    def test_geohash(self):
+        """Test the geohash kept on listing locations"""
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+        location = ListingLocation.objects.get(listing=self.listing1)
+        self.assertEqual(location.geohash, encode_geohash(1.31745, 103.80704))
+
+        # Every point of a box lies in one of its covering cells
+        cells = covering_cells(1.30, 103.80, 1.45, 103.90)
+        self.assertLessEqual(len(cells), 16)
+        for latitude in [1.30, 1.35, 1.4499]:
+            for longitude in [103.80, 103.85, 103.8999]:
+                geohash = encode_geohash(latitude, longitude)
+                self.assertTrue(any(geohash.startswith(cell) for cell in cells))
+
+    def test_nearby_listings(self):
+        """Test searching listings around a point"""
+        # From Nex, Farrer Road is about 8km away and Yishun about 9.5km
+        response = self.client.get("/listing/?lat=1.35160&lng=103.87119&radius=10")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual(
+            [item["title"] for item in data], ["Electronic Drill", "Plumbing Service"]
+        )
+        self.assertAlmostEqual(data[0]["distance"], 7.9, delta=0.2)
+        self.assertAlmostEqual(data[1]["distance"], 9.55, delta=0.2)
+
+        response = self.client.get("/listing/?lat=1.35160&lng=103.87119&radius=8.5")
+        data = json.loads(response.content)
+        self.assertEqual([item["title"] for item in data], ["Electronic Drill"])
+
+        # Combines with the other filters and pagination
+        response = self.client.get(
+            f"/listing/?lat=1.35160&lng=103.87119&radius=10"
+            f"&category={Category.SERVICES}&page_size=1"
+        )
+        data = json.loads(response.content)
+        self.assertEqual(
+            [item["title"] for item in data["results"]], ["Plumbing Service"]
+        )
+
+        # Distance is only included for nearby searches
+        response = self.client.get("/listing/")
+        self.assertNotIn("distance", json.loads(response.content)[0])
+
+        # Bad case - missing longitude
+        response = self.client.get("/listing/?lat=1.35160")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Bad case - radius out of range
+        response = self.client.get("/listing/?lat=1.35160&lng=103.87119&radius=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bbox_listings(self):
+        """Test searching listings inside a bounding box"""
+        response = self.client.get("/listing/?bbox=103.80,1.40,103.90,1.45")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = json.loads(response.content)
+        self.assertEqual([item["title"] for item in data], ["Plumbing Service"])
+
+        response = self.client.get("/listing/?bbox=103.0,1.0,104.0,2.0")
+        self.assertEqual(len(json.loads(response.content)), 2)
+
+        # Bad case - malformed box
+        response = self.client.get("/listing/?bbox=103.80,1.40")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_anonymous_browse_cache(self):
+        """Test that anonymous browse responses are cached until a listing changes"""
+        response = self.client.get("/listing/?category=EL&listing_type=RE")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        # Same filters in a different order are served from the cache
+        with self.assertNumQueries(0):
+            response = self.client.get("/listing/?listing_type=RE&category=EL")
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(json.loads(response.content)[0]["title"], "Electronic Drill")
+
+        # Unchanged responses are not sent again
+        response = self.client.get(
+            "/listing/?category=EL&listing_type=RE", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+        # Any change to a listing or its rates invalidates the cache, once it
+        # commits
+        ListingRate.objects.filter(listing=self.listing1).update(rate=5.00)
+        with self.captureOnCommitCallbacks(execute=True):
+            ListingRate.objects.get(listing=self.listing1).save()
+        response = self.client.get(
+            "/listing/?category=EL&listing_type=RE", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        data = json.loads(response.content)
+        self.assertEqual(float(data[0]["rates"][0]["rate"]), 5.00)
+
+        # Authenticated users always get a fresh response
+        self.client.force_authenticate(user=self.user1)
+        with self.assertNumQueries(4):
+            self.client.get("/listing/?category=EL&listing_type=RE")
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_photo_variants(self):
+        """Test that uploaded photos get resized variants in the srcset"""
+        self.client.force_authenticate(user=self.user1)
+
+        data = {
+            "title": "Large Photo Listing",
+            "description": "Listing with a large photo",
+            "category": Category.SUPPLIES,
+            "listing_type": ListingType.RENTAL,
+            "photos": [get_blank_photo(size=(800, 600))],
+            "rates": '[{"time_unit": "D", "rate": "25.00"}]',
+            "locations": "[]",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/listing/", data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        listing_id = json.loads(response.content)["id"]
+
+        response = self.client.get(f"/listing/?id={listing_id}")
+        photo = json.loads(response.content)["photos"][0]
+        self.assertTrue(photo["image_url"].endswith(".jpg"))
+
+        # The 800px photo is not upscaled to 1280px
+        for extension in ["webp", "jpeg"]:
+            sources = photo["srcset"][extension].split(", ")
+            self.assertEqual(len(sources), 2)
+            self.assertTrue(sources[0].endswith(f"_320.{extension} 320w"))
+            self.assertTrue(sources[1].endswith(f"_640.{extension} 640w"))
+
+        # Finished variants count as a change for the export's updated_since
+        before = Listing.objects.get(id=listing_id).updated_at
+        generate_variants(ListingPhoto.objects.get(listing_id=listing_id).id)
+        self.assertGreater(Listing.objects.get(id=listing_id).updated_at, before)
+
+        # The variants are actually smaller
+        variants = ListingPhoto.objects.get(listing_id=listing_id).variants
+        with default_storage.open(variants["webp"]["320"]) as variant_file:
+            self.assertEqual(Image.open(variant_file).size, (320, 240))
+
+        # Deleting the photo removes its variants
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.get(id=listing_id).delete()
+        for widths in variants.values():
+            for name in widths.values():
+                self.assertFalse(default_storage.exists(name))
+
+    def create_listing_queries(self, photo_count, rates, location_count):
+        data = {
+            "title": "Bulk Listing",
+            "description": "Listing created for the round trip count",
+            "category": Category.SUPPLIES,
+            "listing_type": ListingType.RENTAL,
+            "photos": [get_blank_photo(f"{i}.jpg") for i in range(photo_count)],
+            "rates": json.dumps(
+                [{"time_unit": unit, "rate": "10.00"} for unit in rates]
+            ),
+            "locations": json.dumps(
+                [
+                    {"latitude": 1.3, "longitude": 103.8, "query": f"{i}", "notes": ""}
+                    for i in range(location_count)
+                ]
+            ),
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/listing/", data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return len(queries)
+
+    def test_create_listing_round_trips(self):
+        """Test that creating a listing costs the same queries for any number of rows"""
+        self.client.force_authenticate(user=self.user1)
+
+        few = self.create_listing_queries(1, ["H"], 1)
+        many = self.create_listing_queries(10, ["H", "D", "W"], 3)
+        self.assertEqual(few, many)
+
+    def test_update_listing_only_writes_changes(self):
+        """Test that updating a listing keeps the rates and locations that did not change"""
+        self.client.force_authenticate(user=self.user1)
+        ListingRate.objects.create(
+            listing=self.listing1, time_unit=TimeUnit.DAILY, rate=50.00
+        )
+        hourly = ListingRate.objects.get(
+            listing=self.listing1, time_unit=TimeUnit.HOURLY
+        )
+        location = ListingLocation.objects.get(listing=self.listing1)
+
+        update_data = {
+            "id": self.listing1.id,
+            "title": "Electronic Drill",
+            "description": "Professional electronic drill for rent",
+            "category": Category.ELECTRONICS,
+            "listing_type": ListingType.RENTAL,
+            # Hourly is unchanged, daily is updated and weekly is new
+            "rates": '[{"time_unit": "H", "rate": "10.00"}, {"time_unit": "D", "rate": "45.00"}, {"time_unit": "W", "rate": "200.00"}]',
+            # Farrer Road is unchanged and Nex is new
+            "locations": '[{"latitude": 1.31745, "longitude": 103.80704, "query": "Farrer Road", "notes": "Available for pickup"}, {"latitude": "1.35160", "longitude": "103.87119", "query": "Nex", "notes": ""}]',
+        }
+        response = self.client.put("/listing/", update_data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        rates = {rate.time_unit: rate for rate in self.listing1.rates.all()}
+        self.assertEqual(set(rates), {"H", "D", "W"})
+        self.assertEqual(rates["H"].id, hourly.id)
+        self.assertEqual(rates["D"].rate, Decimal("45.00"))
+        self.assertEqual(rates["W"].rate, Decimal("200.00"))
+
+        locations = {loc.query: loc for loc in self.listing1.locations.all()}
+        self.assertEqual(set(locations), {"Farrer Road", "Nex"})
+        self.assertEqual(locations["Farrer Road"].id, location.id)
+        self.assertEqual(locations["Nex"].geohash, encode_geohash(1.35160, 103.87119))
+
+        # Dropping a rate deletes it
+        update_data["rates"] = '[{"time_unit": "H", "rate": "10.00"}]'
+        response = self.client.put("/listing/", update_data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([rate.id for rate in self.listing1.rates.all()], [hourly.id])
+
+    def export(self, params=None):
+        response = self.client.get("/listing/export/", params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        content = b"".join(response.streaming_content)
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_listings(self):
+        """Test that the export streams every listing, one per line"""
+        listings = self.export()
+        self.assertEqual(
+            [listing["id"] for listing in listings],
+            [self.listing1.id, self.listing2.id],
+        )
+        # The same listings the browse endpoint shows
+        response = self.client.get("/listing/", {"id": self.listing1.id})
+        self.assertEqual(listings[0], json.loads(response.content))
+
+        # The listings are read by one query, their relations once per chunk
+        for i in range(5):
+            Listing.objects.create(
+                title=f"Extra {i}",
+                description="Extra listing",
+                category=Category.SUPPLIES,
+                listing_type=ListingType.RENTAL,
+                uploaded_by=self.user1,
+            )
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.export()), 7)
+
+        with mock.patch.object(ListingExportController, "chunk_size", 3):
+            with self.assertNumQueries(1 + 3 * 3):
+                self.assertEqual(len(self.export()), 7)
+
+    def test_export_updated_since(self):
+        """Test that incremental exports start at updated_since"""
+        self.listing1.update_title("Cordless Drill")
+        self.listing1.refresh_from_db()
+
+        listings = self.export({"updated_since": self.listing1.updated_at.isoformat()})
+        self.assertEqual([listing["title"] for listing in listings], ["Cordless Drill"])
+
+        # Everything changed since is last
+        listings = self.export()
+        self.assertEqual(listings[-1]["id"], self.listing1.id)
+
+        # Bad case - not a time
+        response = self.client.get("/listing/export/", {"updated_since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,145 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from backend.core import metrics, serializers
+from backend.core.models import (
+    User,
+    Listing,
+    Category,
+    ListingType,
+)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.client = APIClient()
+
+        self.user = User.objects.create_user(
+            username="owner",
+            email="owner@example.com",
+            password="testpass123",
+            phone_number="88888888",
+        )
+        Listing.objects.create(
+            title="Test Item",
+            description="Test description",
+            category=Category.ELECTRONICS,
+            listing_type=ListingType.RENTAL,
+            uploaded_by=self.user,
+        )
+        self.admin = User.objects.create_user(
+            username="admin",
+            email="admin@example.com",
+            password="testpass123",
+            phone_number="77777777",
+        )
+        self.admin.is_superuser = True
+        self.admin.save()
+
+    def test_server_timing_header(self):
+        """Test that responses carry their wall, SQL and serializer time"""
+        response = self.client.get("/listing/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        timing = response["Server-Timing"]
+        self.assertIn("app;dur=", timing)
+        self.assertIn("db;dur=", timing)
+        self.assertIn('desc="4 queries"', timing)
+        self.assertIn("serialize;dur=", timing)
+
+    def test_serializer_time(self):
+        """Test that serializers time themselves, nested ones once"""
+        timer = metrics.SerializerTimer()
+        token = metrics.serializer_timer.set(timer)
+        try:
+            # The photos, rates and locations are serializers nested in it
+            listings = Listing.objects.all()
+            serializers.ListingSerializer(listings, many=True).data
+        finally:
+            metrics.serializer_timer.reset(token)
+        self.assertGreater(timer.seconds, 0)
+        self.assertEqual(timer.depth, 0)
+
+        # No view has to remember to time them
+        for serializer in vars(serializers).values():
+            if (
+                isinstance(serializer, type)
+                and issubclass(serializer, serializers.serializers.BaseSerializer)
+                and serializer.__module__ == serializers.__name__
+                # Only validates logins, simplejwt returns its tokens
+                and serializer is not serializers.CustomTokenObtainPairSerializer
+            ):
+                self.assertTrue(
+                    issubclass(serializer, serializers.TimedSerializerMixin),
+                    serializer,
+                )
+
+    def test_metrics_endpoint(self):
+        """Test that requests are recorded per route in the Prometheus format"""
+        self.client.get("/listing/")
+        self.client.get("/listing/", {"id": 1})
+        self.client.get("/nothing-here/")
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get("/metrics/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+        body = response.content.decode()
+        labels = 'method="GET",route="listing/"'
+        self.assertIn(f'http_requests_total{{{labels},status="200"}} 2', body)
+        self.assertIn(f"http_request_duration_seconds_count{{{labels}}} 2", body)
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="5"}} 2', body)
+        self.assertIn(f"http_response_bytes_count{{{labels}}} 2", body)
+        # Unknown paths share one series instead of one per path
+        self.assertIn('route="<unmatched>",status="404"', body)
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_metrics_access(self):
+        """Test that only superusers and the metrics scraper read the metrics"""
+        response = self.client.get("/metrics/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Bad case - signed in, but not a superuser
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get("/metrics/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get(
+            "/metrics/", HTTP_AUTHORIZATION="Bearer scrape-secret"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Bad case - wrong token
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_query_wrappers_nest(self):
+        """Test that the query tracking leaves other execute wrappers in place"""
+        calls = []
+
+        def wrapper(execute, sql, params, many, context):
+            calls.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            response = self.client.get("/listing/")
+            self.assertIn('desc="4 queries"', response["Server-Timing"])
+            self.assertEqual(connection.execute_wrappers, [wrapper])
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(connection.execute_wrappers, [])
+
+    @override_settings(SLOW_REQUEST_MS=0.001)
+    def test_slow_request_logged(self):
+        """Test that requests over the threshold are logged with their SQL"""
+        with self.assertLogs("backend.core.middleware", "WARNING") as logs:
+            self.client.get("/listing/")
+
+        self.assertIn("Slow request GET /listing/", logs.output[0])
+        self.assertIn('FROM "core_listing"', logs.output[0])
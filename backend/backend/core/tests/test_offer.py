@@ -118,6 +118,78 @@ class OfferTestCase(TestCase):
         self.assertEqual(len(data), 1)  # Should only see their own offer
         self.assertEqual(float(data[0]["price"]), 8.00)
 
+    def test_get_offers_query_count(self):
+        """Test that listing offers is one query however many there are"""
+        for i in range(5):
+            Offer.objects.create(
+                offered_by=self.renter1,
+                listing=self.listing,
+                price=5 + i,
+                time_unit=TimeUnit.HOURLY,
+            )
+        self.client.force_authenticate(user=self.owner)
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/offers/?type=received")
+        data = response.json()
+        self.assertEqual(len(data), 7)
+        # Newest first
+        self.assertEqual(data[-1]["id"], self.offer1.id)
+        self.assertEqual(
+            data[-1]["listing"],
+            {"id": self.listing.id, "title": "Test Item", "category": "Electronics"},
+        )
+        self.assertEqual(
+            data[-1]["offered_by"],
+            {
+                "id": self.renter1.id,
+                "username": "renter1",
+                "email": "renter1@example.com",
+            },
+        )
+
+    def test_get_offers_filtered(self):
+        """Test filtering offers by status and schedule"""
+        self.offer2.accept()
+        self.client.force_authenticate(user=self.owner)
+
+        response = self.client.get("/offers/", {"status": "A"})
+        self.assertEqual([o["id"] for o in response.json()], [self.offer2.id])
+        response = self.client.get("/offers/", {"status": ["A", "P"]})
+        self.assertEqual(len(response.json()), 2)
+
+        # Only offer2 is scheduled after the next few hours
+        start = timezone.now() + timedelta(hours=6)
+        response = self.client.get("/offers/", {"start": start.isoformat()})
+        self.assertEqual([o["id"] for o in response.json()], [self.offer2.id])
+        response = self.client.get("/offers/", {"end": start.isoformat()})
+        self.assertEqual([o["id"] for o in response.json()], [self.offer1.id])
+
+        # Bad cases - unknown status, empty range and unknown type
+        response = self.client.get("/offers/", {"status": "X"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            "/offers/", {"start": start.isoformat(), "end": start.isoformat()}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/offers/", {"type": "junk"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_offers_pages(self):
+        """Test paging through the offers"""
+        self.client.force_authenticate(user=self.owner)
+
+        page1 = self.client.get("/offers/", {"page_size": 1}).json()
+        self.assertEqual([o["id"] for o in page1["results"]], [self.offer2.id])
+        self.assertIsNone(page1["previous"])
+
+        page2 = self.client.get(page1["next"]).json()
+        self.assertEqual([o["id"] for o in page2["results"]], [self.offer1.id])
+        self.assertIsNone(page2["next"])
+
+        response = self.client.get("/offers/", {"cursor": "junk"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_offer(self):
         """Test creating a new offer"""
         self.client.force_authenticate(user=self.renter2)
@@ -191,3 +263,24 @@ class OfferTestCase(TestCase):
         data = {"offer_id": self.offer2.id, "action": "accept"}
         response = self.client.put("/offers/", data, format="json")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_create_offer_over_released_slot(self):
+        """Test that rejected and declined offers no longer hold their slot"""
+        self.offer1.reject()
+
+        self.client.force_authenticate(user=self.renter2)
+        data = {
+            "listing_id": self.listing.id,
+            "price": 20.00,
+            "scheduled_start": self.offer1.scheduled_start.isoformat(),
+            "scheduled_end": self.offer1.scheduled_end.isoformat(),
+            "time_unit": TimeUnit.HOURLY,
+            "time_delta": 2,
+        }
+        response = self.client.post("/offers/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # The new offer now holds the slot
+        response = self.client.post("/offers/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Schedule collision", str(response.data["error"]))
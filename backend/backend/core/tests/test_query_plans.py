@@ -0,0 +1,64 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from backend.core.benchmark import (
+    build_scenarios,
+    explain,
+    find_full_scans,
+    full_scans,
+)
+from backend.core.models import Listing, Offer
+from backend.core.synthetic import generate_dataset
+from backend.core.tests.utils import use_temporary_media_root
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_dataset(1000)
+        if connection.vendor == "postgresql":
+            # PostgreSQL plans from table statistics, SQLite without any
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def setUp(self):
+        # The write routes upload photos and avatars
+        use_temporary_media_root(self)
+
+    def test_no_full_scans(self):
+        """Test that no route reads a whole table to answer a request"""
+        scans = []
+        for scenario in build_scenarios():
+            scans.extend(find_full_scans(scenario))
+        self.assertEqual(scans, [])
+
+    def test_full_scans_detected(self):
+        """Test that unindexed filters and sorts are reported as full scans"""
+        unindexed_sort = str(Listing.objects.order_by("title").query)
+        self.assertEqual(full_scans(unindexed_sort), ["core_listing"])
+
+        unindexed_filter = str(Offer.objects.filter(price__isnull=True).query)
+        self.assertEqual(full_scans(unindexed_filter), ["core_offer"])
+
+        # Walking an index in the requested order is fine
+        newest = str(Listing.objects.order_by("-created_at", "-id")[:20].query)
+        self.assertEqual(full_scans(newest), [])
+
+    @skipUnless(connection.vendor == "sqlite", "Checks a SQLite query plan")
+    def test_price_sort_reads_index_in_order(self):
+        """Test that a page of price sorted listings needs no sort"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                "/listing/",
+                {"time_unit": "H", "sort_by": "price_desc", "page_size": 20},
+            )
+        listings = response.json()["results"]
+        self.assertEqual(len(listings), 20)
+        self.assertEqual(len({listing["id"] for listing in listings}), 20)
+
+        plan = explain(context.captured_queries[0]["sql"])
+        self.assertIn("listingrate_price_idx", plan[0])
+        self.assertFalse([line for line in plan if "TEMP B-TREE" in line])
@@ -0,0 +1,102 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from backend.core import renderers
+from backend.core.models import Category, Listing, ListingType, User
+from backend.core.renderers import FastJSONRenderer, FastJsonResponse, dumps
+
+DATA = {
+    "price": Decimal("12.50"),
+    "created_at": datetime(2024, 5, 1, 9, 30, 15, 123456, tzinfo=timezone.utc),
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "label": gettext_lazy("Electronics"),
+    "rates": [{"rate": Decimal("3.00")}],
+    1: "non string key",
+}
+
+
+class RendererTests(TestCase):
+    def test_dumps(self):
+        """Test that orjson encodes the same values as the standard library"""
+        expected = json.loads(json.dumps(DATA, cls=DjangoJSONEncoder))
+        self.assertEqual(json.loads(dumps(DATA)), expected)
+        self.assertEqual(expected["created_at"], "2024-05-01T09:30:15.123Z")
+        self.assertEqual(expected["price"], "12.50")
+
+        with override_settings(FAST_JSON=False):
+            self.assertEqual(json.loads(dumps(DATA)), expected)
+        # Without orjson installed
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertEqual(json.loads(dumps(DATA)), expected)
+
+        # Anything neither encoder knows still fails
+        with self.assertRaises(TypeError):
+            dumps({"value": object()})
+
+    def test_fast_json_response(self):
+        """Test that FastJsonResponse behaves like JsonResponse"""
+        response = FastJsonResponse([{"price": Decimal("1.10")}], safe=False)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(response.content), [{"price": "1.10"}])
+
+        response = FastJsonResponse({"error": "Not found"}, status=404)
+        self.assertEqual(response.status_code, 404)
+
+        # Bad case - lists have to be asked for
+        with self.assertRaises(TypeError):
+            FastJsonResponse([1, 2])
+
+    def test_renderer(self):
+        """Test that DRF responses are rendered through orjson"""
+        renderer = FastJSONRenderer()
+        self.assertEqual(renderer.render(None), b"")
+        # Same values as DRF's own encoder, which makes floats of Decimals
+        # the serializer fields didn't already turn into strings
+        with override_settings(FAST_JSON=False):
+            expected = json.loads(renderer.render(DATA))
+        self.assertEqual(json.loads(renderer.render(DATA)), expected)
+        self.assertEqual(expected["price"], 12.5)
+        # Indented responses are left to the standard library
+        indented = renderer.render(
+            {"a": 1}, "application/json; indent=2", {"indent": None}
+        )
+        self.assertEqual(indented, b'{\n  "a": 1\n}')
+
+    def test_views(self):
+        """Test that the list and DRF views answer with the fast encoder"""
+        user = User.objects.create_user(
+            username="owner",
+            email="owner@example.com",
+            password="testpass123",
+            phone_number="88888888",
+        )
+        Listing.objects.create(
+            title="Test Item",
+            description="Test description",
+            category=Category.ELECTRONICS,
+            listing_type=ListingType.RENTAL,
+            uploaded_by=user,
+        )
+        client = APIClient()
+
+        with mock.patch.object(
+            renderers.orjson, "dumps", wraps=renderers.orjson.dumps
+        ) as orjson_dumps:
+            response = client.get("/listing/")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()[0]["title"], "Test Item")
+
+            client.force_authenticate(user=user)
+            response = client.get("/user/")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()["username"], "owner")
+        self.assertEqual(orjson_dumps.call_count, 2)
@@ -1,4 +1,5 @@
 import json
+from io import StringIO
 from pprint import pprint
 from decimal import Decimal
 from django.utils import timezone
@@ -6,6 +7,7 @@ from datetime import timedelta
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.test import TestCase
+from django.core.management import call_command
 
 from backend.core.models import (
     User,
@@ -207,3 +209,42 @@ class ReviewTestCase(TestCase):
         self.assertAlmostEqual(
             float(profile_response.data["average_rating"]), expected_average
         )
+
+    def test_rating_aggregate_maintained(self):
+        """Test that the stored rating aggregate follows review creates and deletes"""
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.rating_count, 2)
+        self.assertEqual(self.user1.rating_total, 9)
+        self.assertAlmostEqual(self.user1.average_rating, 4.5)
+
+        self.review1.delete()
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.rating_count, 1)
+        self.assertEqual(self.user1.average_rating, 4)
+
+        # Queryset deletes are counted as well
+        Review.objects.filter(user=self.user1).delete()
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.rating_count, 0)
+        self.assertEqual(self.user1.average_rating, 0)
+
+        # The rebuild command recomputes from the reviews themselves
+        User.objects.filter(pk=self.user2.pk).update(rating_count=7, rating_total=1)
+        call_command("rebuild-ratings", stdout=StringIO())
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user2.rating_count, 1)
+        self.assertEqual(self.user2.rating_total, 5)
+
+    def test_review_list_query_count(self):
+        """Test that listing reviews does not aggregate ratings per review"""
+        for i in range(5):
+            Review.objects.create(
+                reviewer=self.user3, user=self.user1, rating=3, description=f"{i}"
+            )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                f"/reviews/?user_id={self.user1.id}", format="json"
+            )
+        self.assertEqual(len(response.json()), 7)
+        self.assertAlmostEqual(response.json()[0]["user"]["average_rating"], 24 / 7)
@@ -0,0 +1,106 @@
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.core.middleware import ReplicaRoutingMiddleware
+from backend.core.models import User
+from backend.core.routers import ReplicaRouter, replica_reads
+
+
+class ReplicaRouterTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter(replicas=["replica1", "replica2"])
+        self.set_usable(replica1=True, replica2=True)
+
+    def set_usable(self, **usable):
+        # Stands in for a recent lag check of each replica
+        for alias, value in usable.items():
+            self.router.health[alias] = (time.monotonic(), value)
+
+    def test_reads_outside_requests_use_primary(self):
+        """Test that reads only go to replicas inside replica_reads"""
+        self.assertEqual(self.router.db_for_read(User), "default")
+        self.assertEqual(self.router.db_for_write(User), "default")
+
+    def test_round_robin(self):
+        """Test that reads take turns between the replicas"""
+        with replica_reads():
+            aliases = [self.router.db_for_read(User) for _ in range(4)]
+            self.assertEqual(self.router.db_for_write(User), "default")
+        self.assertEqual(aliases, ["replica1", "replica2", "replica1", "replica2"])
+
+    def test_unusable_replicas_skipped(self):
+        """Test that lagging replicas are skipped, then the primary is used"""
+        self.set_usable(replica1=False)
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(User), "replica2")
+            self.assertEqual(self.router.db_for_read(User), "replica2")
+
+            self.set_usable(replica2=False)
+            self.assertEqual(self.router.db_for_read(User), "default")
+
+    def test_lag_check(self):
+        """Test that a replica is skipped when it lags more than allowed"""
+        # The test database stands in for a replica, it never lags
+        router = ReplicaRouter(replicas=["default"])
+        self.assertTrue(router.is_usable("default"))
+
+        router.health.clear()
+        with override_settings(REPLICA_MAX_LAG_SECONDS=-1):
+            with self.assertLogs("backend.core.routers", "WARNING"):
+                self.assertFalse(router.is_usable("default"))
+
+    def test_migrations_only_on_primary(self):
+        """Test that replicas get their schema from replication"""
+        self.assertTrue(self.router.allow_migrate("default", "core"))
+        self.assertFalse(self.router.allow_migrate("replica1", "core"))
+
+
+class ReplicaRoutingMiddlewareTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(
+            username="user",
+            email="user@example.com",
+            password="testpass123",
+            phone_number="88888888",
+        )
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+        router = ReplicaRouter(replicas=["replica1"])
+        router.health["replica1"] = (time.monotonic(), True)
+        self.read_from = []
+
+        def get_response(request):
+            self.read_from.append(router.db_for_read(User))
+            return HttpResponse(status=201 if request.method == "POST" else 200)
+
+        self.middleware = ReplicaRoutingMiddleware(get_response)
+        self.middleware.enabled = True
+
+    def test_reads_go_to_replicas(self):
+        """Test that GET requests read from the replicas"""
+        self.middleware(self.factory.get("/listing/"))
+        self.middleware(self.factory.get("/offers/", headers=self.headers))
+        self.assertEqual(self.read_from, ["replica1", "replica1"])
+
+    def test_reads_pinned_after_write(self):
+        """Test that a user reads from the primary right after writing"""
+        self.middleware(self.factory.post("/offers/", headers=self.headers))
+        self.middleware(self.factory.get("/offers/", headers=self.headers))
+        # Other users still read from the replicas
+        self.middleware(self.factory.get("/offers/"))
+        self.assertEqual(self.read_from, ["default", "default", "replica1"])
+
+    @override_settings(REPLICA_PIN_SECONDS=1)
+    def test_pin_expires(self):
+        """Test that reads go back to the replicas once the pin expires"""
+        self.middleware(self.factory.post("/offers/", headers=self.headers))
+        time.sleep(1.1)
+        self.middleware(self.factory.get("/offers/", headers=self.headers))
+        self.assertEqual(self.read_from, ["default", "replica1"])
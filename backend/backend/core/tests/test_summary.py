@@ -0,0 +1,196 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from backend.core.models import (
+    Category,
+    Listing,
+    ListingType,
+    Offer,
+    Review,
+    TimeUnit,
+    Transaction,
+    User,
+    UserSummary,
+)
+
+
+class SummaryTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.owner = User.objects.create_user(
+            username="owner",
+            email="owner@example.com",
+            password="testpass123",
+            phone_number="88888888",
+        )
+        self.renter = User.objects.create_user(
+            username="renter",
+            email="renter@example.com",
+            password="testpass123",
+            phone_number="99999999",
+        )
+        self.listing = Listing.objects.create(
+            title="Test Item",
+            description="Test description",
+            category=Category.ELECTRONICS,
+            listing_type=ListingType.RENTAL,
+            uploaded_by=self.owner,
+        )
+
+    def make_offer(self, hours_ahead=1):
+        start = timezone.now() + timedelta(hours=hours_ahead)
+        return Offer.objects.create(
+            offered_by=self.renter,
+            listing=self.listing,
+            price=10,
+            scheduled_start=start,
+            scheduled_end=start + timedelta(hours=2),
+            time_unit=TimeUnit.HOURLY,
+            time_delta=2,
+        )
+
+    def get_summary(self, user):
+        self.client.force_authenticate(user=user)
+        response = self.client.get("/summary/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_summary(self):
+        """Test that the summary follows offers, transactions and reviews"""
+        offer = self.make_offer()
+        self.make_offer(hours_ahead=10).reject()
+
+        summary = self.get_summary(self.owner)
+        self.assertEqual(summary["active_listings"], 1)
+        self.assertEqual(summary["offers_received"]["pending"], 1)
+        self.assertEqual(summary["offers_received"]["rejected"], 1)
+        self.assertEqual(summary["pending_actions"]["offers_to_answer"], 1)
+
+        offer.accept()
+        summary = self.get_summary(self.renter)
+        self.assertEqual(summary["offers_made"]["pending"], 0)
+        self.assertEqual(summary["offers_made"]["accepted"], 1)
+        self.assertEqual(summary["pending_actions"]["offers_to_pay"], 1)
+        self.assertEqual(summary["active_listings"], 0)
+
+        payment = Transaction.objects.create(
+            user=self.renter, offer=offer, amount=20, payment_id="PAY"
+        )
+        payment.complete()
+        offer.paid()
+        Review.objects.create(reviewer=self.renter, user=self.owner, rating=4)
+
+        summary = self.get_summary(self.owner)
+        self.assertEqual(summary["earned"], "20.00")
+        self.assertEqual(summary["spent"], "0.00")
+        self.assertEqual(summary["offers_received"]["paid"], 1)
+        self.assertEqual(summary["offers_received"]["accepted"], 0)
+        self.assertEqual(summary["rating"], {"average": 4, "count": 1})
+        self.assertEqual(self.get_summary(self.renter)["spent"], "20.00")
+
+        payment.refund()
+        self.assertEqual(self.get_summary(self.owner)["earned"], "0.00")
+
+    def test_summary_query_count(self):
+        """Test that the summary is a single read"""
+        for hours in range(0, 20, 4):
+            self.make_offer(hours_ahead=hours)
+        self.client.force_authenticate(user=self.owner)
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/summary/")
+        self.assertEqual(response.json()["offers_received"]["pending"], 5)
+
+        # Users without anything counted yet see zeros
+        other = User.objects.create_user(
+            username="other",
+            email="other@example.com",
+            password="testpass123",
+            phone_number="77777777",
+        )
+        summary = self.get_summary(other)
+        self.assertEqual(summary["active_listings"], 0)
+        self.assertEqual(summary["earned"], "0.00")
+
+        # Bad case - not logged in
+        self.client.force_authenticate(user=None)
+        response = self.client.get("/summary/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_summary_after_deletes(self):
+        """Test that cascading deletes are taken off the summaries"""
+        offer = self.make_offer()
+        offer.accept()
+        Transaction.objects.create(
+            user=self.renter,
+            offer=offer,
+            amount=20,
+            status=Transaction.COMPLETED,
+            payment_id="PAY",
+        )
+        self.assertEqual(self.get_summary(self.renter)["spent"], "20.00")
+
+        self.listing.delete()
+        summary = self.get_summary(self.renter)
+        self.assertEqual(summary["spent"], "0.00")
+        self.assertEqual(summary["offers_made"]["accepted"], 0)
+        summary = self.get_summary(self.owner)
+        self.assertEqual(summary["active_listings"], 0)
+        self.assertEqual(summary["earned"], "0.00")
+
+    def test_rebuild(self):
+        """Test that rebuilding from the rows matches the incremental counts"""
+        self.make_offer().accept()
+        self.make_offer(hours_ahead=10)
+        expected = {
+            user: self.get_summary(user) for user in (self.owner, self.renter)
+        }
+
+        UserSummary.objects.all().delete()
+        call_command("rebuild-summaries", stdout=StringIO())
+        for user, summary in expected.items():
+            self.assertEqual(self.get_summary(user), summary)
+
+    def test_adjust_concurrent_first_count(self):
+        """Test that a summary made by a concurrent first count is counted into"""
+        # The summary shows up between the update finding nothing and the create
+        UserSummary.objects.create(user=self.renter)
+        filter = UserSummary.objects.filter
+        missed = [UserSummary.objects.none()]
+
+        def first_misses(**kwargs):
+            return missed.pop() if missed else filter(**kwargs)
+
+        with mock.patch.object(UserSummary.objects, "filter", first_misses):
+            UserSummary.objects.adjust(self.renter.pk, made_pending=1)
+        self.assertEqual(UserSummary.objects.get(user=self.renter).made_pending, 1)
+
+    def test_concurrent_transitions(self):
+        """Test that two changes of the same offer are counted once"""
+        offer = self.make_offer()
+        # Both read the offer while it was pending
+        stale = Offer.objects.get(pk=offer.pk)
+        offer.accept()
+        stale.accept()
+        self.assertEqual(stale.status, Offer.ACCEPTED)
+
+        summary = self.get_summary(self.owner)
+        self.assertEqual(summary["offers_received"]["pending"], 0)
+        self.assertEqual(summary["offers_received"]["accepted"], 1)
+
+        # A rejection that lost to the accept leaves it accepted
+        stale = Offer.objects.get(pk=self.make_offer(hours_ahead=10).pk)
+        Offer.objects.get(pk=stale.pk).accept()
+        stale.reject()
+        self.assertEqual(stale.status, Offer.ACCEPTED)
+        summary = self.get_summary(self.owner)
+        self.assertEqual(summary["offers_received"]["accepted"], 2)
+        self.assertEqual(summary["offers_received"]["rejected"], 0)
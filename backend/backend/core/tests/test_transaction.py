@@ -106,6 +106,68 @@ class TransactionTestCase(TestCase):
         data = response.json()
         self.assertEqual(len(data), 0)
 
+    def test_get_transactions_compact(self):
+        """Test the flat transaction history and its query count"""
+        for i in range(4):
+            Transaction.objects.create(
+                user=self.renter,
+                offer=self.offer,
+                amount=10 + i,
+                payment_id=f"TEST_PAYMENT_{i + 2}",
+            )
+        self.client.force_authenticate(user=self.renter)
+
+        # The nested history is one joined query too
+        with self.assertNumQueries(1):
+            response = self.client.get("/transactions/")
+        self.assertEqual(len(response.json()), 5)
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/transactions/", {"compact": "true"})
+        data = response.json()
+        self.assertEqual(len(data), 5)
+
+        # Newest first
+        transaction = data[-1]
+        self.assertEqual(transaction["id"], self.transaction1.id)
+        self.assertEqual(transaction["status_display"], "Completed")
+        self.assertEqual(transaction["offer_id"], self.offer.id)
+        self.assertEqual(transaction["time_unit"], TimeUnit.HOURLY)
+        self.assertEqual(transaction["listing_title"], "Test Item")
+        self.assertEqual(transaction["counterparty_id"], self.owner.id)
+        self.assertEqual(transaction["counterparty_username"], "owner")
+        self.assertNotIn("offer", transaction)
+
+    def test_get_transactions_filtered(self):
+        """Test filtering and paging through the transaction history"""
+        later = Transaction.objects.create(
+            user=self.renter, offer=self.offer, amount=5, payment_id="LATER"
+        )
+        Transaction.objects.filter(id=later.id).update(
+            created_at=timezone.now() + timedelta(days=2)
+        )
+        self.client.force_authenticate(user=self.renter)
+
+        start = (timezone.now() + timedelta(days=1)).isoformat()
+        response = self.client.get("/transactions/", {"start": start})
+        self.assertEqual([t["id"] for t in response.json()], [later.id])
+        response = self.client.get("/transactions/", {"end": start})
+        self.assertEqual([t["id"] for t in response.json()], [self.transaction1.id])
+
+        page1 = self.client.get(
+            "/transactions/", {"compact": "true", "page_size": 1}
+        ).json()
+        self.assertEqual([t["id"] for t in page1["results"]], [later.id])
+        page2 = self.client.get(page1["next"]).json()
+        self.assertEqual([t["id"] for t in page2["results"]], [self.transaction1.id])
+        self.assertIsNone(page2["next"])
+
+        # Bad cases - empty range and a junk cursor
+        response = self.client.get("/transactions/", {"start": start, "end": start})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/transactions/", {"cursor": "junk"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_transaction(self):
         """Test creating a new transaction"""
         self.client.force_authenticate(user=self.renter)
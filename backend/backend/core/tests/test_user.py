@@ -1,11 +1,15 @@
+from datetime import timedelta
 from decimal import Decimal
 import json
 from pprint import pprint
 from rest_framework.test import APIClient
 from rest_framework import status
-from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
 
 from backend.core.models import (
     User,
@@ -15,14 +19,24 @@ from backend.core.models import (
     ListingRate,
     ListingLocation,
     TimeUnit,
+    Offer,
+    UserSummary,
 )
 
-from backend.core.tests.utils import get_test_photo, get_blank_photo
+from backend.core import user_cache
+from backend.core.authentication import get_token_user
+from backend.core.tests.utils import (
+    get_blank_photo,
+    get_test_photo,
+    use_temporary_media_root,
+)
 
 
 class UserTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
+        use_temporary_media_root(self)
+        user_cache.clear()
 
         # Create a test avatar image
         self.test_avatar = get_blank_photo()
@@ -269,3 +283,129 @@ class UserTestCase(TestCase):
         self.client.force_authenticate(None)
         response = self.client.delete("/user/", format="json")
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_rehashes_password(self):
+        """Test that logging in rehashes a password stored at another cost"""
+        with override_settings(PBKDF2_ITERATIONS=1000):
+            self.existing_user.set_password("existing123")
+            self.existing_user.save()
+        self.assertIn("$1000$", self.existing_user.password)
+
+        # Reads the user and stores the new hash, the password is hashed once
+        with self.assertNumQueries(2):
+            self.login("existing@example.com", "existing123")
+        self.existing_user.refresh_from_db()
+        self.assertIn(f"${settings.PBKDF2_ITERATIONS}$", self.existing_user.password)
+        self.assertTrue(self.existing_user.check_password("existing123"))
+
+        with self.assertNumQueries(1):
+            self.login("existing@example.com", "existing123")
+
+    def login(self, email, password):
+        response = self.client.post(
+            "/api/login/", {"email": email, "password": password}, format="json"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return AccessToken(response.data["access"])
+
+    def test_token_user(self):
+        """Test that the user of a token comes from its claims"""
+        token = self.login("existing@example.com", "existing123")
+        self.assertEqual(token["email"], "existing@example.com")
+        self.assertEqual(token["username"], "existinguser")
+
+        # Only the transactions, no query for the user
+        with self.assertNumQueries(1):
+            response = self.client.get("/transactions/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Anything beyond the claims is loaded once, then kept by this process
+        user = get_token_user(token)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.phone_number, "11111111")
+            self.assertEqual(user.biography, "")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_token_user(token).phone_number, "11111111")
+
+    def test_token_user_changes(self):
+        """Test that the profile shows changes made after the token was issued"""
+        self.login("existing@example.com", "existing123")
+        response = self.client.put(
+            "/user/", {"username": "renamed"}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The token still says existinguser
+        response = self.client.get("/user/")
+        self.assertEqual(json.loads(response.content)["username"], "renamed")
+
+        # Other fields stay as they were
+        self.existing_user.refresh_from_db()
+        self.assertEqual(self.existing_user.phone_number, "11111111")
+        self.assertTrue(self.existing_user.check_password("existing123"))
+
+    def test_token_of_deleted_user(self):
+        """Test that the token of a deleted user is turned away once needed"""
+        self.login("existing@example.com", "existing123")
+        response = self.client.delete("/user/", format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get("/user/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_of_deleted_user_writes(self):
+        """Test that the token of a deleted user can't write anything"""
+        owner = User.objects.create_user(
+            username="owner",
+            email="owner@example.com",
+            password="owner123",
+            phone_number="22222222",
+        )
+        listing = Listing.objects.create(
+            title="Test Item",
+            description="Test description",
+            category=Category.ELECTRONICS,
+            listing_type=ListingType.RENTAL,
+            uploaded_by=owner,
+        )
+        self.login("existing@example.com", "existing123")
+        # Keeps the row in this process's user cache, as any earlier request would
+        self.client.get("/user/")
+        User.objects.filter(pk=self.existing_user.pk).delete()
+
+        start = timezone.now() + timedelta(hours=1)
+        data = {
+            "listing_id": listing.id,
+            "price": 15.00,
+            "scheduled_start": start.isoformat(),
+            "scheduled_end": (start + timedelta(hours=2)).isoformat(),
+            "time_unit": TimeUnit.HOURLY,
+            "time_delta": 2,
+        }
+        response = self.client.post("/offers/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(Offer.objects.exists())
+        self.assertFalse(
+            UserSummary.objects.filter(user_id=self.existing_user.pk).exists()
+        )
+
+    def test_update_keeps_concurrent_changes(self):
+        """Test that a profile update only writes the fields it changes"""
+        self.login("existing@example.com", "existing123")
+        # Keeps the row in this process's user cache
+        self.client.get("/user/")
+
+        # Changed elsewhere after the row was cached
+        User.objects.filter(pk=self.existing_user.pk).update(
+            biography="Written elsewhere", rating_count=1, rating_total=5
+        )
+        response = self.client.put(
+            "/user/", {"username": "renamed"}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.existing_user.refresh_from_db()
+        self.assertEqual(self.existing_user.username, "renamed")
+        self.assertEqual(self.existing_user.biography, "Written elsewhere")
+        self.assertEqual(self.existing_user.rating_count, 1)
+        self.assertEqual(self.existing_user.rating_total, 5)
@@ -1,9 +1,12 @@
 import io
 import os
+import shutil
+import tempfile
 import requests
 from urllib.parse import urlparse
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
 from PIL import Image
 
 
@@ -24,11 +27,19 @@ def get_test_photo():
     return image_file
 
 
-def get_blank_photo(filename="test_photo.jpg"):
+def get_blank_photo(filename="test_photo.jpg", size=(100, 100)):
     # Create a small test image in memory
     file_obj = io.BytesIO()
-    image = Image.new("RGB", (100, 100), "white")
+    image = Image.new("RGB", size, "white")
     image.save(file_obj, "JPEG")
     file_obj.seek(0)
 
     return SimpleUploadedFile(filename, file_obj.read(), content_type="image/jpeg")
+
+
+def use_temporary_media_root(test_case):
+    # Uploaded and generated files go to a directory removed after the test,
+    # rather than into the real MEDIA_ROOT
+    media_root = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+    test_case.enterContext(override_settings(MEDIA_ROOT=media_root))
@@ -0,0 +1,47 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Rows of the recently authenticated users, {user id: (expiry, {attname: value})}
+# Kept per process rather than in the shared cache, so a hit costs no round
+# trip at all, the short timeout bounds how stale another worker's copy gets
+MAX_USERS = 10_000
+
+_rows: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_row(user_id):
+    # The cached row of the user, or None if it isn't cached or has expired
+    with _lock:
+        entry = _rows.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _rows[user_id]
+            return None
+        _rows.move_to_end(user_id)
+        return entry[1]
+
+
+def set_row(user_id, row):
+    if settings.USER_CACHE_SECONDS <= 0:
+        return
+    with _lock:
+        _rows[user_id] = (time.monotonic() + settings.USER_CACHE_SECONDS, row)
+        _rows.move_to_end(user_id)
+        # Least recently used users go first
+        while len(_rows) > MAX_USERS:
+            _rows.popitem(last=False)
+
+
+def invalidate(user_id):
+    with _lock:
+        _rows.pop(user_id, None)
+
+
+def clear():
+    with _lock:
+        _rows.clear()
@@ -1,7 +1,10 @@
 import json
+from itertools import islice
 from django.db import transaction
-from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.db.models import F, OuterRef, Subquery
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib.auth.models import Group
 from django.shortcuts import render, get_object_or_404
 from drf_spectacular.utils import (
@@ -18,7 +21,6 @@ from rest_framework.request import Request
 from rest_framework.generics import GenericAPIView
 from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.decorators import (
     authentication_classes,
@@ -32,6 +34,7 @@ from django.contrib.auth.hashers import make_password
 from backend.core.models import (
     User,
     Listing,
+    ListingLocation,
     ListingPhoto,
     Offer,
     Review,
@@ -39,9 +42,26 @@ from backend.core.models import (
     Category,
     ListingType,
     TimeUnit,
+    UserSummary,
 )
+from backend.core import metrics
+from backend.core.authentication import (
+    CanReadMetrics,
+    ClaimsJWTAuthentication,
+    MetricsTokenAuthentication,
+)
+from backend.core.availability import get_busy_intervals_between
+from backend.core.geo import bounding_box, geohash_filter, haversine_km
+from backend.core.listing_cache import cache_anonymous_browse
+from backend.core.pagination import InvalidCursor, KeysetPaginator
+from backend.core.renderers import FastJsonResponse, dumps
+from backend.core.search import search_listings
 from backend.core.serializers import (
+    AvailabilityQuerySerializer,
+    BusyIntervalSerializer,
+    ListingExportQuerySerializer,
     ListingUpdateSerializer,
+    OfferQuerySerializer,
     ResetPasswordSerializer,
     UserSerializer,
     UserCreateSerializer,
@@ -50,11 +70,18 @@ from backend.core.serializers import (
     OfferSerializer,
     OfferCreateSerializer,
     ReviewSerializer,
+    TransactionHistorySerializer,
+    TransactionQuerySerializer,
     TransactionSerializer,
     UserUpdateSerializer,
+    UserSummarySerializer,
     CustomTokenObtainPairSerializer,
 )
 
+# Nearby listing searches, in km
+DEFAULT_RADIUS_KM = 5
+MAX_RADIUS_KM = 100
+
 # The views here will be mapped to a url in urls.py
 # Try to make specific user views, for each functionality
 # Make it small and distinct and easy to work on
@@ -85,11 +112,13 @@ class UserController(GenericAPIView):
         responses={200: UserSerializer},
         description="Get user details. Returns authenticated user if JWT is provided, otherwise returns user based on query parameter 'id'.",
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def get(self, request: Request):
         if request.user.is_authenticated:
             user = request.user
+            # The token's claims are as of login, show the current profile
+            user.refresh_from_db()
             serializer = self.get_serializer(user)
             return Response(serializer.data)
         else:
@@ -149,18 +178,22 @@ class UserController(GenericAPIView):
         request=UserUpdateSerializer,
         responses={200: UserSerializer},
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def put(self, request: Request):
-        user = request.user
-
         # Only allow the user to update their own profile information if they are authenticated
-        if not user.is_authenticated:
+        if not request.user.is_authenticated:
             return Response(
                 {"error": "You must be authenticated to update your profile"},
                 status=status.HTTP_401_UNAUTHORIZED,
             )
 
+        # The authenticated user may come from the user cache, the edits go on
+        # the current row and only the edited columns are written, so changes
+        # made in the meantime (ratings, other fields) are kept
+        user = User.objects.get(pk=request.user.pk)
+        updated_fields = []
+
         # Probably dont need the serializer
         # serializer = UserUpdateSerializer(data=request.data)
         # if not serializer.is_valid():
@@ -169,6 +202,7 @@ class UserController(GenericAPIView):
         # Update other optional fields
         if "username" in request.data:
             user.username = request.data["username"]
+            updated_fields.append("username")
         if "phone_number" in request.data:
             if User.objects.filter(phone_number=request.data["phone_number"]).exists():
                 return Response(
@@ -176,10 +210,13 @@ class UserController(GenericAPIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
             user.phone_number = request.data["phone_number"]
+            updated_fields.append("phone_number")
         if "avatar" in request.data:
             user.avatar = request.data["avatar"]
+            updated_fields.append("avatar")
         if "biography" in request.data:
             user.biography = request.data["biography"]
+            updated_fields.append("biography")
 
         # Update password if requested
         if "new_password" in request.data:
@@ -194,14 +231,15 @@ class UserController(GenericAPIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
             user.password = make_password(request.data["new_password"])
+            updated_fields.append("password")
 
         # Save the updated user information
-        user.save()
+        user.save(update_fields=updated_fields)
 
         # Return the updated user data
         return Response(UserSerializer(user).data, status=status.HTTP_200_OK)
 
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def delete(self, request: Request):
         if not request.user.is_authenticated:
@@ -214,6 +252,7 @@ class UserController(GenericAPIView):
         user.delete()
         return Response(status=status.HTTP_200_OK)
 
+
 class ListingController(GenericAPIView):
     """
     Listing endpoint, [GET, POST, PUT, DELETE]
@@ -228,7 +267,12 @@ class ListingController(GenericAPIView):
     For the DELETE request, it deletes a specific listing if the user is authorized.
     """
 
-    queryset = Listing.objects.all()
+    # Batch the reverse relations the ListingSerializer walks, so listing a
+    # page costs a constant number of queries instead of 3 extra per row.
+    # uploaded_by is only shown as its id, which the listing row already has
+    queryset = Listing.objects.prefetch_related(
+        "listingphoto_set", "rates", "locations"
+    )
     serializer_class = ListingSerializer
     parser_classes = (MultiPartParser, FormParser)
 
@@ -243,7 +287,7 @@ class ListingController(GenericAPIView):
             ),
             OpenApiParameter(
                 name="search",
-                description="Search listings by name",
+                description="Search listings by title and description, sorted by relevance",
                 required=False,
                 type=str,
             ),
@@ -275,35 +319,102 @@ class ListingController(GenericAPIView):
                 type=str,
                 enum=["price_asc", "price_desc"],
             ),
+            OpenApiParameter(
+                name="lat",
+                description="Latitude to search around, sorts the listings by distance",
+                required=False,
+                type=float,
+            ),
+            OpenApiParameter(
+                name="lng",
+                description="Longitude to search around",
+                required=False,
+                type=float,
+            ),
+            OpenApiParameter(
+                name="radius",
+                description="Search radius around lat, lng in km, defaults to 5",
+                required=False,
+                type=float,
+            ),
+            OpenApiParameter(
+                name="bbox",
+                description="Only listings inside min_lng,min_lat,max_lng,max_lat",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="Opaque cursor from a previous page's next/previous link",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="page_size",
+                description="Paginate the results with this many listings per page",
+                required=False,
+                type=int,
+            ),
         ],
     )
+    @cache_anonymous_browse
     def get(self, request: Request):
-        queryset = self.get_queryset()
         listing_id = request.query_params.get("id", None)
-        search_query = request.query_params.get("search", None)
-        category = request.query_params.get("category", None)
-        listing_type = request.query_params.get("listing_type", None)
-        time_unit = request.query_params.get("time_unit", None)
-        sort_by = request.query_params.get("sort_by", None)
 
         # If a listing id was provided, we try to retrieve it
         # If the listing does not exist in the databse, then we need to error out
         # If the listing id was not provided, this will be skipped
         if listing_id:
             try:
-                listing = Listing.objects.get(id=listing_id)
+                listing = self.get_queryset().get(id=listing_id)
                 serializer = self.get_serializer(listing)
-                return JsonResponse(serializer.data)
+                return FastJsonResponse(serializer.data)
             except Listing.DoesNotExist:
-                return JsonResponse({"error": "Listing not found"}, status=404)
+                return FastJsonResponse({"error": "Listing not found"}, status=404)
 
-        # filter by search query
-        if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query)
-                | Q(description__icontains=search_query)
+        try:
+            queryset, ordering = self.filter_listings(request)
+        except ValueError as e:
+            return FastJsonResponse({"error": str(e)}, status=400)
+
+        if KeysetPaginator.is_requested(request):
+            try:
+                listings, next_url, previous_url = KeysetPaginator(ordering).paginate(
+                    queryset, request
+                )
+            except InvalidCursor as e:
+                return FastJsonResponse({"error": str(e)}, status=400)
+
+            serializer = self.get_serializer(listings, many=True)
+            return FastJsonResponse(
+                {
+                    "next": next_url,
+                    "previous": previous_url,
+                    "results": serializer.data,
+                }
             )
 
+        serializer = self.get_serializer(queryset, many=True)
+        return FastJsonResponse(serializer.data, safe=False)
+
+    def filter_listings(self, request: Request):
+        """
+        The listings matching the browse parameters, ordered, along with their
+        keyset ordering, raises ValueError for invalid parameters
+
+        Only builds the queryset, so the async controller shares it too
+        """
+        queryset = self.get_queryset()
+        search_query = request.query_params.get("search", None)
+        category = request.query_params.get("category", None)
+        listing_type = request.query_params.get("listing_type", None)
+        time_unit = request.query_params.get("time_unit", None)
+        sort_by = request.query_params.get("sort_by", None)
+
+        # filter by search query, through the full text index
+        if search_query:
+            queryset = search_listings(queryset, search_query)
+
         # filter by category
         if category:
             queryset = queryset.filter(category=category)
@@ -312,36 +423,116 @@ class ListingController(GenericAPIView):
         if listing_type:
             queryset = queryset.filter(listing_type=listing_type)
 
+        # filter by distance from a point, or by a bounding box
+        nearby = self.get_nearby_locations(request)
+        in_box = self.get_bbox_locations(request)
+
+        if nearby is not None:
+            queryset = queryset.filter(id__in=nearby.values("listing_id")).annotate(
+                # Distance to the closest location of the listing
+                distance=Subquery(
+                    nearby.filter(listing=OuterRef("pk"))
+                    .order_by("distance")
+                    .values("distance")[:1]
+                )
+            )
+
+        if in_box is not None:
+            queryset = queryset.filter(id__in=in_box.values("listing_id"))
+
+        # Keyset ordering for the paginated response, always ends in id so
+        # listings sharing a timestamp or price still have a stable position
+        ordering = [("created_at", True), ("id", True)]
+        # Nearby searches are sorted by distance and searches by relevance,
+        # unless sorting by price
+        if nearby is not None:
+            ordering = [("distance", False), ("id", False)]
+        elif search_query:
+            ordering = [("search_rank", False), ("id", False)]
+
         if time_unit:
             queryset = queryset.filter(rates__time_unit=time_unit)
 
             if sort_by:
                 # If sort_by is specified, sort by price
+                # price reuses the rates join from the time_unit filter above,
+                # which matches one rate per listing. Ties are broken by the
+                # rate's id rather than the listing's, that is the order of
+                # listingrate_price_idx
+                queryset = queryset.annotate(
+                    price=F("rates__rate"), rate_id=F("rates__id")
+                )
                 if sort_by == "price_asc":
-                    queryset = queryset.order_by("rates__rate")
+                    ordering = [("price", False), ("rate_id", False)]
                 elif sort_by == "price_desc":
-                    queryset = queryset.order_by("-rates__rate")
-            else:
-                queryset = queryset.order_by("-created_at")
+                    ordering = [("price", True), ("rate_id", True)]
         elif sort_by:
             # cannot have sort by without a time_unit
-            return Response(
-                {"error": "Time unit must be specified when sorting by price"},
-                status=status.HTTP_400_BAD_REQUEST,
+            raise ValueError("Time unit must be specified when sorting by price")
+
+        queryset = queryset.order_by(
+            *[f"-{field}" if descending else field for field, descending in ordering]
+        )
+        return queryset, ordering
+
+    def get_nearby_locations(self, request: Request):
+        """
+        Locations within radius km of lat, lng annotated with their distance,
+        or None if no point was given
+        """
+        if "lat" not in request.query_params and "lng" not in request.query_params:
+            return None
+
+        try:
+            latitude = float(request.query_params["lat"])
+            longitude = float(request.query_params["lng"])
+            radius = float(request.query_params.get("radius", DEFAULT_RADIUS_KM))
+        except (KeyError, ValueError):
+            raise ValueError("lat, lng and radius must be numbers")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("lat or lng is out of range")
+        if not 0 < radius <= MAX_RADIUS_KM:
+            raise ValueError(f"radius must be between 0 and {MAX_RADIUS_KM} km")
+
+        # The geohash ranges narrow it down through the index, then the exact
+        # distance drops the corners of the covering cells
+        return (
+            ListingLocation.objects.filter(
+                geohash_filter(*bounding_box(latitude, longitude, radius))
             )
-        else:
-            # if neither time_unit nor sort_by are specified, use default sorting
-            queryset = queryset.order_by("-created_at")
+            .annotate(distance=haversine_km(latitude, longitude))
+            .filter(distance__lte=radius)
+        )
 
-        serializer = self.get_serializer(queryset, many=True)
-        return JsonResponse(serializer.data, safe=False)
+    def get_bbox_locations(self, request: Request):
+        """
+        Locations inside bbox=min_lng,min_lat,max_lng,max_lat, or None if no
+        bounding box was given
+        """
+        if "bbox" not in request.query_params:
+            return None
+
+        try:
+            min_lng, min_lat, max_lng, max_lat = [
+                float(value) for value in request.query_params["bbox"].split(",")
+            ]
+        except ValueError:
+            raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+        if min_lat > max_lat or min_lng > max_lng:
+            raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+
+        return ListingLocation.objects.filter(
+            geohash_filter(min_lat, min_lng, max_lat, max_lng),
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lng, max_lng),
+        )
 
     # user posts a listing
     @extend_schema(
         request=ListingCreateSerializer,
         responses={201: ListingSerializer},
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def post(self, request: Request):
         request_copy = request.data.copy()
@@ -361,7 +552,7 @@ class ListingController(GenericAPIView):
         request=ListingUpdateSerializer,
         responses={200: ListingSerializer},
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def put(self, request: Request):
         listing_id = request.data.get("id")
@@ -398,7 +589,7 @@ class ListingController(GenericAPIView):
         ],
         responses={204: None, 403: None, 404: None},
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def delete(self, request: Request):
         listing_id = request.query_params.get("id")
@@ -419,6 +610,80 @@ class ListingController(GenericAPIView):
         return Response(status=status.HTTP_200_OK)
 
 
+class ListingExportController(GenericAPIView):
+    """
+    Listing export endpoint, [GET]
+
+    For the GET request, it streams every listing as newline delimited JSON, one
+    ListingSerializer object per line, least recently updated first. The listings
+    are read, serialized and written out a chunk at a time, so memory stays flat
+    however many there are.
+
+    Incremental syncs pass the updated_at of the last line they got as
+    updated_since. It is inclusive so listings updated in the same instant are
+    not missed, the listings already seen come again and can be skipped by id.
+    """
+
+    queryset = ListingController.queryset
+    serializer_class = ListingSerializer
+
+    # Listings fetched, prefetched and serialized at a time
+    chunk_size = 500
+    # Served by listing_updated_idx
+    ordering = ("updated_at", "id")
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="updated_since",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Only listings updated at or after this time",
+                required=False,
+            ),
+        ],
+        responses={(200, "application/x-ndjson"): ListingSerializer},
+    )
+    def get(self, request: Request):
+        query = ListingExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset().order_by(*self.ordering)
+        if "updated_since" in query.validated_data:
+            queryset = queryset.filter(
+                updated_at__gte=query.validated_data["updated_since"]
+            )
+        # The rows are read after the view returns, outside the replica
+        # routing of the request, so the database is picked now
+        queryset = queryset.using(queryset.db)
+
+        chunks = self.stream(queryset)
+        if isinstance(request._request, ASGIRequest):
+            # Django reads a sync iterator whole before sending any of it
+            # under ASGI, only an async one is streamed
+            chunks = self.astream(chunks)
+        return StreamingHttpResponse(chunks, content_type="application/x-ndjson")
+
+    def stream(self, queryset):
+        # iterator() reads through a server-side cursor where the database has
+        # them, and runs the prefetches once per chunk_size listings
+        listings = queryset.iterator(chunk_size=self.chunk_size)
+        while chunk := list(islice(listings, self.chunk_size)):
+            serializer = self.get_serializer(chunk, many=True)
+            yield b"".join(dumps(listing) + b"\n" for listing in serializer.data)
+
+    async def astream(self, chunks):
+        # The sync chunks one at a time, read in the request's sync thread like
+        # every other query of the request, the cursor stays on its connection
+        read = sync_to_async(next)
+        try:
+            while chunk := await read(chunks, None):
+                yield chunk
+        finally:
+            await sync_to_async(chunks.close)()
+
+
 class OfferController(GenericAPIView):
     """
     Offers endpoint, [GET, POST, PUT]
@@ -431,8 +696,29 @@ class OfferController(GenericAPIView):
     For the PUT request, the use case is to accept or reject an offer
     """
 
+    # Joins the user and listing the OfferSerializer shows and loads only the
+    # columns it emits, so listing offers is a single query however many
+    queryset = Offer.objects.select_related("offered_by", "listing").only(
+        "id",
+        "price",
+        "status",
+        "created_at",
+        "scheduled_start",
+        "scheduled_end",
+        "time_unit",
+        "time_delta",
+        "offered_by__id",
+        "offered_by__username",
+        "offered_by__email",
+        "listing__id",
+        "listing__title",
+        "listing__category",
+    )
     serializer_class = OfferSerializer
 
+    # Newest first, the pages follow the same order
+    ordering = [("created_at", True), ("id", True)]
+
     # The query set should filter out the listing for the user
     def get_queryset(self):
         # Get all listings requested by the JWT-ed user
@@ -456,30 +742,109 @@ class OfferController(GenericAPIView):
                 required=False,
                 enum=["received", "made"],
             ),
+            OpenApiParameter(
+                name="status",
+                type=str,
+                location=OpenApiParameter.QUERY,
+                description="Only offers in these statuses, can be repeated",
+                required=False,
+                enum=[choice[0] for choice in Offer.STATUS_CHOICES],
+                many=True,
+            ),
+            OpenApiParameter(
+                name="start",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Only offers scheduled to end after this time",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="end",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Only offers scheduled to start before this time",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="cursor",
+                type=str,
+                location=OpenApiParameter.QUERY,
+                description="Opaque cursor from a previous page's next/previous link",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="page_size",
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description="Paginate the results with this many offers per page",
+                required=False,
+            ),
         ],
         responses={200: OfferSerializer(many=True)},
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def get(self, request: Request):
-        listing_id = request.query_params.get("listing_id")
-        offer_type = request.query_params.get("type", "received")
+        query = OfferQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        if listing_id:
-            listing = get_object_or_404(Listing, id=listing_id)
-            queryset = Offer.objects.filter(listing=listing)
-            serializer = self.get_serializer(queryset, many=True)
-            return JsonResponse(serializer.data, safe=False)
+        listing_id = query.validated_data.get("listing_id")
+        if listing_id is not None:
+            get_object_or_404(Listing, id=listing_id)
+        queryset = self.filter_offers(request.user, query.validated_data)
 
-        if offer_type == "received":
-            # Get offers for listings uploaded by the current user
-            queryset = Offer.objects.filter(listing__uploaded_by=request.user)
-        elif offer_type == "made":
-            # Get offers made by the current user
-            queryset = Offer.objects.filter(offered_by=request.user)
+        if KeysetPaginator.is_requested(request):
+            try:
+                offers, next_url, previous_url = KeysetPaginator(
+                    self.ordering
+                ).paginate(queryset, request)
+            except InvalidCursor as e:
+                return FastJsonResponse({"error": str(e)}, status=400)
+
+            serializer = self.get_serializer(offers, many=True)
+            return FastJsonResponse(
+                {
+                    "next": next_url,
+                    "previous": previous_url,
+                    "results": serializer.data,
+                }
+            )
 
         serializer = self.get_serializer(queryset, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        return FastJsonResponse(serializer.data, safe=False)
+
+    def filter_offers(self, user, query):
+        """
+        The offers matching the validated OfferQuerySerializer data, ordered
+
+        Only builds the queryset, so the async controller shares it too
+        """
+        queryset = self.queryset
+
+        if "listing_id" in query:
+            queryset = queryset.filter(listing=query["listing_id"])
+        elif query["type"] == "received":
+            # Get offers for listings uploaded by the current user
+            queryset = queryset.filter(listing__uploaded_by=user)
+        else:
+            # Get offers made by the current user
+            queryset = queryset.filter(offered_by=user)
+
+        if query.get("status"):
+            queryset = queryset.filter(status__in=query["status"])
+        # Offers whose schedule overlaps [start, end)
+        if "start" in query:
+            queryset = queryset.filter(scheduled_end__gt=query["start"])
+        if "end" in query:
+            queryset = queryset.filter(scheduled_start__lt=query["end"])
+
+        return queryset.order_by(
+            *[
+                f"-{field}" if descending else field
+                for field, descending in self.ordering
+            ]
+        )
 
     # @extend_schema(
     #     request=OfferCreateSerializer,
@@ -505,7 +870,7 @@ class OfferController(GenericAPIView):
             ),
         ],
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def post(self, request: Request):
         # Need to pass in context manually as the default serializer is the get serializer
@@ -528,26 +893,32 @@ class OfferController(GenericAPIView):
             scheduled_start = serializer.validated_data["scheduled_start"]
             scheduled_end = serializer.validated_data["scheduled_end"]
 
-            conflicting_offers = Offer.objects.filter(
-                listing_id=listing_id,
-                # TODO : This also means that when they post the request
-                # any pending offers will be counted as a collision
-                # this technically isn't a bug, just something to take note.
-                status__in=[Offer.PENDING, Offer.ACCEPTED, Offer.PAID],
-                scheduled_start__lt=scheduled_end,
-                scheduled_end__gt=scheduled_start,
-            )
-
-            if conflicting_offers.exists():
-                return Response(
-                    {
-                        "error": "Schedule collision detected. Please choose a different time."
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
+            with transaction.atomic():
+                # Lock the listing so concurrent offers for the same listing
+                # queue up here, otherwise both could pass the check below
+                Listing.objects.select_for_update().get(id=listing_id)
+
+                # Served by offer_schedule_idx
+                conflicting_offers = Offer.objects.filter(
+                    listing_id=listing_id,
+                    # TODO : This also means that when they post the request
+                    # any pending offers will be counted as a collision
+                    # this technically isn't a bug, just something to take note.
+                    status__in=Offer.BLOCKING_STATUSES,
+                    scheduled_start__lt=scheduled_end,
+                    scheduled_end__gt=scheduled_start,
                 )
 
-            # if there are no errors, then we will save this into the model
-            serializer.save()
+                if conflicting_offers.exists():
+                    return Response(
+                        {
+                            "error": "Schedule collision detected. Please choose a different time."
+                        },
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+
+                # if there are no errors, then we will save this into the model
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -575,7 +946,7 @@ class OfferController(GenericAPIView):
         },
         responses={200: OfferSerializer},
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def put(self, request: Request):
         offer_id = request.data.get("offer_id")
@@ -606,6 +977,66 @@ class OfferController(GenericAPIView):
         return Response(serializer.data)
 
 
+class AvailabilityController(GenericAPIView):
+    """
+    Availability endpoint, [GET]
+
+    For the GET request, it returns the busy intervals of a listing, these are the
+    merged schedules of its pending, accepted and paid offers, so the calendar can
+    grey them out without trying to POST an offer first
+    """
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="listing_id",
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description="ID of the listing to get the busy intervals for",
+                required=True,
+            ),
+            OpenApiParameter(
+                name="start",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Only return intervals ending after this time",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="end",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Only return intervals starting before this time",
+                required=False,
+            ),
+        ],
+        responses={
+            200: inline_serializer(
+                name="Availability",
+                fields={
+                    "listing_id": serializers.IntegerField(),
+                    "busy": BusyIntervalSerializer(many=True),
+                },
+            )
+        },
+    )
+    def get(self, request: Request):
+        query = AvailabilityQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        listing = get_object_or_404(Listing, id=query.validated_data["listing_id"])
+        busy = get_busy_intervals_between(
+            listing.id,
+            query.validated_data.get("start"),
+            query.validated_data.get("end"),
+        )
+        serializer = BusyIntervalSerializer(
+            [{"start": start, "end": end} for start, end in busy], many=True
+        )
+        return Response({"listing_id": listing.id, "busy": serializer.data})
+
+
 class ReviewsController(GenericAPIView):
     """
     Reviews endpoint, [GET, POST]
@@ -620,7 +1051,9 @@ class ReviewsController(GenericAPIView):
     # The query set should filter out the listing for the user
     def get_queryset(self):
         # Get all listings requested by the JWT-ed user
-        user_reviews = Review.objects.filter(user=self.request.user)
+        user_reviews = Review.objects.select_related("reviewer", "user").filter(
+            user=self.request.user
+        )
         # user_listings = Listing.objects.filter(uploaded_by=self.request.user)
         return user_reviews
 
@@ -636,22 +1069,26 @@ class ReviewsController(GenericAPIView):
         ],
         responses={200: OfferSerializer(many=True)},
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def get(self, request: Request):
         user_id = request.query_params.get("user_id")
         if request.user.is_authenticated:
             if user_id:
-                queryset = Review.objects.filter(user=user_id)
+                queryset = Review.objects.select_related("reviewer", "user").filter(
+                    user=user_id
+                )
             else:
                 queryset = self.get_queryset()
             serializer = self.get_serializer(queryset, many=True)
-            return JsonResponse(serializer.data, safe=False)
+            return FastJsonResponse(serializer.data, safe=False)
         else:
             if user_id:
-                queryset = Review.objects.filter(user=user_id)
+                queryset = Review.objects.select_related("reviewer", "user").filter(
+                    user=user_id
+                )
             serializer = self.get_serializer(queryset, many=True)
-            return JsonResponse(serializer.data, safe=False)
+            return FastJsonResponse(serializer.data, safe=False)
 
     @extend_schema(
         request=ReviewSerializer,
@@ -671,7 +1108,7 @@ class ReviewsController(GenericAPIView):
             ),
         ],
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def post(self, request: Request):
         user_id = request.data.get("user_id")
@@ -719,20 +1156,132 @@ class TransactionController(GenericAPIView):
 
     serializer_class = TransactionSerializer
 
+    # Everything the nested TransactionSerializer shows, joined in one query
+    queryset = Transaction.objects.select_related(
+        "user", "offer__offered_by", "offer__listing"
+    )
+    # Only the columns the flat TransactionHistorySerializer emits
+    compact_queryset = Transaction.objects.select_related(
+        "offer__listing__uploaded_by"
+    ).only(
+        "id",
+        "amount",
+        "status",
+        "created_at",
+        "payment_id",
+        "offer__id",
+        "offer__scheduled_start",
+        "offer__scheduled_end",
+        "offer__time_unit",
+        "offer__time_delta",
+        "offer__listing__id",
+        "offer__listing__title",
+        "offer__listing__uploaded_by__id",
+        "offer__listing__uploaded_by__username",
+    )
+
+    # Newest first, served by transaction_user_idx
+    ordering = [("created_at", True), ("id", True)]
+
     # The query set should filter out the listing for the user
     def get_queryset(self):
         # Get all listings requested by the JWT-ed user
-        user_transactions = Transaction.objects.filter(user=self.request.user)
+        user_transactions = self.queryset.filter(user=self.request.user)
         # user_listings = Listing.objects.filter(uploaded_by=self.request.user)
         return user_transactions
 
-    @authentication_classes([JWTAuthentication])
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="start",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Only transactions made at or after this time",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="end",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description="Only transactions made before this time",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="compact",
+                type=bool,
+                location=OpenApiParameter.QUERY,
+                description="Flat rows with the offer, listing and counterparty inlined",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="cursor",
+                type=str,
+                location=OpenApiParameter.QUERY,
+                description="Opaque cursor from a previous page's next/previous link",
+                required=False,
+            ),
+            OpenApiParameter(
+                name="page_size",
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description="Paginate the results with this many transactions per page",
+                required=False,
+            ),
+        ],
+        responses={200: TransactionSerializer(many=True)},
+    )
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def get(self, request: Request):
         if request.user.is_authenticated:
-            queryset = self.get_queryset()
-            serializer = self.get_serializer(queryset, many=True)
-            return JsonResponse(serializer.data, safe=False)
+            query = TransactionQuerySerializer(data=request.query_params)
+            if not query.is_valid():
+                return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            params = query.validated_data
+
+            serializer_class: type[serializers.ModelSerializer]
+            if params["compact"]:
+                queryset = self.compact_queryset.filter(user=request.user)
+                serializer_class = TransactionHistorySerializer
+            else:
+                queryset = self.get_queryset()
+                serializer_class = TransactionSerializer
+
+            if "start" in params:
+                queryset = queryset.filter(created_at__gte=params["start"])
+            if "end" in params:
+                queryset = queryset.filter(created_at__lt=params["end"])
+            queryset = queryset.order_by(
+                *[
+                    f"-{field}" if descending else field
+                    for field, descending in self.ordering
+                ]
+            )
+
+            if KeysetPaginator.is_requested(request):
+                try:
+                    transactions, next_url, previous_url = KeysetPaginator(
+                        self.ordering
+                    ).paginate(queryset, request)
+                except InvalidCursor as e:
+                    return FastJsonResponse({"error": str(e)}, status=400)
+
+                serializer = serializer_class(
+                    transactions, many=True, context=self.get_serializer_context()
+                )
+                return FastJsonResponse(
+                    {
+                        "next": next_url,
+                        "previous": previous_url,
+                        "results": serializer.data,
+                    }
+                )
+
+            serializer = serializer_class(
+                queryset, many=True, context=self.get_serializer_context()
+            )
+            return FastJsonResponse(serializer.data, safe=False)
 
         # Unauthorized permission
         return Response(
@@ -776,7 +1325,7 @@ class TransactionController(GenericAPIView):
             ),
         ],
     )
-    @authentication_classes([JWTAuthentication])
+    @authentication_classes([ClaimsJWTAuthentication])
     @permission_classes([IsAuthenticated])
     def post(self, request: Request):
         request.data["user_id"] = request.user.id
@@ -795,6 +1344,43 @@ class TransactionController(GenericAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class SummaryController(GenericAPIView):
+    """
+    Summary endpoint, [GET]
+
+    For the GET request, it returns the dashboard of the authenticated user, their
+    offers by status, what is waiting on them, what they earned and spent, their
+    rating and listings, all kept up to date as they change so it is one read
+    """
+
+    serializer_class = UserSummarySerializer
+
+    @authentication_classes([ClaimsJWTAuthentication])
+    @permission_classes([IsAuthenticated])
+    def get(self, request: Request):
+        if not request.user.is_authenticated:
+            return Response(
+                {"error": "Not logged in"},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        # The summary joined with the rating aggregate of its user
+        user = get_object_or_404(
+            User.objects.select_related("summary").only(
+                "rating_count", "rating_total", "summary"
+            ),
+            pk=request.user.pk,
+        )
+        try:
+            summary = user.summary
+        except UserSummary.DoesNotExist:
+            # Nothing counted yet
+            summary = UserSummary(user=user)
+
+        serializer = self.get_serializer(summary)
+        return Response(serializer.data)
+
+
 class DebugUserController(GenericAPIView):
     """
     Admin endpoint to debug the user endpoint
@@ -847,6 +1433,24 @@ class ResetPasswordController(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class MetricsController(APIView):
+    """
+    Metrics endpoint, [GET]
+
+    Returns the request metrics recorded by RequestMetricsMiddleware in the
+    Prometheus text format, they are kept per process so every worker is
+    scraped on its own. Only superusers and scrapers with the METRICS_TOKEN can
+    read them
+    """
+
+    authentication_classes = [MetricsTokenAuthentication, ClaimsJWTAuthentication]
+    permission_classes = [CanReadMetrics]
+
+    @extend_schema(exclude=True)
+    def get(self, request: Request):
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 class LoginController(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the middleware too
+    "backend.core.middleware.RequestMetricsMiddleware",
+    "backend.core.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -73,18 +79,130 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "backend.wsgi.application"
+# Serves the async views without a thread per request, see the README
+ASGI_APPLICATION = "backend.asgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# Defaults to SQLite, for production set DB_ENGINE=postgresql along with
+# DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT, which needs
+# pip install "psycopg[binary,pool]"
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "shopblock"),
+            "USER": os.environ.get("DB_USER", "shopblock"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "localhost"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            # Drop a persistent connection that died instead of erroring the
+            # request that picks it up
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+    if os.environ.get("DB_POOL_MAX_SIZE"):
+        # A connection pool shared by the threads of each worker process,
+        # pooled connections can't also be persistent
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+                "max_size": int(os.environ["DB_POOL_MAX_SIZE"]),
+                "timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+            }
+        }
+    else:
+        # Otherwise every thread keeps its connection for this many seconds
+        # instead of connecting again on every request
+        DATABASES["default"]["CONN_MAX_AGE"] = int(
+            os.environ.get("DB_CONN_MAX_AGE", 60)
+        )
+
+    # Read replicas of the primary, e.g. DB_REPLICA_HOSTS=replica1,replica2,
+    # GET requests are spread over them by core/routers.py
+    for i, host in enumerate(os.environ.get("DB_REPLICA_HOSTS", "").split(",")):
+        if host.strip():
+            DATABASES[f"replica{i + 1}"] = {
+                **DATABASES["default"],
+                "HOST": host.strip(),
+                # Tests run against the primary alone
+                "TEST": {"MIRROR": "default"},
+            }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
+    # SQLITE_TUNING=0 goes back to the SQLite defaults, for comparison
+    if os.environ.get("SQLITE_TUNING", "1") != "0":
+        DATABASES["default"]["OPTIONS"] = {
+            # Run on every new connection. WAL lets reads carry on during a
+            # write, NORMAL only syncs at checkpoints which is still safe in
+            # WAL mode, the database file is memory mapped up to 256MB and a
+            # locked database is waited on for up to 20s
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA mmap_size=268435456;"
+                "PRAGMA busy_timeout=20000;"
+            ),
+            # Take the write lock when the transaction starts, otherwise two
+            # transactions that read before writing fail with "database is
+            # locked" instead of waiting for each other
+            "transaction_mode": "IMMEDIATE",
+        }
+
+DATABASE_ROUTERS = ["backend.core.routers.ReplicaRouter"]
+
+# Reads go to the primary for this many seconds after a user writes, so they
+# see their own changes, it should be longer than the replica lag allowed
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
+# Replicas further behind than this many seconds are skipped
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Defaults to a per process memory cache, which is only right for a single
+# worker. With several, point this at a shared backend, otherwise a listing or
+# offer change only invalidates the cached browse responses and availability
+# of the worker that made it, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "shopblock"),
     }
 }
 
+# How long anonymous listing browse responses are cached for, in seconds
+LISTING_CACHE_TIMEOUT = int(os.environ.get("LISTING_CACHE_TIMEOUT", 60 * 5))
+
+# How long a process keeps the rows of the users it authenticated, in seconds,
+# 0 turns it off. Changes made by another worker show up after at most this long
+USER_CACHE_SECONDS = float(os.environ.get("USER_CACHE_SECONDS", 30))
+
+# Responses are encoded with orjson when it is installed, FAST_JSON=0 goes back
+# to the standard library encoder, for comparison
+FAST_JSON = os.environ.get("FAST_JSON", "1") != "0"
+
+# /metrics/ is served to superusers, and to scrapers sending this as their
+# bearer token. Unset, only superusers can read it
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Requests taking at least this many milliseconds are logged with their SQL,
+# 0 turns it off
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 1000))
+
 # Authentication
 AUTH_USER_MODEL = "core.User"
 
@@ -108,6 +226,40 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/5.1/topics/auth/passwords/
+
+# New passwords are hashed with PASSWORD_HASHER, pbkdf2, argon2 (needs
+# pip install argon2-cffi), bcrypt (needs pip install bcrypt) or scrypt. The
+# others still verify older hashes, which are rehashed on the next login
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "pbkdf2")
+_PASSWORD_HASHERS = {
+    "pbkdf2": "backend.core.hashers.PBKDF2PasswordHasher",
+    "argon2": "backend.core.hashers.Argon2PasswordHasher",
+    "bcrypt": "backend.core.hashers.BCryptSHA256PasswordHasher",
+    "scrypt": "backend.core.hashers.ScryptPasswordHasher",
+}
+if PASSWORD_HASHER not in _PASSWORD_HASHERS:
+    raise ImproperlyConfigured(
+        f"PASSWORD_HASHER must be one of {', '.join(_PASSWORD_HASHERS)}"
+    )
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher
+    for name, hasher in _PASSWORD_HASHERS.items()
+    if name != PASSWORD_HASHER
+]
+
+# The cost of each hasher, the defaults are Django's. Every login pays it
+# once, so lowering it trades resistance to offline cracking for logins/s
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", 870000))
+ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", 2))
+# In KiB
+ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", 102400))
+ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", 8))
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+SCRYPT_WORK_FACTOR = int(os.environ.get("SCRYPT_WORK_FACTOR", 2**14))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -133,8 +285,12 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     # YOUR SETTINGS
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": (
+        "backend.core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "backend.core.authentication.ClaimsJWTAuthentication",
     ),
 }
 
@@ -162,3 +318,7 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # MEDIA FILES - for user-uploaded content
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+
+# Threads resizing uploaded listing photos in the background, 0 resizes them
+# in the request instead once it commits
+IMAGE_VARIANT_WORKERS = int(os.environ.get("IMAGE_VARIANT_WORKERS", 2))
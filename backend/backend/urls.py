@@ -30,7 +30,7 @@ from rest_framework_simplejwt.views import (
 )
 
 
-from backend.core import views
+from backend.core import async_views, views
 from rest_framework import routers
 
 urlpatterns = [
@@ -41,16 +41,28 @@ urlpatterns = [
     # path("debug/listing/", views.DebugListingController.as_view()),
     # listings [GET, POST, PUT, DELETE]
     path("listing/", views.ListingController.as_view(), name="listing"),
+    # every listing as newline delimited JSON, for syncing partners [GET]
+    path("listing/export/", views.ListingExportController.as_view()),
     # user routes, [GET, POST, PUT, DELETE]
     path("user/", views.UserController.as_view()),
     # offer routes, [GET, POST, PUT]
     path("offers/", views.OfferController.as_view()),
+    # listing availability, [GET]
+    path("availability/", views.AvailabilityController.as_view()),
     # review routes, [GET, POST]
     path("reviews/", views.ReviewsController.as_view()),
     # review routes, [GET, POST]
     path("transactions/", views.TransactionController.as_view()),
+    # dashboard summary of the user route, [GET]
+    path("summary/", views.SummaryController.as_view()),
     # reset password route, [PUT]
     path("reset-password/", views.ResetPasswordController.as_view()),
+    # async variants of the busiest reads, for ASGI deployments, [GET]
+    path("async/listing/", async_views.AsyncListingController.as_view()),
+    path("async/offers/", async_views.AsyncOfferController.as_view()),
+    path("async/reviews/", async_views.AsyncReviewsController.as_view()),
+    # request metrics in the prometheus text format, [GET]
+    path("metrics/", views.MetricsController.as_view()),
     # authentication jwt tokens
     path("api/login/", views.LoginController.as_view(), name="token_obtain_pair"),
     # path("api/login/refresh/", TokenRefreshView.as_view(), name="token_refresh"),